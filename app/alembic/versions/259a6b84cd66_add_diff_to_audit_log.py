@@ -0,0 +1,28 @@
+"""add diff to audit_log
+
+Revision ID: 259a6b84cd66
+Revises: a0f60853b0be
+Create Date: 2026-10-19 09:12:44.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '259a6b84cd66'
+down_revision: Union[str, Sequence[str], None] = 'a0f60853b0be'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('audit_log', sa.Column('diff', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('audit_log', 'diff')
@@ -0,0 +1,37 @@
+"""add nl_sql_cache
+
+Revision ID: 30c774e0efab
+Revises: cb958b900d05
+Create Date: 2026-10-19 15:08:41.227309
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '30c774e0efab'
+down_revision: Union[str, Sequence[str], None] = 'cb958b900d05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('nl_sql_cache',
+    sa.Column('tenant_id', sa.String(), nullable=False),
+    sa.Column('schema_hash', sa.String(length=64), nullable=False),
+    sa.Column('question', sa.Text(), nullable=False),
+    sa.Column('sql', sa.Text(), nullable=False),
+    sa.Column('hits', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('last_used_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('tenant_id', 'schema_hash', 'question')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('nl_sql_cache')
@@ -0,0 +1,34 @@
+"""add rules insight columns
+
+Revision ID: 50ecaa01bb6c
+Revises: 9c48fb348a34
+Create Date: 2026-10-19 17:21:43.208815
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '50ecaa01bb6c'
+down_revision: Union[str, Sequence[str], None] = '9c48fb348a34'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('reconciliation_item', sa.Column('code', sa.String(), nullable=True))
+    op.add_column('reconciliation_insights', sa.Column('details', sa.JSON(), nullable=True))
+    op.add_column('reconciliation_insights', sa.Column('llm_enriched', sa.Boolean(), server_default=sa.false(), nullable=False))
+    # Rows written before the rules engine came from the LLM already
+    op.execute("UPDATE reconciliation_insights SET llm_enriched = true")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('reconciliation_insights', 'llm_enriched')
+    op.drop_column('reconciliation_insights', 'details')
+    op.drop_column('reconciliation_item', 'code')
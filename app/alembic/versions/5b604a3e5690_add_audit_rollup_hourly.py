@@ -0,0 +1,43 @@
+"""add audit_rollup_hourly
+
+Revision ID: 5b604a3e5690
+Revises: 6f56fc699d32
+Create Date: 2026-10-19 11:21:09.774530
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b604a3e5690'
+down_revision: Union[str, Sequence[str], None] = '6f56fc699d32'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('audit_rollup_hourly',
+    sa.Column('tenant_id', sa.String(), nullable=False),
+    sa.Column('bucket', sa.DateTime(), nullable=False),
+    sa.Column('entity', sa.String(), nullable=False),
+    sa.Column('action', sa.String(), nullable=False),
+    sa.Column('actor', sa.String(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('tenant_id', 'bucket', 'entity', 'action', 'actor')
+    )
+    # Backfill from existing audit rows
+    op.execute("""
+        INSERT INTO audit_rollup_hourly (tenant_id, bucket, entity, action, actor, count)
+        SELECT tenant_id, date_trunc('hour', at), entity, action, actor, count(*)
+        FROM audit_log
+        GROUP BY tenant_id, date_trunc('hour', at), entity, action, actor
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('audit_rollup_hourly')
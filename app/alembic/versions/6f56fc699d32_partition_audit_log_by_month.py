@@ -0,0 +1,102 @@
+"""partition audit_log by month
+
+Revision ID: 6f56fc699d32
+Revises: 259a6b84cd66
+Create Date: 2026-10-19 10:03:27.540118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6f56fc699d32'
+down_revision: Union[str, Sequence[str], None] = '259a6b84cd66'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = "id, tenant_id, actor, action, entity, entity_id, before, after, diff, at"
+INDEXED_COLUMNS = ["tenant_id", "actor", "action", "entity", "entity_id", "at"]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Keep the id sequence alive when the old table is dropped
+    op.execute("ALTER TABLE audit_log RENAME TO audit_log_unpartitioned")
+    op.execute("ALTER SEQUENCE audit_log_id_seq OWNED BY NONE")
+
+    # Partitioned tables need the partition key in the primary key
+    op.execute("""
+        CREATE TABLE audit_log (
+            id INTEGER NOT NULL DEFAULT nextval('audit_log_id_seq'),
+            tenant_id VARCHAR NOT NULL,
+            actor VARCHAR NOT NULL,
+            action VARCHAR NOT NULL,
+            entity VARCHAR NOT NULL,
+            entity_id INTEGER NOT NULL,
+            before TEXT,
+            after TEXT,
+            diff TEXT,
+            at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            PRIMARY KEY (id, at)
+        ) PARTITION BY RANGE (at)
+    """)
+
+    # One partition per month from the oldest existing row through a few months ahead
+    op.execute("""
+        DO $$
+        DECLARE
+            month_start DATE := date_trunc('month', COALESCE(
+                (SELECT min(at) FROM audit_log_unpartitioned), now()))::date;
+            last_month DATE := (date_trunc('month', now()) + interval '3 months')::date;
+        BEGIN
+            WHILE month_start <= last_month LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF audit_log FOR VALUES FROM (%L) TO (%L)',
+                    'audit_log_' || to_char(month_start, 'YYYY_MM'),
+                    month_start,
+                    (month_start + interval '1 month')::date
+                );
+                month_start := (month_start + interval '1 month')::date;
+            END LOOP;
+        END $$;
+    """)
+    op.execute("CREATE TABLE audit_log_default PARTITION OF audit_log DEFAULT")
+
+    op.execute(f"INSERT INTO audit_log ({COLUMNS}) SELECT {COLUMNS} FROM audit_log_unpartitioned")
+    op.execute("DROP TABLE audit_log_unpartitioned")
+    op.execute("ALTER SEQUENCE audit_log_id_seq OWNED BY audit_log.id")
+
+    for column in INDEXED_COLUMNS:
+        op.create_index(op.f(f'ix_audit_log_{column}'), 'audit_log', [column], unique=False)
+    op.create_index('ix_audit_log_tenant_id_at', 'audit_log', ['tenant_id', 'at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("ALTER TABLE audit_log RENAME TO audit_log_partitioned")
+    op.execute("ALTER SEQUENCE audit_log_id_seq OWNED BY NONE")
+    for column in INDEXED_COLUMNS:
+        op.execute(f"DROP INDEX IF EXISTS ix_audit_log_{column}")
+    op.execute("DROP INDEX IF EXISTS ix_audit_log_tenant_id_at")
+
+    op.create_table('audit_log',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('audit_log_id_seq')"), nullable=False),
+    sa.Column('tenant_id', sa.String(), nullable=False),
+    sa.Column('actor', sa.String(), nullable=False),
+    sa.Column('action', sa.String(), nullable=False),
+    sa.Column('entity', sa.String(), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('before', sa.Text(), nullable=True),
+    sa.Column('after', sa.Text(), nullable=True),
+    sa.Column('diff', sa.Text(), nullable=True),
+    sa.Column('at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute(f"INSERT INTO audit_log ({COLUMNS}) SELECT {COLUMNS} FROM audit_log_partitioned")
+    op.execute("DROP TABLE audit_log_partitioned CASCADE")
+    op.execute("ALTER SEQUENCE audit_log_id_seq OWNED BY audit_log.id")
+    for column in INDEXED_COLUMNS:
+        op.create_index(op.f(f'ix_audit_log_{column}'), 'audit_log', [column], unique=False)
@@ -0,0 +1,90 @@
+"""version remaining tenant tables
+
+Revision ID: 7a3e1c9d4b52
+Revises: 5b8b604d02fa
+Create Date: 2026-10-19 20:41:37.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a3e1c9d4b52'
+down_revision: Union[str, Sequence[str], None] = '5b8b604d02fa'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Tenant-scoped tables added after cb958b900d05 or missed by it. The audit tables
+# are left out on purpose: nearly every request writes them, and the MCP server
+# never caches queries that read them.
+TENANT_TABLES = [
+    'ach_transfer', 'reconciliation_insights', 'reconciliation_run_metrics',
+    'reconciliation_run_breakdown', 'deduction_code_mapping',
+]
+
+# Tables without a tenant_id column, versioned through their run's tenant
+RUN_TABLES = ['reconciliation_item']
+
+
+def _create_triggers(table: str, function: str) -> None:
+    op.execute(f"""
+        CREATE TRIGGER {table}_data_version_ins AFTER INSERT ON {table}
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION {function}()
+    """)
+    op.execute(f"""
+        CREATE TRIGGER {table}_data_version_upd AFTER UPDATE ON {table}
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION {function}()
+    """)
+    op.execute(f"""
+        CREATE TRIGGER {table}_data_version_del AFTER DELETE ON {table}
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION {function}()
+    """)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("""
+        CREATE FUNCTION bump_tenant_data_version_by_run() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO tenant_data_version (tenant_id, version, updated_at)
+                SELECT DISTINCT r.tenant_id, 1, now() AT TIME ZONE 'utc'
+                FROM new_rows n JOIN reconciliation_run r ON r.id = n.run_id
+                ON CONFLICT (tenant_id) DO UPDATE
+                SET version = tenant_data_version.version + 1, updated_at = EXCLUDED.updated_at;
+            ELSIF TG_OP = 'UPDATE' THEN
+                INSERT INTO tenant_data_version (tenant_id, version, updated_at)
+                SELECT DISTINCT r.tenant_id, 1, now() AT TIME ZONE 'utc'
+                FROM (SELECT run_id FROM new_rows UNION SELECT run_id FROM old_rows) t
+                JOIN reconciliation_run r ON r.id = t.run_id
+                ON CONFLICT (tenant_id) DO UPDATE
+                SET version = tenant_data_version.version + 1, updated_at = EXCLUDED.updated_at;
+            ELSE
+                -- Rows deleted along with their run are covered by the run's own trigger
+                INSERT INTO tenant_data_version (tenant_id, version, updated_at)
+                SELECT DISTINCT r.tenant_id, 1, now() AT TIME ZONE 'utc'
+                FROM old_rows o JOIN reconciliation_run r ON r.id = o.run_id
+                ON CONFLICT (tenant_id) DO UPDATE
+                SET version = tenant_data_version.version + 1, updated_at = EXCLUDED.updated_at;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    for table in TENANT_TABLES:
+        _create_triggers(table, 'bump_tenant_data_version')
+    for table in RUN_TABLES:
+        _create_triggers(table, 'bump_tenant_data_version_by_run')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in TENANT_TABLES + RUN_TABLES:
+        for suffix in ('ins', 'upd', 'del'):
+            op.execute(f"DROP TRIGGER IF EXISTS {table}_data_version_{suffix} ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS bump_tenant_data_version_by_run()")
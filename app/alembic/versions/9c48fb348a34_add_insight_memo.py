@@ -0,0 +1,38 @@
+"""add insight_memo
+
+Revision ID: 9c48fb348a34
+Revises: 30c774e0efab
+Create Date: 2026-10-19 16:02:17.514620
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c48fb348a34'
+down_revision: Union[str, Sequence[str], None] = '30c774e0efab'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('insight_memo',
+    sa.Column('fingerprint', sa.String(length=64), nullable=False),
+    sa.Column('model', sa.String(), nullable=False),
+    sa.Column('insights', sa.JSON(), nullable=False),
+    sa.Column('hits', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('last_used_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('fingerprint')
+    )
+    op.create_index(op.f('ix_insight_memo_last_used_at'), 'insight_memo', ['last_used_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_insight_memo_last_used_at'), table_name='insight_memo')
+    op.drop_table('insight_memo')
@@ -0,0 +1,64 @@
+"""add reconciliation run metrics
+
+Revision ID: be299ca26407
+Revises: 50ecaa01bb6c
+Create Date: 2026-10-19 18:04:55.731902
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'be299ca26407'
+down_revision: Union[str, Sequence[str], None] = '50ecaa01bb6c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('reconciliation_run_metrics',
+    sa.Column('run_id', sa.Integer(), nullable=False),
+    sa.Column('tenant_id', sa.String(), nullable=False),
+    sa.Column('payroll_batch_id', sa.Integer(), nullable=False),
+    sa.Column('period_end', sa.Date(), nullable=False),
+    sa.Column('items', sa.Integer(), nullable=False),
+    sa.Column('issue_items', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.Column('impact', sa.Float(), nullable=False),
+    sa.Column('employees', sa.Integer(), nullable=False),
+    sa.Column('affected_employees', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['payroll_batch_id'], ['payroll_batch.id'], ),
+    sa.ForeignKeyConstraint(['run_id'], ['reconciliation_run.id'], ),
+    sa.PrimaryKeyConstraint('run_id')
+    )
+    op.create_index(op.f('ix_reconciliation_run_metrics_payroll_batch_id'), 'reconciliation_run_metrics', ['payroll_batch_id'], unique=False)
+    op.create_index(op.f('ix_reconciliation_run_metrics_period_end'), 'reconciliation_run_metrics', ['period_end'], unique=False)
+    op.create_index(op.f('ix_reconciliation_run_metrics_tenant_id'), 'reconciliation_run_metrics', ['tenant_id'], unique=False)
+    op.create_table('reconciliation_run_breakdown',
+    sa.Column('run_id', sa.Integer(), nullable=False),
+    sa.Column('issue_type', sa.String(), nullable=False),
+    sa.Column('plan_type', sa.String(), nullable=False),
+    sa.Column('tenant_id', sa.String(), nullable=False),
+    sa.Column('items', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.Column('impact', sa.Float(), nullable=False),
+    sa.Column('employees', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['run_id'], ['reconciliation_run.id'], ),
+    sa.PrimaryKeyConstraint('run_id', 'issue_type', 'plan_type')
+    )
+    op.create_index(op.f('ix_reconciliation_run_breakdown_tenant_id'), 'reconciliation_run_breakdown', ['tenant_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_reconciliation_run_breakdown_tenant_id'), table_name='reconciliation_run_breakdown')
+    op.drop_table('reconciliation_run_breakdown')
+    op.drop_index(op.f('ix_reconciliation_run_metrics_tenant_id'), table_name='reconciliation_run_metrics')
+    op.drop_index(op.f('ix_reconciliation_run_metrics_period_end'), table_name='reconciliation_run_metrics')
+    op.drop_index(op.f('ix_reconciliation_run_metrics_payroll_batch_id'), table_name='reconciliation_run_metrics')
+    op.drop_table('reconciliation_run_metrics')
@@ -0,0 +1,81 @@
+"""add tenant_data_version
+
+Revision ID: cb958b900d05
+Revises: e0bd5215bc75
+Create Date: 2026-10-19 14:36:12.504871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'cb958b900d05'
+down_revision: Union[str, Sequence[str], None] = 'e0bd5215bc75'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Tenant-scoped tables whose changes invalidate cached query results
+VERSIONED_TABLES = ['reconciliation_run', 'payroll_batch', 'pay_item', 'enrollment', 'employee', 'plan', 'dependent']
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('tenant_data_version',
+    sa.Column('tenant_id', sa.String(), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('tenant_id')
+    )
+    # Statement-level triggers: one bump per tenant per statement, however many rows it touches
+    op.execute("""
+        CREATE FUNCTION bump_tenant_data_version() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO tenant_data_version (tenant_id, version, updated_at)
+                SELECT DISTINCT tenant_id, 1, now() AT TIME ZONE 'utc' FROM new_rows
+                ON CONFLICT (tenant_id) DO UPDATE
+                SET version = tenant_data_version.version + 1, updated_at = EXCLUDED.updated_at;
+            ELSIF TG_OP = 'UPDATE' THEN
+                INSERT INTO tenant_data_version (tenant_id, version, updated_at)
+                SELECT tenant_id, 1, now() AT TIME ZONE 'utc'
+                FROM (SELECT tenant_id FROM new_rows UNION SELECT tenant_id FROM old_rows) t
+                ON CONFLICT (tenant_id) DO UPDATE
+                SET version = tenant_data_version.version + 1, updated_at = EXCLUDED.updated_at;
+            ELSE
+                INSERT INTO tenant_data_version (tenant_id, version, updated_at)
+                SELECT DISTINCT tenant_id, 1, now() AT TIME ZONE 'utc' FROM old_rows
+                ON CONFLICT (tenant_id) DO UPDATE
+                SET version = tenant_data_version.version + 1, updated_at = EXCLUDED.updated_at;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    for table in VERSIONED_TABLES:
+        op.execute(f"""
+            CREATE TRIGGER {table}_data_version_ins AFTER INSERT ON {table}
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_tenant_data_version()
+        """)
+        op.execute(f"""
+            CREATE TRIGGER {table}_data_version_upd AFTER UPDATE ON {table}
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_tenant_data_version()
+        """)
+        op.execute(f"""
+            CREATE TRIGGER {table}_data_version_del AFTER DELETE ON {table}
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_tenant_data_version()
+        """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in VERSIONED_TABLES:
+        for suffix in ('ins', 'upd', 'del'):
+            op.execute(f"DROP TRIGGER IF EXISTS {table}_data_version_{suffix} ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS bump_tenant_data_version()")
+    op.drop_table('tenant_data_version')
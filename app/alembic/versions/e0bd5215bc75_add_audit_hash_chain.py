@@ -0,0 +1,51 @@
+"""add audit hash chain
+
+Revision ID: e0bd5215bc75
+Revises: 5b604a3e5690
+Create Date: 2026-10-19 13:02:47.318265
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e0bd5215bc75'
+down_revision: Union[str, Sequence[str], None] = '5b604a3e5690'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing rows stay unchained; each tenant's chain starts at its next entry
+    op.add_column('audit_log', sa.Column('prev_hash', sa.String(length=64), nullable=True))
+    op.add_column('audit_log', sa.Column('hash', sa.String(length=64), nullable=True))
+    op.create_table('audit_chain_head',
+    sa.Column('tenant_id', sa.String(), nullable=False),
+    sa.Column('audit_id', sa.Integer(), nullable=False),
+    sa.Column('hash', sa.String(length=64), nullable=False),
+    sa.PrimaryKeyConstraint('tenant_id')
+    )
+    op.create_table('audit_checkpoint',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('tenant_id', sa.String(), nullable=False),
+    sa.Column('audit_id', sa.Integer(), nullable=False),
+    sa.Column('hash', sa.String(length=64), nullable=False),
+    sa.Column('entry_count', sa.Integer(), nullable=False),
+    sa.Column('signature', sa.String(length=64), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_audit_checkpoint_tenant_id'), 'audit_checkpoint', ['tenant_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_audit_checkpoint_tenant_id'), table_name='audit_checkpoint')
+    op.drop_table('audit_checkpoint')
+    op.drop_table('audit_chain_head')
+    op.drop_column('audit_log', 'hash')
+    op.drop_column('audit_log', 'prev_hash')
@@ -25,10 +25,61 @@ class Settings:
     # EXTERNAL_API_KEY: str = os.getenv("EXTERNAL_API_KEY", "")
     
     # LLM Configuration
-    LLM_PROVIDER: str = os.getenv("LLM_PROVIDER", "openai")
+    LLM_PROVIDER: str = os.getenv("LLM_PROVIDER", "openai")  # openai | local
     LLM_MODEL: str = os.getenv("LLM_MODEL", "gpt-4o-mini")
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
-    
+    LLM_TIMEOUT_S: float = float(os.getenv("LLM_TIMEOUT_S", "30"))
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))  # per API process
+    LLM_MAX_CONNECTIONS: int = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+    LLM_LOCAL_LATENCY_MS: float = float(os.getenv("LLM_LOCAL_LATENCY_MS", "200"))  # before the first token
+    LLM_LOCAL_TOKENS_PER_S: float = float(os.getenv("LLM_LOCAL_TOKENS_PER_S", "50"))  # 0 = whole reply at once
+    LLM_LOCAL_RESPONSES: str = os.getenv("LLM_LOCAL_RESPONSES", "")  # JSON file of {"match", "response"} rules
+    INSIGHTS_LLM_ENRICHMENT: bool = os.getenv("INSIGHTS_LLM_ENRICHMENT", "true").lower() == "true"  # rewrite rules-based suggestions with the LLM
+    INSIGHTS_BASELINE_RUNS: int = int(os.getenv("INSIGHTS_BASELINE_RUNS", "10"))  # previous runs a run is compared with
+    INSIGHTS_CONCURRENCY: int = int(os.getenv("INSIGHTS_CONCURRENCY", "2"))  # insight jobs generated at once per API process
+    INSIGHT_MEMO_TTL_S: float = float(os.getenv("INSIGHT_MEMO_TTL_S", str(30 * 24 * 3600)))  # 0 = never expire
+    INSIGHT_MEMO_MAX_ENTRIES: int = int(os.getenv("INSIGHT_MEMO_MAX_ENTRIES", "10000"))
+    SCHEMA_CATALOG_CHECK_S: float = float(os.getenv("SCHEMA_CATALOG_CHECK_S", "30"))  # how often to look for a new migration
+    NL_SQL_SIMILARITY_THRESHOLD: float = float(os.getenv("NL_SQL_SIMILARITY_THRESHOLD", "0"))  # 0 = exact question matches only
+
+    # Reconciliation
+    ANOMALY_DETECTION: bool = os.getenv("ANOMALY_DETECTION", "true").lower() == "true"  # flag amounts far off an employee's history
+    ANOMALY_Z_THRESHOLD: float = float(os.getenv("ANOMALY_Z_THRESHOLD", "3.5"))  # robust z-score
+    ANOMALY_HISTORY_DAYS: int = int(os.getenv("ANOMALY_HISTORY_DAYS", "180"))
+    ANOMALY_MIN_HISTORY: int = int(os.getenv("ANOMALY_MIN_HISTORY", "3"))  # past pay items needed per employee and code
+    ANOMALY_MIN_SCALE_PCT: float = float(os.getenv("ANOMALY_MIN_SCALE_PCT", "0.05"))  # MAD floor as a share of the median
+    EMPLOYEE_AUTO_LINK: bool = os.getenv("EMPLOYEE_AUTO_LINK", "false").lower() == "true"  # link unresolved ids to confident fuzzy matches
+    EMPLOYEE_AUTO_LINK_THRESHOLD: float = float(os.getenv("EMPLOYEE_AUTO_LINK_THRESHOLD", "0.9"))
+
+    # MCP Server
+    MCP_TRANSPORT: str = os.getenv("MCP_TRANSPORT", "pool")  # pool | socket | inprocess
+    MCP_SOCKET: str = os.getenv("MCP_SOCKET", "")  # unix:/path/to.sock or tcp:host:port
+    MCP_AUTH_TOKEN: str = os.getenv("MCP_AUTH_TOKEN", "")  # must match the shared server's MCP_AUTH_TOKEN
+    MCP_POOL_SIZE: int = int(os.getenv("MCP_POOL_SIZE", "2"))
+    MCP_CALL_TIMEOUT_S: float = float(os.getenv("MCP_CALL_TIMEOUT_S", "45"))
+    MCP_HEALTH_INTERVAL_S: float = float(os.getenv("MCP_HEALTH_INTERVAL_S", "30"))  # 0 disables
+    MCP_HEALTH_MAX_FAILURES: int = int(os.getenv("MCP_HEALTH_MAX_FAILURES", "3"))  # consecutive failed pings before a busy worker is restarted
+
+    # Audit Logging
+    AUDIT_WRITE_MODE: str = os.getenv("AUDIT_WRITE_MODE", "buffered")  # buffered | sync
+    AUDIT_DURABILITY: str = os.getenv("AUDIT_DURABILITY", "memory")  # memory | spool
+    AUDIT_ORDERING: str = os.getenv("AUDIT_ORDERING", "strict")  # strict | relaxed
+    AUDIT_FLUSH_BATCH_SIZE: int = int(os.getenv("AUDIT_FLUSH_BATCH_SIZE", "200"))
+    AUDIT_FLUSH_INTERVAL_MS: int = int(os.getenv("AUDIT_FLUSH_INTERVAL_MS", "500"))
+    AUDIT_MAX_QUEUE: int = int(os.getenv("AUDIT_MAX_QUEUE", "10000"))
+    AUDIT_SPOOL_DIR: str = os.getenv("AUDIT_SPOOL_DIR", "runtime/audit_spool")
+    AUDIT_SPOOL_FSYNC: bool = os.getenv("AUDIT_SPOOL_FSYNC", "true").lower() == "true"
+    AUDIT_HOT_MONTHS: int = int(os.getenv("AUDIT_HOT_MONTHS", "6"))  # monthly partitions kept attached
+    AUDIT_PARTITIONS_AHEAD: int = int(os.getenv("AUDIT_PARTITIONS_AHEAD", "3"))
+    AUDIT_ARCHIVE_DIR: str = os.getenv("AUDIT_ARCHIVE_DIR", "runtime/audit_archive")
+    AUDIT_ARCHIVE_FORMAT: str = os.getenv("AUDIT_ARCHIVE_FORMAT", "ndjson")  # ndjson | parquet
+    AUDIT_ROLLUP_MODE: str = os.getenv("AUDIT_ROLLUP_MODE", "incremental")  # incremental | compactor
+    AUDIT_ROLLUP_COMPACT_INTERVAL_S: int = int(os.getenv("AUDIT_ROLLUP_COMPACT_INTERVAL_S", "300"))
+    AUDIT_ROLLUP_LATE_WINDOW_S: int = int(os.getenv("AUDIT_ROLLUP_LATE_WINDOW_S", "21600"))  # hours behind the watermark recomputed each pass
+    AUDIT_CHECKPOINT_KEY: str = os.getenv("AUDIT_CHECKPOINT_KEY", "")  # required for checkpoints
+    AUDIT_CHECKPOINT_INTERVAL_S: int = int(os.getenv("AUDIT_CHECKPOINT_INTERVAL_S", "3600"))  # 0 disables
+    AUDIT_STREAM_BACKEND: str = os.getenv("AUDIT_STREAM_BACKEND", "local")  # local | postgres
+
     @classmethod
     def validate(cls) -> None:
         """Validate that required environment variables are set"""
@@ -3,9 +3,59 @@ import functools
 import inspect
 from typing import Optional, Any, Dict
 from fastapi import Request, Depends
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from db import get_db
-from models import AuditLog
+from db import SessionLocal
+from services.audit_writer import audit_writer
+from services.audit_state import install_state_capture, track_entity, pop_entity_state, json_diff
+
+# Capture before/after column values of audited entities as they are flushed
+install_state_capture(SessionLocal)
+
+def _extract_context(args, kwargs):
+    """Pull the session and tenant out of the endpoint arguments"""
+    db = None
+    tenant_id = None
+    for arg in args:
+        if isinstance(arg, Session):
+            db = arg
+    if 'db' in kwargs:
+        db = kwargs['db']
+    if 'tenant_id' in kwargs:
+        tenant_id = kwargs['tenant_id']
+    if 'x_tenant_id' in kwargs:
+        tenant_id = kwargs['x_tenant_id']
+    return db, tenant_id
+
+def _extract_entity_id(result) -> Optional[int]:
+    if isinstance(result, dict):
+        # Try common entity_id fields
+        for field in ['id', 'batch_id', 'run_id', 'transfer_id']:
+            if field in result:
+                return result[field]
+    return None
+
+def _record(action: str, entity: str, db: Optional[Session], tenant_id: Optional[str], actor: str, result) -> None:
+    entity_id = _extract_entity_id(result)
+    if not (tenant_id and entity_id):
+        return
+    
+    # State comes from the session's flush history, so no extra queries are issued.
+    # Only the compact diff is stored; full versions are rebuilt by replaying diffs.
+    before, after = pop_entity_state(db, entity, entity_id) if db is not None else (None, None)
+    diff = json_diff(before or {}, after) if (before or after) else []
+    
+    entry = {
+        "tenant_id": tenant_id,
+        "actor": actor,
+        "action": action,
+        "entity": entity,
+        "entity_id": entity_id,
+        "before": None,
+        "after": None,
+        "diff": json.dumps(diff) if diff else None,
+    }
+    audit_writer.enqueue(entry)
 
 def audit_log(
     action: str,
@@ -24,100 +74,33 @@ def audit_log(
         get_before_state: Function name to get before state
         get_after_state: Function name to get after state
     """
+    track_entity(entity)
+    
     def decorator(func):
         @functools.wraps(func)
         async def async_wrapper(*args, **kwargs):
-            # Get dependencies
-            db = None
-            tenant_id = None
+            db, tenant_id = _extract_context(args, kwargs)
             actor = "demo-user"  # Default actor
             
-            # Extract dependencies from function signature
-            for arg in args:
-                if isinstance(arg, Session):
-                    db = arg
-            
-            # Extract from kwargs
-            if 'db' in kwargs:
-                db = kwargs['db']
-            if 'tenant_id' in kwargs:
-                tenant_id = kwargs['tenant_id']
-            if 'x_tenant_id' in kwargs:
-                tenant_id = kwargs['x_tenant_id']
-            
             # Execute the original function
             result = await func(*args, **kwargs)
             
-            # Extract entity_id from result
-            entity_id = None
-            if isinstance(result, dict):
-                # Try common entity_id fields
-                for field in ['id', 'batch_id', 'run_id', 'transfer_id']:
-                    if field in result:
-                        entity_id = result[field]
-                        break
-            
-            # Create audit log entry
-            if db and tenant_id and entity_id:
-                audit_entry = AuditLog(
-                    tenant_id=tenant_id,
-                    actor=actor,
-                    action=action,
-                    entity=entity,
-                    entity_id=entity_id,
-                    before=None,
-                    after=None
-                )
-                db.add(audit_entry)
-                db.commit()
+            # Enqueueing can wait for buffer space (strict ordering) or write directly
+            # when the writer is not running, so keep it off the event loop
+            await run_in_threadpool(_record, action, entity, db, tenant_id, actor, result)
             
             return result
         
         @functools.wraps(func)
         def sync_wrapper(*args, **kwargs):
-            # Get dependencies
-            db = None
-            tenant_id = None
+            db, tenant_id = _extract_context(args, kwargs)
             actor = "demo-user"  # Default actor
             
-            # Extract dependencies from function signature
-            for arg in args:
-                if isinstance(arg, Session):
-                    db = arg
-            
-            # Extract from kwargs
-            if 'db' in kwargs:
-                db = kwargs['db']
-            if 'tenant_id' in kwargs:
-                tenant_id = kwargs['tenant_id']
-            if 'x_tenant_id' in kwargs:
-                tenant_id = kwargs['x_tenant_id']
-            
             # Execute the original function
             result = func(*args, **kwargs)
             
-            # Extract entity_id from result
-            entity_id = None
-            if isinstance(result, dict):
-                # Try common entity_id fields
-                for field in ['id', 'batch_id', 'run_id', 'transfer_id']:
-                    if field in result:
-                        entity_id = result[field]
-                        break
-            
-            # Create audit log entry
-            if db and tenant_id and entity_id:
-                audit_entry = AuditLog(
-                    tenant_id=tenant_id,
-                    actor=actor,
-                    action=action,
-                    entity=entity,
-                    entity_id=entity_id,
-                    before=None,
-                    after=None
-                )
-                db.add(audit_entry)
-                db.commit()
+            # Hand the entry to the audit writer; it is persisted off the request path
+            _record(action, entity, db, tenant_id, actor, result)
             
             return result
         
@@ -1,11 +1,46 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from routers import payroll, reconcile, audit, mcp
+from routers import payroll, reconcile, audit, mcp, metrics, analytics
 from dependencies import get_tenant_id
 from config import settings
+from db import SessionLocal
+from services.audit_writer import audit_writer
+from services.audit_rollup import RollupCompactor
+from services.audit_chain import Checkpointer
+from services.insight_worker import insight_worker
+from services.llm import llm_client
+from services.mcp_client import mcp_client
+from services.audit_stream import audit_broadcaster
 
-app = FastAPI(title="PayFast API")
+rollup_compactor = RollupCompactor(SessionLocal)
+audit_checkpointer = Checkpointer(SessionLocal)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    audit_broadcaster.attach(asyncio.get_running_loop())
+    insight_worker.attach(asyncio.get_running_loop())
+    if settings.AUDIT_STREAM_BACKEND == "postgres":
+        audit_broadcaster.start_listener()
+    else:
+        audit_writer.add_listener(audit_broadcaster.publish)
+    audit_writer.start()
+    rollup_compactor.start()
+    audit_checkpointer.start()
+    mcp_client.start()
+    yield
+    await insight_worker.stop()
+    await llm_client.aclose()
+    mcp_client.stop()
+    audit_checkpointer.stop()
+    rollup_compactor.stop()
+    audit_broadcaster.stop_listener()
+    # Drain buffered audit entries before the worker exits
+    audit_writer.stop()
+
+app = FastAPI(title="PayFast API", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -24,6 +59,8 @@ app.include_router(payroll.router)
 app.include_router(reconcile.router)
 app.include_router(audit.router)
 app.include_router(mcp.router)
+app.include_router(metrics.router)
+app.include_router(analytics.router)
 
 # --- DTOs (replace with real models/services later) ---
 class PayrollRow(BaseModel):
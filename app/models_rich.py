@@ -1,5 +1,5 @@
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import String, Float, ForeignKey, Date, Integer, DateTime, Text, Boolean, JSON
+from sqlalchemy import String, Float, ForeignKey, Date, Integer, BigInteger, DateTime, Text, Boolean, JSON
 from typing import Optional, List
 from datetime import date, datetime
 
@@ -68,6 +68,19 @@ class Plan(Base):
     # Relationships - commented out for now
     # enrollments: Mapped[List["Enrollment"]] = relationship(back_populates="plan")
 
+class DeductionCodeMapping(Base):
+    """Tenant mapping of payroll deduction codes to plan types (and optionally a plan)"""
+    __tablename__ = "deduction_code_mapping"
+    
+    tenant_id: Mapped[str] = mapped_column(String, primary_key=True)
+    code: Mapped[str] = mapped_column(String, primary_key=True)  # MED_PRETAX, MEDFLEX_FSA, etc.
+    plan_type: Mapped[str] = mapped_column(String, nullable=False)  # medical, dental, vision, etc.
+    plan_id: Mapped[Optional[int]] = mapped_column(ForeignKey("plan.id"), nullable=True)
+    source: Mapped[str] = mapped_column(String, nullable=False, default="manual")  # manual, suggested
+    created_by: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
 class Enrollment(Base):
     """Employee enrollments in benefit plans with effective dates"""
     __tablename__ = "enrollment"
@@ -162,16 +175,46 @@ class ReconciliationItem(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     run_id: Mapped[int] = mapped_column(ForeignKey("reconciliation_run.id"), nullable=False, index=True)
     employee_ext_id: Mapped[str] = mapped_column(String, nullable=False, index=True)
-    issue_type: Mapped[str] = mapped_column(String, nullable=False, index=True)  # ok, mismatch_pct, missing_coverage, extra_deduction
+    issue_type: Mapped[str] = mapped_column(String, nullable=False, index=True)  # ok, mismatch_pct, missing_coverage, extra_deduction, amount_anomaly
     expected_pct: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
     actual_pct: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
     amount: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    code: Mapped[Optional[str]] = mapped_column(String, nullable=True)  # Deduction code of the pay item
     details: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # Additional details about the issue
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
     
     # Relationships - commented out for now
     # reconciliation_run: Mapped["ReconciliationRun"] = relationship(back_populates="reconciliation_items")
 
+class ReconciliationRunMetrics(Base):
+    """Per-run totals, written when a run completes; the source of cross-run trends"""
+    __tablename__ = "reconciliation_run_metrics"
+    
+    run_id: Mapped[int] = mapped_column(ForeignKey("reconciliation_run.id"), primary_key=True)
+    tenant_id: Mapped[str] = mapped_column(String, nullable=False, index=True)
+    payroll_batch_id: Mapped[int] = mapped_column(ForeignKey("payroll_batch.id"), nullable=False, index=True)
+    period_end: Mapped[date] = mapped_column(Date, nullable=False, index=True)  # payroll period of the batch
+    items: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    issue_items: Mapped[int] = mapped_column(Integer, nullable=False, default=0)  # items other than ok
+    amount: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)  # sum of all item amounts
+    impact: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)  # sum of absolute amounts of issue items
+    employees: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    affected_employees: Mapped[int] = mapped_column(Integer, nullable=False, default=0)  # employees with at least one issue
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
+class ReconciliationRunBreakdown(Base):
+    """Per-run counts and amounts by issue type and plan type"""
+    __tablename__ = "reconciliation_run_breakdown"
+    
+    run_id: Mapped[int] = mapped_column(ForeignKey("reconciliation_run.id"), primary_key=True)
+    issue_type: Mapped[str] = mapped_column(String, primary_key=True)
+    plan_type: Mapped[str] = mapped_column(String, primary_key=True)  # "unknown" when the code maps to no plan type
+    tenant_id: Mapped[str] = mapped_column(String, nullable=False, index=True)
+    items: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    amount: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    impact: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)  # sum of absolute amounts
+    employees: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
 class AchTransfer(Base):
     """ACH transfer records for approved reconciliations"""
     __tablename__ = "ach_transfer"
@@ -200,10 +243,12 @@ class ReconciliationInsights(Base):
     total_impact: Mapped[Optional[float]] = mapped_column(Float, nullable=True)  # Total dollar impact
     affected_employees: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)  # Number of unique employees affected
     
-    # LLM-generated insights
-    suggested_fixes: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # LLM suggestions for batch fixes
+    # Rules-based insights, with suggestions rewritten by the LLM once enriched
+    suggested_fixes: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # Suggestions for batch fixes
     priority_actions: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # High-priority actions to take
     risk_assessment: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # Risk level and assessment
+    details: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)  # Impact ranking, top codes/employees, baseline
+    llm_enriched: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
     
     # Metadata
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
@@ -228,7 +273,72 @@ class AuditLog(Base):
     entity_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
     before: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # JSON string of previous state
     after: Mapped[Optional[str]] = mapped_column(Text, nullable=True)   # JSON string of new state
+    diff: Mapped[Optional[str]] = mapped_column(Text, nullable=True)    # JSON Patch from the previous version
     at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    prev_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)  # hash of the tenant's previous entry
+    hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)       # sha256(prev_hash + entry)
+
+class AuditChainHead(Base):
+    """Latest entry of each tenant's audit hash chain"""
+    __tablename__ = "audit_chain_head"
+    
+    tenant_id: Mapped[str] = mapped_column(String, primary_key=True)
+    audit_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    hash: Mapped[str] = mapped_column(String(64), nullable=False)
+
+class AuditCheckpoint(Base):
+    """Signed, verified point in a tenant's audit hash chain"""
+    __tablename__ = "audit_checkpoint"
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    tenant_id: Mapped[str] = mapped_column(String, nullable=False, index=True)
+    audit_id: Mapped[int] = mapped_column(Integer, nullable=False)  # last entry covered
+    hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    entry_count: Mapped[int] = mapped_column(Integer, nullable=False)  # entries verified since the previous checkpoint
+    signature: Mapped[str] = mapped_column(String(64), nullable=False)  # HMAC-SHA256 of tenant, audit_id and hash
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
+class AuditRollupHourly(Base):
+    """Hourly audit counts per tenant, entity, action and actor"""
+    __tablename__ = "audit_rollup_hourly"
+    
+    tenant_id: Mapped[str] = mapped_column(String, primary_key=True)
+    bucket: Mapped[datetime] = mapped_column(DateTime, primary_key=True)  # start of the hour
+    entity: Mapped[str] = mapped_column(String, primary_key=True)
+    action: Mapped[str] = mapped_column(String, primary_key=True)
+    actor: Mapped[str] = mapped_column(String, primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+class TenantDataVersion(Base):
+    """Per-tenant counter bumped by triggers when reconciliation inputs or runs change; used to key result caches"""
+    __tablename__ = "tenant_data_version"
+    
+    tenant_id: Mapped[str] = mapped_column(String, primary_key=True)
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
+class NlSqlCache(Base):
+    """LLM-generated SQL for previously answered questions"""
+    __tablename__ = "nl_sql_cache"
+    
+    tenant_id: Mapped[str] = mapped_column(String, primary_key=True)
+    schema_hash: Mapped[str] = mapped_column(String(64), primary_key=True)  # version hash of the schema catalog
+    question: Mapped[str] = mapped_column(Text, primary_key=True)  # normalized question text
+    sql: Mapped[str] = mapped_column(Text, nullable=False)
+    hits: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    last_used_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
+class InsightMemo(Base):
+    """LLM insights memoized by a fingerprint of the prompt and model"""
+    __tablename__ = "insight_memo"
+    
+    fingerprint: Mapped[str] = mapped_column(String(64), primary_key=True)  # sha256 of model + prompt
+    model: Mapped[str] = mapped_column(String, nullable=False)
+    insights: Mapped[dict] = mapped_column(JSON, nullable=False)  # suggested_fixes, priority_actions, risk_assessment
+    hits: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    last_used_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False, index=True)
 
 class EventLog(Base):
     """System events with JSON payload for extensibility"""
@@ -0,0 +1,28 @@
+# app/routers/analytics.py
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Header, Query
+from sqlalchemy.orm import Session
+from db import get_db
+from services.run_metrics import tenant_trends
+
+router = APIRouter(prefix="/api/tenants/{tenant_id}/analytics", tags=["analytics"])
+
+@router.get("/trends")
+def get_trends(
+    tenant_id: str,
+    runs: int = Query(52, ge=1, le=260, description="Number of most recent payrolls"),
+    window: int = Query(4, ge=1, le=52, description="Payrolls in the moving average"),
+    plan_type: Optional[str] = Query(None, description="Only this plan type, e.g. medical"),
+    x_tenant_id: str = Header(alias="X-Tenant-ID"),
+    db: Session = Depends(get_db),
+):
+    """
+    Reconciliation metrics per payroll with moving averages and changes from
+    the previous payroll: issue rate, dollar impact, affected employees, and
+    counts, rates and dollars per issue type.
+    """
+    if tenant_id != x_tenant_id:
+        raise HTTPException(400, "Tenant mismatch")
+    
+    # Read from the per-run rollups, so cost does not grow with item volume
+    return tenant_trends(db, tenant_id, runs=runs, window=window, plan_type=plan_type)
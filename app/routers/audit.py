@@ -1,13 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, Header, Query
+import asyncio
+import json
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 from typing import List, Optional
 from datetime import datetime, timedelta
-from db import get_db
-from models import AuditLog
+from db import SessionLocal, get_db
+from models_rich import AuditLog
+from services.audit_state import get_entity_versions
+from services.audit_archive import archive_boundary, read_archived
+from services.audit_rollup import summarize_audit
+from services.audit_stream import audit_broadcaster, stream_event
+from services.audit_chain import verify_chain
 
 router = APIRouter(prefix="/api/tenants/{tenant_id}/audit", tags=["audit"])
 
+# Entries read per query when a reconnecting stream catches up from the table
+STREAM_BACKLOG_PAGE = 500
+
 @router.get("/logs")
 def get_audit_logs(
     tenant_id: str,
@@ -15,6 +26,8 @@ def get_audit_logs(
     entity_id: Optional[int] = Query(None, description="Filter by entity ID"),
     action: Optional[str] = Query(None, description="Filter by action"),
     actor: Optional[str] = Query(None, description="Filter by actor"),
+    start: Optional[datetime] = Query(None, description="Only entries at or after this time"),
+    end: Optional[datetime] = Query(None, description="Only entries at or before this time"),
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=100),
     x_tenant_id: str = Header(alias="X-Tenant-ID"),
@@ -35,12 +48,16 @@ def get_audit_logs(
         query = query.filter(AuditLog.action == action)
     if actor:
         query = query.filter(AuditLog.actor == actor)
+    if start:
+        query = query.filter(AuditLog.at >= start)
+    if end:
+        query = query.filter(AuditLog.at <= end)
     
     # Add pagination
     offset = (page - 1) * limit
     logs = query.order_by(AuditLog.at.desc()).offset(offset).limit(limit).all()
     
-    return [
+    results = [
         {
             "id": log.id,
             "actor": log.actor,
@@ -49,10 +66,35 @@ def get_audit_logs(
             "entity_id": log.entity_id,
             "before": log.before,
             "after": log.after,
+            "diff": log.diff,
             "at": log.at.isoformat() if log.at else None
         }
         for log in logs
     ]
+    
+    # Months older than the attached partitions are only read when the range asks for them.
+    # Archived rows are all older than hot rows, so they simply continue the page.
+    boundary = archive_boundary()
+    if len(results) < limit and start and boundary and start < boundary:
+        archive_offset = max(0, offset - query.count())
+        archived = read_archived(
+            tenant_id, start=start, end=end,
+            entity=entity, entity_id=entity_id, action=action, actor=actor,
+        )
+        for row in archived[archive_offset:archive_offset + limit - len(results)]:
+            results.append({
+                "id": row["id"],
+                "actor": row["actor"],
+                "action": row["action"],
+                "entity": row["entity"],
+                "entity_id": row["entity_id"],
+                "before": row["before"],
+                "after": row["after"],
+                "diff": row.get("diff"),
+                "at": row["at"].isoformat()
+            })
+    
+    return results
 
 @router.get("/logs/summary")
 def get_audit_summary(
@@ -68,22 +110,125 @@ def get_audit_summary(
     end_date = datetime.utcnow()
     start_date = end_date - timedelta(days=days)
     
-    # Get summary by entity and action
-    summary = db.query(
-        AuditLog.entity,
-        AuditLog.action,
-        func.count(AuditLog.id).label('count')
-    ).filter(
-        AuditLog.tenant_id == tenant_id,
-        AuditLog.at >= start_date,
-        AuditLog.at <= end_date
-    ).group_by(AuditLog.entity, AuditLog.action).all()
+    # Whole hours come from the rollup table, so cost does not grow with audit volume
+    return summarize_audit(db, tenant_id, start_date, end_date)
+
+@router.get("/verify")
+def verify_audit_chain(
+    tenant_id: str,
+    full: bool = Query(False, description="Ignore checkpoints and re-hash every attached entry"),
+    x_tenant_id: str = Header(alias="X-Tenant-ID"),
+    db: Session = Depends(get_db),
+):
+    if tenant_id != x_tenant_id:
+        raise HTTPException(400, "Tenant mismatch")
+    
+    # Only entries written since the last signed checkpoint are re-hashed
+    return verify_chain(db, tenant_id, full=full)
+
+@router.get("/stream")
+async def stream_audit_logs(
+    tenant_id: str,
+    request: Request,
+    x_tenant_id: str = Header(alias="X-Tenant-ID"),
+    last_event_id: Optional[int] = Header(None, alias="Last-Event-ID"),
+):
+    """Live tail of new audit entries over Server-Sent Events"""
+    if tenant_id != x_tenant_id:
+        raise HTTPException(400, "Tenant mismatch")
     
-    return [
-        {
-            "entity": item.entity,
-            "action": item.action,
-            "count": item.count
-        }
-        for item in summary
-    ]
+    # Subscribe before catching up so nothing committed in between is missed
+    queue = audit_broadcaster.subscribe(tenant_id)
+    backlog = []
+    if last_event_id is not None:
+        backlog = audit_broadcaster.recent_since(tenant_id, last_event_id)
+    
+    def format_event(event) -> str:
+        return f"id: {event['id']}\nevent: audit\ndata: {json.dumps(event)}\n\n"
+    
+    async def events():
+        sent_up_to = last_event_id or 0
+        try:
+            if backlog is None:
+                # Older than the in-memory history: page through the table up to the live stream
+                while True:
+                    page = await run_in_threadpool(_backlog_page, tenant_id, sent_up_to)
+                    for event in page:
+                        sent_up_to = event["id"]
+                        yield format_event(event)
+                    if len(page) < STREAM_BACKLOG_PAGE or await request.is_disconnected():
+                        break
+            else:
+                for event in backlog:
+                    sent_up_to = max(sent_up_to, event["id"])
+                    yield format_event(event)
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    break  # dropped for falling behind; the client resumes with Last-Event-ID
+                if event["id"] <= sent_up_to:
+                    continue
+                sent_up_to = event["id"]
+                yield format_event(event)
+        finally:
+            audit_broadcaster.unsubscribe(tenant_id, queue)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def _backlog_page(tenant_id: str, after_id: int) -> List[dict]:
+    """The next page of a tenant's audit entries after after_id, as stream events"""
+    db = SessionLocal()
+    try:
+        logs = db.query(AuditLog).filter(
+            AuditLog.tenant_id == tenant_id,
+            AuditLog.id > after_id
+        ).order_by(AuditLog.id.asc()).limit(STREAM_BACKLOG_PAGE).all()
+        return [
+            stream_event({c: getattr(log, c) for c in ("id", "tenant_id", "actor", "action", "entity", "entity_id", "at")})
+            for log in logs
+        ]
+    finally:
+        db.close()
+
+@router.get("/entities/{entity}/{entity_id}/versions")
+def get_entity_history(
+    tenant_id: str,
+    entity: str,
+    entity_id: int,
+    x_tenant_id: str = Header(alias="X-Tenant-ID"),
+    db: Session = Depends(get_db),
+):
+    """Every audited version of an entity, rebuilt by replaying the stored diffs"""
+    if tenant_id != x_tenant_id:
+        raise HTTPException(400, "Tenant mismatch")
+    
+    versions = get_entity_versions(db, tenant_id, entity, entity_id)
+    if not versions:
+        raise HTTPException(404, "No audit history for this entity")
+    return versions
+
+@router.get("/entities/{entity}/{entity_id}/versions/{audit_id}")
+def get_entity_version(
+    tenant_id: str,
+    entity: str,
+    entity_id: int,
+    audit_id: int,
+    x_tenant_id: str = Header(alias="X-Tenant-ID"),
+    db: Session = Depends(get_db),
+):
+    """The state of an entity as of a given audit entry"""
+    if tenant_id != x_tenant_id:
+        raise HTTPException(400, "Tenant mismatch")
+    
+    versions = get_entity_versions(db, tenant_id, entity, entity_id, up_to_audit_id=audit_id)
+    if not versions or versions[-1]["audit_id"] != audit_id:
+        raise HTTPException(404, "Audit entry not found for this entity")
+    return versions[-1]
@@ -0,0 +1,34 @@
+# app/routers/metrics.py
+from fastapi import APIRouter
+from services.audit_writer import audit_writer
+from services.audit_stream import audit_broadcaster
+from services.insight_worker import insight_worker
+from services.llm import llm_client
+from services.mcp_client import mcp_client
+
+router = APIRouter(prefix="/api/metrics", tags=["metrics"])
+
+@router.get("/audit-writer")
+def get_audit_writer_metrics():
+    """Queue depth, flush latency and spool state of the buffered audit writer"""
+    return audit_writer.metrics()
+
+@router.get("/audit-stream")
+def get_audit_stream_metrics():
+    """Number of live audit tail viewers in this process"""
+    return {"viewers": audit_broadcaster.viewer_count()}
+
+@router.get("/mcp")
+def get_mcp_metrics():
+    """MCP transport calls and call latency (and worker processes for the pool)"""
+    return mcp_client.metrics()
+
+@router.get("/llm")
+def get_llm_metrics():
+    """LLM calls in flight, callers waiting on the concurrency limit, and call latency"""
+    return llm_client.metrics()
+
+@router.get("/insights")
+def get_insight_worker_metrics():
+    """Queued and running insight jobs, and how many submissions were deduplicated"""
+    return insight_worker.metrics()
@@ -1,10 +1,12 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Header
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Header, Query
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 import csv, io
 from datetime import date
 from db import get_db
 from models_rich import PayrollBatch, PayItem, Employee
 from decorators import audit_log
+from services.employee_match import employee_index
 
 router = APIRouter(prefix="/api/tenants/{tenant_id}/payroll", tags=["payroll"])
 
@@ -95,3 +97,54 @@ def get_payroll_batches(
         }
         for batch in batches
     ]
+
+@router.get("/employee-matches")
+def get_employee_matches(
+    tenant_id: str,
+    q: str = Query(..., min_length=1, description="Employee id or name"),
+    limit: int = Query(3, ge=1, le=20),
+    x_tenant_id: str = Header(alias="X-Tenant-ID"),
+    db: Session = Depends(get_db),
+):
+    """Employees an unresolved employee id (or a name) may refer to"""
+    if tenant_id != x_tenant_id:
+        raise HTTPException(400, "Tenant mismatch")
+    return {"query": q, "matches": employee_index(db, tenant_id).suggest(q, limit)}
+
+@router.get("/batches/{batch_id}/unresolved")
+def get_unresolved_employees(
+    tenant_id: str,
+    batch_id: int,
+    x_tenant_id: str = Header(alias="X-Tenant-ID"),
+    db: Session = Depends(get_db),
+):
+    """Employee ids in a batch that match no employee, with likely matches"""
+    if tenant_id != x_tenant_id:
+        raise HTTPException(400, "Tenant mismatch")
+    
+    batch = db.query(PayrollBatch).filter(
+        PayrollBatch.id == batch_id,
+        PayrollBatch.tenant_id == tenant_id
+    ).first()
+    if not batch:
+        raise HTTPException(404, "Payroll batch not found")
+    
+    rows = db.query(PayItem.employee_ext_id, func.count(), func.sum(PayItem.amount)).filter(
+        PayItem.tenant_id == tenant_id,
+        PayItem.payroll_batch_id == batch_id,
+        PayItem.employee_id.is_(None)
+    ).group_by(PayItem.employee_ext_id).order_by(PayItem.employee_ext_id).all()
+    
+    index = employee_index(db, tenant_id)
+    return {
+        "batch_id": batch_id,
+        "unresolved": [
+            {
+                "employee_ext_id": employee_ext_id,
+                "items": items,
+                "amount": round(float(amount or 0), 2),
+                "matches": index.suggest(employee_ext_id) if employee_ext_id else [],
+            }
+            for employee_ext_id, items, amount in rows
+        ]
+    }
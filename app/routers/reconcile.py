@@ -1,11 +1,18 @@
 # app/routers/reconcile.py
-from fastapi import APIRouter, Depends, HTTPException, Header, Query
+from typing import Any, Dict, List
+from fastapi import APIRouter, Body, Depends, HTTPException, Header, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 from pathlib import Path
 from db import get_db
+from config import settings
 from services.reconcile import run_reconciliation, get_reconciliation_items
-from services.insights import get_reconciliation_insights, create_reconciliation_insights
+from services.insights import create_rule_insights, enrich_from_memo, get_reconciliation_insights
+from services.insight_worker import insight_worker
+from services.run_stats import run_stats
+from services.reconcile_rules import rule_cache, save_tenant_rules, tenant_rules
+from services.deduction_codes import (
+    CodeSuggester, accept_suggestions, delete_mapping, list_mappings, save_mappings, unmapped_codes
+)
 from models_rich import ReconciliationItem, AchTransfer, ReconciliationRun
 from decorators import audit_log
 from datetime import datetime
@@ -24,6 +31,116 @@ def reconcile(
         raise HTTPException(400, "Tenant mismatch")
     return run_reconciliation(db, tenant_id, payroll_batch_id, actor="demo-user")
 
+@router.get("/reconcile/rules")
+def get_reconciliation_rules(
+    tenant_id: str,
+    x_tenant_id: str = Header(alias="X-Tenant-ID"),
+    db: Session = Depends(get_db),
+):
+    """The tenant's reconciliation rules: what it customized and the effective set"""
+    if tenant_id != x_tenant_id:
+        raise HTTPException(400, "Tenant mismatch")
+    
+    custom = tenant_rules(db, tenant_id)
+    rules = rule_cache.compiled(custom)
+    return {"version": rules.version, "custom": custom or {}, "rules": rules.rules}
+
+@router.put("/reconcile/rules")
+def put_reconciliation_rules(
+    tenant_id: str,
+    custom: Dict[str, Any] = Body(...),
+    x_tenant_id: str = Header(alias="X-Tenant-ID"),
+    db: Session = Depends(get_db),
+):
+    """
+    Replace the tenant's reconciliation rules. Keys left out use the
+    defaults; an empty object restores them all. Applies to the next run.
+    """
+    if tenant_id != x_tenant_id:
+        raise HTTPException(400, "Tenant mismatch")
+    
+    try:
+        rules = save_tenant_rules(db, tenant_id, custom)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return {"version": rules.version, "custom": custom, "rules": rules.rules}
+
+@router.get("/reconcile/code-mappings")
+def get_code_mappings(
+    tenant_id: str,
+    x_tenant_id: str = Header(alias="X-Tenant-ID"),
+    db: Session = Depends(get_db),
+):
+    """The tenant's deduction code to plan type mappings"""
+    if tenant_id != x_tenant_id:
+        raise HTTPException(400, "Tenant mismatch")
+    return {"mappings": list_mappings(db, tenant_id)}
+
+@router.put("/reconcile/code-mappings")
+def put_code_mappings(
+    tenant_id: str,
+    entries: List[Dict[str, Any]] = Body(...),
+    x_tenant_id: str = Header(alias="X-Tenant-ID"),
+    db: Session = Depends(get_db),
+):
+    """Create or replace mappings: [{"code": ..., "plan_type": ..., "plan_id": ...}]"""
+    if tenant_id != x_tenant_id:
+        raise HTTPException(400, "Tenant mismatch")
+    
+    try:
+        return {"mappings": save_mappings(db, tenant_id, entries, actor="demo-user")}
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+@router.get("/reconcile/code-mappings/unmapped")
+def get_unmapped_codes(
+    tenant_id: str,
+    days: int | None = Query(None, ge=1, description="Only pay periods ending this many days back"),
+    x_tenant_id: str = Header(alias="X-Tenant-ID"),
+    db: Session = Depends(get_db),
+):
+    """Deduction codes in the tenant's pay items with no mapping, with suggested mappings"""
+    if tenant_id != x_tenant_id:
+        raise HTTPException(400, "Tenant mismatch")
+    return {"codes": unmapped_codes(db, tenant_id, days)}
+
+@router.get("/reconcile/code-mappings/suggest")
+def suggest_code_mapping(
+    tenant_id: str,
+    code: str = Query(...),
+    x_tenant_id: str = Header(alias="X-Tenant-ID"),
+    db: Session = Depends(get_db),
+):
+    if tenant_id != x_tenant_id:
+        raise HTTPException(400, "Tenant mismatch")
+    return {"code": code, "suggestions": CodeSuggester(db, tenant_id).suggest(code)}
+
+@router.post("/reconcile/code-mappings/accept")
+def accept_code_mappings(
+    tenant_id: str,
+    min_confidence: float = Query(0.8, ge=0, le=1),
+    days: int | None = Query(None, ge=1),
+    x_tenant_id: str = Header(alias="X-Tenant-ID"),
+    db: Session = Depends(get_db),
+):
+    """Save the best suggestion for every unmapped code at or above min_confidence"""
+    if tenant_id != x_tenant_id:
+        raise HTTPException(400, "Tenant mismatch")
+    return {"mappings": accept_suggestions(db, tenant_id, min_confidence, actor="demo-user", days=days)}
+
+@router.delete("/reconcile/code-mappings/{code}")
+def remove_code_mapping(
+    tenant_id: str,
+    code: str,
+    x_tenant_id: str = Header(alias="X-Tenant-ID"),
+    db: Session = Depends(get_db),
+):
+    if tenant_id != x_tenant_id:
+        raise HTTPException(400, "Tenant mismatch")
+    if not delete_mapping(db, tenant_id, code):
+        raise HTTPException(404, "Mapping not found")
+    return {"deleted": code}
+
 @router.get("/reconcile/runs")
 def get_reconciliation_runs(
     tenant_id: str,
@@ -51,26 +168,11 @@ def get_reconciliation_runs(
     offset = (page - 1) * limit
     runs = query.order_by(ReconciliationRun.created_at.desc()).offset(offset).limit(limit).all()
     
-    # Get summary data for each run
+    # Get summary data for all runs on the page in one query
+    stats = run_stats(db, [run.id for run in runs])
     result = []
     for run in runs:
-        # Count items by issue type
-        item_counts = db.query(
-            ReconciliationItem.issue_type,
-            func.count(ReconciliationItem.id).label('count')
-        ).filter(
-            ReconciliationItem.run_id == run.id
-        ).group_by(ReconciliationItem.issue_type).all()
-        
-        # Calculate total amount
-        total_amount = db.query(func.sum(ReconciliationItem.amount)).filter(
-            ReconciliationItem.run_id == run.id
-        ).scalar() or 0.0
-        
-        # Build summary
-        summary = {}
-        for item_type, count in item_counts:
-            summary[item_type] = count
+        summary = {item_type: counts["items"] for item_type, counts in stats[run.id]["issue_types"].items()}
         
         # Check if already approved
         ach_transfer = db.query(AchTransfer).filter(AchTransfer.run_id == run.id).first()
@@ -82,8 +184,10 @@ def get_reconciliation_runs(
             "created_by": run.created_by,
             "status": run.status,
             "summary": summary,
-            "item_count": sum(summary.values()),
-            "total_amount": float(total_amount),
+            "item_count": stats[run.id]["items"],
+            "total_amount": stats[run.id]["amount"],
+            "total_impact": stats[run.id]["impact"],
+            "affected_employees": stats[run.id]["employees"],
             "is_approved": ach_transfer is not None,
             "ach_transfer_id": ach_transfer.id if ach_transfer else None
         })
@@ -193,22 +297,45 @@ def get_insights(
     x_tenant_id: str = Header(alias="X-Tenant-ID"),
     db: Session = Depends(get_db),
 ):
-    """Get insights for a reconciliation run"""
+    """
+    Get insights for a reconciliation run. The rules-based insights are
+    always returned; `enrichment` reports the LLM rewrite of the suggestions,
+    which runs in the background.
+    """
     if tenant_id != x_tenant_id:
         raise HTTPException(400, "Tenant mismatch")
     
     # Try to get existing insights
     insights = get_reconciliation_insights(db, run_id, tenant_id)
-    
-    # If no insights exist, create them
+    run = None
     if not insights:
-        try:
-            create_reconciliation_insights(db, run_id, tenant_id)
-            insights = get_reconciliation_insights(db, run_id, tenant_id)
-        except Exception as e:
-            raise HTTPException(500, f"Failed to generate insights: {str(e)}")
+        run = db.query(ReconciliationRun).filter(
+            ReconciliationRun.id == run_id,
+            ReconciliationRun.tenant_id == tenant_id
+        ).first()
+        if not run:
+            raise HTTPException(404, "Reconciliation run not found")
+        create_rule_insights(db, run)
+        insights = get_reconciliation_insights(db, run_id, tenant_id)
     
-    if not insights:
-        raise HTTPException(404, "Insights not found")
+    if insights["llm_enriched"]:
+        insights["enrichment"] = {"status": "done"}
+        return insights
+    if not settings.INSIGHTS_LLM_ENRICHMENT:
+        insights["enrichment"] = {"status": "disabled"}
+        return insights
+    
+    job = insight_worker.status(tenant_id, run_id)
+    if job and job["status"] == "failed":
+        # Reported once; the next request retries
+        insight_worker.clear_failed(tenant_id, run_id)
+    elif not job:
+        run = run or db.query(ReconciliationRun).filter(ReconciliationRun.id == run_id).first()
+        if enrich_from_memo(db, run):
+            insights = get_reconciliation_insights(db, run_id, tenant_id)
+            insights["enrichment"] = {"status": "done"}
+            return insights
+        job = insight_worker.submit(tenant_id, run_id) or {"status": "unavailable", "error": "Insight worker is not running"}
     
+    insights["enrichment"] = job
     return insights
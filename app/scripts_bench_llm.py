@@ -0,0 +1,116 @@
+# app/scripts_bench_llm.py
+"""
+Load-test the LLM path at a fixed concurrency.
+
+    python scripts_bench_llm.py --target client --requests 500 --concurrency 32
+    python scripts_bench_llm.py --target orchestrate --url http://localhost:8000 --concurrency 8
+    python scripts_bench_llm.py --target stream --query "Which employees had the largest mismatches?"
+
+`client` calls the LLM client in this process (limiter, timeouts and the
+configured provider). `orchestrate` and `stream` drive a running API's
+/api/mcp/llm-orchestrate endpoints; `stream` also reports time to first token.
+Run the API with LLM_PROVIDER=local to measure the service without the vendor.
+"""
+import argparse
+import asyncio
+import json
+import time
+from statistics import mean
+import httpx
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+def summarize(label, values):
+    return (
+        f"{label}: mean={mean(values):8.1f}ms p50={percentile(values, 0.50):8.1f}ms "
+        f"p95={percentile(values, 0.95):8.1f}ms p99={percentile(values, 0.99):8.1f}ms"
+    )
+
+async def call_client(client, args):
+    from services.llm import llm_client
+
+    await llm_client.complete(args.query)
+    return None
+
+async def call_orchestrate(client, args):
+    response = await client.post(
+        "/api/mcp/llm-orchestrate",
+        json={"query": args.query, "use_sql_cache": not args.no_cache},
+        headers={"X-Tenant-ID": args.tenant},
+    )
+    response.raise_for_status()
+    if not response.json()["final_success"]:
+        raise RuntimeError(response.json()["summary"])
+    return None
+
+async def call_stream(client, args):
+    start = time.perf_counter()
+    first_token = None
+    event = None
+    async with client.stream(
+        "POST",
+        "/api/mcp/llm-orchestrate/stream",
+        json={"query": args.query, "use_sql_cache": not args.no_cache},
+        headers={"X-Tenant-ID": args.tenant},
+    ) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+                if event == "token" and first_token is None:
+                    first_token = (time.perf_counter() - start) * 1000
+            elif line.startswith("data: ") and event == "done" and not json.loads(line[len("data: "):])["final_success"]:
+                raise RuntimeError("orchestration failed")
+    return first_token
+
+TARGETS = {"client": call_client, "orchestrate": call_orchestrate, "stream": call_stream}
+
+async def bench(args):
+    call = TARGETS[args.target]
+    slots = asyncio.Semaphore(args.concurrency)
+    latencies, first_tokens, errors = [], [], []
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=120) as client:
+        async def one():
+            async with slots:
+                start = time.perf_counter()
+                try:
+                    first_token = await call(client, args)
+                except Exception as e:
+                    errors.append(str(e))
+                    return
+                latencies.append((time.perf_counter() - start) * 1000)
+                if first_token is not None:
+                    first_tokens.append(first_token)
+
+        await one()  # warm up: connections, provider client, caches
+        latencies.clear()
+        first_tokens.clear()
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(args.requests)))
+        elapsed = time.perf_counter() - start
+
+    print(f"{args.target} requests={args.requests} concurrency={args.concurrency} errors={len(errors)}")
+    if latencies:
+        print(summarize("latency    ", latencies))
+    if first_tokens:
+        print(summarize("first token", first_tokens))
+    print(f"throughput: {len(latencies) / elapsed:.1f} requests/s")
+    if errors:
+        print(f"first error: {errors[0]}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the LLM client and orchestration endpoints")
+    parser.add_argument("--target", choices=sorted(TARGETS), default="client")
+    parser.add_argument("--url", default="http://localhost:8000", help="API base URL for orchestrate/stream")
+    parser.add_argument("--tenant", default="demo-tenant-1")
+    parser.add_argument("--query", default="Show the most recent reconciliation runs and their issue counts")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--no-cache", action="store_true", help="Have the LLM write SQL for every request")
+    asyncio.run(bench(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# app/scripts_bench_mcp.py
+"""
+Compare MCP transports on the same tool call.
+
+    python scripts_bench_mcp.py --method get_reconciliation_summary --params '{"run_id": 1}'
+    python scripts_bench_mcp.py --transports inprocess,pool,spawn --calls 500 --concurrency 16
+
+`spawn` is the old process-per-call path, kept here as a baseline.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from statistics import mean
+from services.mcp_client import create_mcp_client
+from services.mcp_pool import MCP_SERVER_PATH
+
+class SpawnPerCall:
+    """One `python server.py` per request, as call_mcp_server used to do"""
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def call(self, request):
+        result = subprocess.run(
+            [sys.executable, os.path.abspath(MCP_SERVER_PATH)],
+            input=json.dumps(request),
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(MCP_SERVER_PATH)),
+        )
+        return json.loads(result.stdout.strip())
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+def bench(name, client, request, calls, concurrency):
+    client.start()
+    try:
+        client.call(dict(request, id=0))  # warm up: process start, imports, first connection
+        latencies, errors = [], 0
+
+        def one(i):
+            start = time.perf_counter()
+            response = client.call(dict(request, id=i))
+            return (time.perf_counter() - start) * 1000, "error" in response
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for latency, failed in pool.map(one, range(1, calls + 1)):
+                latencies.append(latency)
+                errors += failed
+        elapsed = time.perf_counter() - start
+    finally:
+        client.stop()
+
+    print(
+        f"{name:<10} calls={calls:<5} errors={errors:<4} "
+        f"mean={mean(latencies):8.2f}ms p50={percentile(latencies, 0.50):8.2f}ms "
+        f"p95={percentile(latencies, 0.95):8.2f}ms p99={percentile(latencies, 0.99):8.2f}ms "
+        f"throughput={calls / elapsed:8.1f}/s"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MCP transports")
+    parser.add_argument("--transports", default="inprocess,pool", help="Comma-separated: inprocess, pool, spawn")
+    parser.add_argument("--method", default="ping")
+    parser.add_argument("--params", default="{}", help="JSON object of tool parameters")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    request = {"jsonrpc": "2.0", "method": args.method, "params": json.loads(args.params)}
+    for name in args.transports.split(","):
+        client = SpawnPerCall() if name == "spawn" else create_mcp_client(name)
+        calls = min(args.calls, 50) if name == "spawn" else args.calls
+        bench(name, client, request, calls, args.concurrency)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# app/services/anomalies.py
+"""
+Amount anomalies against each employee's own pay item history.
+
+A deduction can match the enrollment percentage and still be far off what
+the employee normally pays for that code (a doubled catch-up, a misplaced
+decimal). Recent history per (employee, code) is loaded into NumPy arrays;
+the median and median absolute deviation of every group are computed at
+once by sorting on (group, value), and each batch item gets a robust
+z-score, 0.6745 * (amount - median) / MAD. Payroll deductions are usually
+the same every period, so the MAD is floored at ANOMALY_MIN_SCALE_PCT of the
+median; otherwise any change at all would be an outlier.
+"""
+from datetime import timedelta
+from itertools import repeat
+from operator import itemgetter
+from typing import Dict, List, Tuple
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from config import settings
+from models_rich import PayItem, PayrollBatch
+
+MIN_SCALE_ABS = 1.0  # dollars; keeps near-zero medians from flagging cents
+
+def group_medians(groups: np.ndarray, values: np.ndarray, n_groups: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Median of values per group id (NaN for empty groups), and the group sizes"""
+    # Sort by value, then stably by group (a radix sort for integers): faster than lexsort
+    order = np.argsort(values)
+    order = order[np.argsort(groups[order], kind="stable")]
+    ordered = values[order]
+    counts = np.bincount(groups, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+    present = counts > 0
+    lo = (starts + (counts - 1) // 2)[present]
+    hi = (starts + counts // 2)[present]
+    medians = np.full(n_groups, np.nan)
+    medians[present] = (ordered[lo] + ordered[hi]) / 2
+    return medians, counts
+
+def robust_z_scores(
+    history_groups: np.ndarray,
+    history_amounts: np.ndarray,
+    groups: np.ndarray,
+    amounts: np.ndarray,
+    n_groups: int,
+    min_scale_pct: float = settings.ANOMALY_MIN_SCALE_PCT,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Robust z-score of each amount against its group's history, with the group's median, MAD and history size"""
+    medians, counts = group_medians(history_groups, history_amounts, n_groups)
+    deviations = np.abs(history_amounts - medians[history_groups])
+    mads, _ = group_medians(history_groups, deviations, n_groups)
+    floor = np.maximum(min_scale_pct * np.abs(medians), MIN_SCALE_ABS) * 0.6745
+    scale = np.fmax(mads, floor)
+    with np.errstate(invalid="ignore"):
+        z = 0.6745 * (amounts - medians[groups]) / scale[groups]
+    return z, medians[groups], mads[groups], counts[groups]
+
+def detect_amount_anomalies(
+    db: Session,
+    tenant_id: str,
+    batch: PayrollBatch,
+    pay_items: List[PayItem],
+    threshold: float = settings.ANOMALY_Z_THRESHOLD,
+    history_days: int = settings.ANOMALY_HISTORY_DAYS,
+    min_history: int = settings.ANOMALY_MIN_HISTORY,
+) -> Dict[int, Dict]:
+    """Pay items of the batch whose amount is an outlier for the employee and code, by pay item id"""
+    if not pay_items:
+        return {}
+
+    # Group ids for the batch's (employee, code) pairs; history outside them is dropped
+    keys: Dict[Tuple[str, str], int] = {}
+    groups = np.fromiter(
+        (keys.setdefault((item.employee_ext_id, item.code), len(keys)) for item in pay_items),
+        dtype=np.int64, count=len(pay_items),
+    )
+    amounts = np.fromiter((item.amount for item in pay_items), dtype=np.float64, count=len(pay_items))
+
+    # Core rows, not the ORM session's result processing: history can be millions of rows
+    history = db.connection().execute(
+        select(PayItem.employee_ext_id, PayItem.code, PayItem.amount).where(
+            PayItem.tenant_id == tenant_id,
+            PayItem.payroll_batch_id != batch.id,
+            PayItem.period_end < batch.period_end,
+            PayItem.period_end >= batch.period_start - timedelta(days=history_days),
+            PayItem.code.in_({item.code for item in pay_items}),
+        )
+    ).fetchall()
+    if not history:
+        return {}
+    # Straight from the rows: transposing them with zip(*history) costs more than the lookups
+    history_groups = np.fromiter(
+        map(keys.get, map(itemgetter(slice(0, 2)), history), repeat(-1)), dtype=np.int64, count=len(history)
+    )
+    history_amounts = np.fromiter(map(itemgetter(2), history), dtype=np.float64, count=len(history))
+    known = history_groups >= 0
+    history_groups, history_amounts = history_groups[known], history_amounts[known]
+
+    z, medians, mads, counts = robust_z_scores(history_groups, history_amounts, groups, amounts, len(keys))
+    flagged = np.flatnonzero((counts >= min_history) & (np.abs(np.nan_to_num(z)) >= threshold))
+    return {
+        pay_items[i].id: {
+            "z": round(float(z[i]), 2),
+            "median": round(float(medians[i]), 2),
+            "mad": round(float(mads[i]), 2),
+            "history": int(counts[i]),
+        }
+        for i in flagged
+    }
@@ -0,0 +1,277 @@
+# app/services/audit_archive.py
+"""
+Monthly partition maintenance and archival for audit_log.
+
+Run as a job from the app directory:
+    python -m services.audit_archive                 # ensure partitions, archive old months
+    python -m services.audit_archive --ensure-only   # only create upcoming partitions
+"""
+import argparse
+import gzip
+import json
+import re
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from config import settings
+
+PARTITION_RE = re.compile(r"^audit_log_(\d{4})_(\d{2})$")
+ARCHIVE_COLUMNS = ["id", "tenant_id", "actor", "action", "entity", "entity_id", "before", "after", "diff", "at", "prev_hash", "hash"]
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def _month_start(value: datetime) -> date:
+    return date(value.year, value.month, 1)
+
+def partition_name(month: date) -> str:
+    return f"audit_log_{month:%Y_%m}"
+
+def _safe_name(tenant_id: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", tenant_id)
+
+def _archive_root() -> Path:
+    return Path(settings.AUDIT_ARCHIVE_DIR)
+
+# ---------- Partition maintenance ----------
+
+def _create_partition(db: Session, month: date) -> int:
+    """
+    Create one monthly partition; returns how many rows it took over from
+    audit_log_default (written for the month before its partition existed)
+    """
+    name = partition_name(month)
+    bounds = {"lo": month, "hi": _add_months(month, 1)}
+    create = (
+        f"CREATE TABLE {name} PARTITION OF audit_log "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+    )
+    stray = db.execute(text(
+        "SELECT count(*) FROM audit_log_default WHERE at >= :lo AND at < :hi"
+    ), bounds).scalar()
+    if not stray:
+        db.execute(text(create))
+        return 0
+    # Postgres refuses a new partition while the default holds rows in its range,
+    # so the default is detached while they move (one transaction, audit writes wait)
+    db.execute(text("ALTER TABLE audit_log DETACH PARTITION audit_log_default"))
+    db.execute(text(create))
+    db.execute(text(
+        f"INSERT INTO {name} SELECT * FROM audit_log_default WHERE at >= :lo AND at < :hi"
+    ), bounds)
+    db.execute(text("DELETE FROM audit_log_default WHERE at >= :lo AND at < :hi"), bounds)
+    db.execute(text("ALTER TABLE audit_log ATTACH PARTITION audit_log_default DEFAULT"))
+    return stray
+
+def ensure_partitions(db: Session, months_ahead: int = settings.AUDIT_PARTITIONS_AHEAD) -> List[str]:
+    """
+    Create monthly partitions from the current month through `months_ahead`
+    months, and for every month with rows stuck in the default partition
+    """
+    current = _month_start(datetime.utcnow())
+    months = {_add_months(current, offset) for offset in range(months_ahead + 1)}
+    months.update(db.execute(text(
+        "SELECT DISTINCT date_trunc('month', at)::date FROM audit_log_default"
+    )).scalars())
+    created = []
+    for month in sorted(months):
+        name = partition_name(month)
+        exists = db.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar()
+        if exists:
+            continue
+        moved = _create_partition(db, month)
+        db.commit()
+        created.append(f"{name} ({moved} rows from audit_log_default)" if moved else name)
+    return created
+
+def _monthly_tables(db: Session, attached: bool) -> Dict[date, str]:
+    """Monthly audit_log tables that are (or are no longer) attached to the parent"""
+    attached_sql = """
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'audit_log'::regclass
+    """
+    attached_names = set(db.execute(text(attached_sql)).scalars())
+    if attached:
+        names = attached_names
+    else:
+        all_names = db.execute(text(
+            "SELECT tablename FROM pg_tables WHERE schemaname = current_schema() AND tablename LIKE 'audit_log\\_%'"
+        )).scalars()
+        names = set(all_names) - attached_names
+
+    tables = {}
+    for name in names:
+        match = PARTITION_RE.match(name)
+        if match:
+            tables[date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return tables
+
+# ---------- Archival ----------
+
+def _export(db: Session, table: str, month: date, fmt: str) -> Dict[str, int]:
+    """Write one file per tenant for a detached monthly partition"""
+    month_dir = _archive_root() / f"{month:%Y-%m}"
+    month_dir.mkdir(parents=True, exist_ok=True)
+
+    result = db.execute(
+        text(f"SELECT {', '.join(ARCHIVE_COLUMNS)} FROM {table} ORDER BY tenant_id, id").execution_options(
+            stream_results=True, yield_per=5000
+        )
+    )
+    counts: Dict[str, int] = {}
+    current_tenant = None
+    rows: List[Dict] = []
+    for row in result.mappings():
+        if row["tenant_id"] != current_tenant:
+            if rows:
+                _write_tenant_file(month_dir, current_tenant, rows, fmt)
+            current_tenant, rows = row["tenant_id"], []
+        record = dict(row)
+        record["at"] = record["at"].isoformat()
+        rows.append(record)
+        counts[current_tenant] = counts.get(current_tenant, 0) + 1
+    if rows:
+        _write_tenant_file(month_dir, current_tenant, rows, fmt)
+
+    manifest = {"month": f"{month:%Y-%m}", "format": fmt, "tenants": counts, "archived_at": datetime.utcnow().isoformat()}
+    (month_dir / "_manifest.json").write_text(json.dumps(manifest, indent=2))
+    return counts
+
+def _write_tenant_file(month_dir: Path, tenant_id: str, rows: List[Dict], fmt: str) -> None:
+    if fmt == "parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet archives require pyarrow to be installed")
+        pq.write_table(pa.Table.from_pylist(rows), month_dir / f"{_safe_name(tenant_id)}.parquet", compression="zstd")
+    else:
+        with gzip.open(month_dir / f"{_safe_name(tenant_id)}.ndjson.gz", "wt", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+
+def _checkpoint_chains(db: Session) -> None:
+    """Sign every tenant's chain head while the months about to be archived are still attached"""
+    from services.audit_chain import chained_tenants, checkpoints_enabled, create_checkpoint
+    if not checkpoints_enabled():
+        return
+    for tenant_id in chained_tenants(db):
+        result = create_checkpoint(db, tenant_id)
+        if not result["ok"]:
+            print(f"Audit chain verification failed for {tenant_id}: {result['error']}")
+
+def archive_partitions(
+    db: Session,
+    keep_months: int = settings.AUDIT_HOT_MONTHS,
+    fmt: str = settings.AUDIT_ARCHIVE_FORMAT,
+) -> List[Dict]:
+    """
+    Detach monthly partitions older than `keep_months`, export them to compressed
+    files and drop them. Rows of those months still in the default partition are
+    moved to a partition of their own first, each tenant's hash chain is
+    checkpointed before anything is detached, and partitions left detached by an
+    interrupted run are picked up again.
+    """
+    if fmt not in ("ndjson", "parquet"):
+        raise ValueError(f"Unsupported archive format: {fmt}")
+
+    # Old months only present in the default partition get their own partition first
+    ensure_partitions(db, months_ahead=0)
+    cutoff = _add_months(_month_start(datetime.utcnow()), -(keep_months - 1))
+    expired = [table for month, table in sorted(_monthly_tables(db, attached=True).items()) if month < cutoff]
+    if expired:
+        _checkpoint_chains(db)
+    for table in expired:
+        db.execute(text(f"ALTER TABLE audit_log DETACH PARTITION {table}"))
+        db.commit()
+
+    archived = []
+    for month, table in sorted(_monthly_tables(db, attached=False).items()):
+        counts = _export(db, table, month, fmt)
+        db.execute(text(f"DROP TABLE {table}"))
+        db.commit()
+        archived.append({"month": f"{month:%Y-%m}", "table": table, "rows": sum(counts.values()), "tenants": len(counts)})
+    return archived
+
+# ---------- Reading archived months ----------
+
+def archived_months() -> List[date]:
+    root = _archive_root()
+    if not root.exists():
+        return []
+    months = []
+    for path in root.iterdir():
+        if (path / "_manifest.json").exists():
+            year, month = path.name.split("-")
+            months.append(date(int(year), int(month), 1))
+    return sorted(months)
+
+def archive_boundary() -> Optional[datetime]:
+    """Rows older than this live in archive files rather than attached partitions"""
+    months = archived_months()
+    if not months:
+        return None
+    return datetime.combine(_add_months(months[-1], 1), datetime.min.time())
+
+def _read_tenant_file(month: date, tenant_id: str) -> Iterator[Dict]:
+    month_dir = _archive_root() / f"{month:%Y-%m}"
+    ndjson_path = month_dir / f"{_safe_name(tenant_id)}.ndjson.gz"
+    parquet_path = month_dir / f"{_safe_name(tenant_id)}.parquet"
+    if ndjson_path.exists():
+        with gzip.open(ndjson_path, "rt", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+    elif parquet_path.exists():
+        import pyarrow.parquet as pq
+        yield from pq.read_table(parquet_path).to_pylist()
+
+def read_archived(
+    tenant_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    **filters,
+) -> List[Dict]:
+    """Archived audit rows for a tenant, newest first; only months overlapping the range are opened"""
+    rows = []
+    for month in archived_months():
+        month_end = datetime.combine(_add_months(month, 1), datetime.min.time())
+        if start and month_end <= start:
+            continue
+        if end and datetime.combine(month, datetime.min.time()) > end:
+            continue
+        for row in _read_tenant_file(month, tenant_id):
+            at = datetime.fromisoformat(row["at"]) if isinstance(row["at"], str) else row["at"]
+            if (start and at < start) or (end and at > end):
+                continue
+            if any(value is not None and row.get(key) != value for key, value in filters.items()):
+                continue
+            row["at"] = at
+            rows.append(row)
+    rows.sort(key=lambda r: (r["at"], r["id"]), reverse=True)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain audit_log partitions and archive old months")
+    parser.add_argument("--keep-months", type=int, default=settings.AUDIT_HOT_MONTHS)
+    parser.add_argument("--months-ahead", type=int, default=settings.AUDIT_PARTITIONS_AHEAD)
+    parser.add_argument("--format", choices=["ndjson", "parquet"], default=settings.AUDIT_ARCHIVE_FORMAT)
+    parser.add_argument("--ensure-only", action="store_true", help="Only create upcoming partitions")
+    args = parser.parse_args()
+
+    from db import SessionLocal
+    db = SessionLocal()
+    try:
+        created = ensure_partitions(db, args.months_ahead)
+        print(f"Created partitions: {created or 'none'}")
+        if not args.ensure_only:
+            for entry in archive_partitions(db, args.keep_months, args.format):
+                print(f"Archived {entry['table']}: {entry['rows']} rows across {entry['tenants']} tenants")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
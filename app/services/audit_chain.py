@@ -0,0 +1,245 @@
+# app/services/audit_chain.py
+"""
+Per-tenant hash chain over audit_log with signed checkpoints.
+
+Every entry stores the previous entry's hash and
+    hash = sha256(prev_hash + canonical JSON of the entry)
+so editing, deleting or reordering a row breaks the chain from that point on.
+Checkpoints sign the chain head once a range has verified, and later
+verification only re-hashes entries written after the last checkpoint.
+Signing needs a dedicated AUDIT_CHECKPOINT_KEY; without one no checkpoints
+are created or trusted, and every verification re-hashes the whole chain.
+
+    python -m services.audit_chain verify [--tenant T] [--full]
+    python -m services.audit_chain checkpoint [--tenant T]
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import threading
+import traceback
+from datetime import datetime
+from typing import Dict, List, Optional
+from sqlalchemy import select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from config import settings
+from models_rich import AuditChainHead, AuditCheckpoint, AuditLog
+from services.audit_archive import archive_boundary
+
+GENESIS_HASH = "0" * 64
+HASHED_FIELDS = ("id", "tenant_id", "actor", "action", "entity", "entity_id", "before", "after", "diff", "at")
+
+def entry_hash(prev_hash: str, entry: Dict) -> str:
+    payload = {}
+    for field in HASHED_FIELDS:
+        value = entry.get(field)
+        payload[field] = value.isoformat() if isinstance(value, datetime) else value
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256((prev_hash + canonical).encode()).hexdigest()
+
+def chain_entries(db: Session, entries: List[Dict]) -> List[Dict]:
+    """
+    Assign ids and chained hashes to a batch before it is inserted. Chain heads
+    are row-locked until commit, so concurrent writers extend each tenant's
+    chain one after another and id order matches chain order.
+    """
+    tenants = sorted({e["tenant_id"] for e in entries})
+    db.execute(pg_insert(AuditChainHead).values([
+        {"tenant_id": t, "audit_id": 0, "hash": GENESIS_HASH} for t in tenants
+    ]).on_conflict_do_nothing())
+    heads = {
+        head.tenant_id: head
+        for head in db.scalars(
+            select(AuditChainHead)
+            .where(AuditChainHead.tenant_id.in_(tenants))
+            .order_by(AuditChainHead.tenant_id)
+            .with_for_update()
+        )
+    }
+    ids = sorted(db.scalars(
+        text("SELECT nextval('audit_log_id_seq') FROM generate_series(1, :n)"), {"n": len(entries)}
+    ).all())
+
+    chained = []
+    for entry, entry_id in zip(entries, ids):
+        head = heads[entry["tenant_id"]]
+        entry = dict(entry, id=entry_id, prev_hash=head.hash)
+        entry["hash"] = entry_hash(head.hash, entry)
+        head.audit_id, head.hash = entry_id, entry["hash"]
+        chained.append(entry)
+    db.flush()
+    return chained
+
+# ---------- Checkpoints ----------
+
+def checkpoints_enabled() -> bool:
+    # Never the app's SECRET_KEY: its default is public, and anyone knowing the key can forge checkpoints
+    return bool(settings.AUDIT_CHECKPOINT_KEY)
+
+def _sign(tenant_id: str, audit_id: int, chain_hash: str) -> str:
+    if not checkpoints_enabled():
+        raise RuntimeError("AUDIT_CHECKPOINT_KEY is not set")
+    key = settings.AUDIT_CHECKPOINT_KEY.encode()
+    return hmac.new(key, f"{tenant_id}:{audit_id}:{chain_hash}".encode(), hashlib.sha256).hexdigest()
+
+def latest_checkpoint(db: Session, tenant_id: str) -> Optional[AuditCheckpoint]:
+    return db.query(AuditCheckpoint).filter(
+        AuditCheckpoint.tenant_id == tenant_id
+    ).order_by(AuditCheckpoint.audit_id.desc()).first()
+
+def verify_chain(db: Session, tenant_id: str, full: bool = False) -> Dict:
+    """
+    Re-hash entries after the last valid checkpoint (or all attached entries
+    with `full` or without a checkpoint key) and check every link up to the
+    current chain head.
+
+    Without a checkpoint, months moved to archive files take the start of the
+    chain with them: the first attached entry's prev_hash is then trusted,
+    `anchored` is False and `unverified_prefix` is that entry's id (nothing
+    before it was checked).
+    """
+    checkpoint = None if full or not checkpoints_enabled() else latest_checkpoint(db, tenant_id)
+    result = {
+        "tenant_id": tenant_id,
+        "ok": True,
+        "checkpoint_id": checkpoint.id if checkpoint else None,
+        "verified": 0,
+        "last_id": checkpoint.audit_id if checkpoint else 0,
+        "last_hash": checkpoint.hash if checkpoint else GENESIS_HASH,
+        "anchored": True,
+        "unverified_prefix": None,
+        "error": None,
+    }
+    if checkpoint and not hmac.compare_digest(
+        checkpoint.signature, _sign(tenant_id, checkpoint.audit_id, checkpoint.hash)
+    ):
+        return dict(result, ok=False, error=f"Checkpoint {checkpoint.id} has an invalid signature")
+
+    head = db.get(AuditChainHead, tenant_id)
+    if head is None:
+        return result
+
+    rows = db.execute(
+        select(AuditLog)
+        .where(
+            AuditLog.tenant_id == tenant_id,
+            AuditLog.id > result["last_id"],
+            AuditLog.id <= head.audit_id,
+        )
+        .order_by(AuditLog.id.asc())
+        .execution_options(yield_per=5000)
+    ).scalars()
+
+    prev_hash = result["last_hash"]
+    # Months moved to archive files take the start of the chain with them
+    anchored = checkpoint is not None or archive_boundary() is None
+    for row in rows:
+        if row.hash is None:
+            if result["verified"] == 0:
+                continue  # written before the chain was introduced
+            return dict(result, ok=False, error=f"Entry {row.id} is missing its hash")
+        if not anchored:
+            prev_hash, anchored = row.prev_hash, True
+            result.update(anchored=False, unverified_prefix=row.id)
+        if row.prev_hash != prev_hash:
+            return dict(result, ok=False, error=f"Entry {row.id} does not link to the previous entry")
+        entry = {field: getattr(row, field) for field in HASHED_FIELDS}
+        if entry_hash(prev_hash, entry) != row.hash:
+            return dict(result, ok=False, error=f"Entry {row.id} does not match its hash")
+        prev_hash = row.hash
+        result.update(verified=result["verified"] + 1, last_id=row.id, last_hash=row.hash)
+
+    if prev_hash != head.hash:
+        return dict(result, ok=False, error="Chain ends before the recorded chain head; entries were removed")
+    return result
+
+def create_checkpoint(db: Session, tenant_id: str) -> Dict:
+    """Verify the range since the last checkpoint and sign its head"""
+    if not checkpoints_enabled():
+        return dict(verify_chain(db, tenant_id), ok=False, error="AUDIT_CHECKPOINT_KEY is not set; checkpoints are disabled")
+    result = verify_chain(db, tenant_id)
+    if not result["ok"] or result["verified"] == 0:
+        return result
+    checkpoint = AuditCheckpoint(
+        tenant_id=tenant_id,
+        audit_id=result["last_id"],
+        hash=result["last_hash"],
+        entry_count=result["verified"],
+        signature=_sign(tenant_id, result["last_id"], result["last_hash"]),
+    )
+    db.add(checkpoint)
+    db.commit()
+    return dict(result, checkpoint_id=checkpoint.id)
+
+def chained_tenants(db: Session) -> List[str]:
+    return list(db.scalars(select(AuditChainHead.tenant_id).order_by(AuditChainHead.tenant_id)))
+
+class Checkpointer:
+    """Creates checkpoints for every tenant on an interval"""
+
+    def __init__(self, session_factory, interval: float = settings.AUDIT_CHECKPOINT_INTERVAL_S):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self.interval <= 0 or self._thread is not None:
+            return
+        if not checkpoints_enabled():
+            print("AUDIT_CHECKPOINT_KEY is not set; audit checkpoints are disabled")
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="audit-checkpointer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(5)
+        self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            db = self.session_factory()
+            try:
+                for tenant_id in chained_tenants(db):
+                    result = create_checkpoint(db, tenant_id)
+                    if not result["ok"]:
+                        print(f"Audit chain verification failed for {tenant_id}: {result['error']}")
+            except Exception:
+                db.rollback()
+                traceback.print_exc()
+            finally:
+                db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify and checkpoint the audit log hash chain")
+    parser.add_argument("command", choices=["verify", "checkpoint"])
+    parser.add_argument("--tenant", help="Only this tenant (default: all tenants)")
+    parser.add_argument("--full", action="store_true", help="Ignore checkpoints and verify every attached entry")
+    args = parser.parse_args()
+
+    from db import SessionLocal
+    db = SessionLocal()
+    failed = False
+    try:
+        for tenant_id in [args.tenant] if args.tenant else chained_tenants(db):
+            if args.command == "checkpoint":
+                result = create_checkpoint(db, tenant_id)
+            else:
+                result = verify_chain(db, tenant_id, full=args.full)
+            status = "OK" if result["ok"] else f"FAILED: {result['error']}"
+            if not result["anchored"]:
+                status += f", unanchored: entries before id {result['unverified_prefix']} are archived and were not verified"
+            print(f"{tenant_id}: {status} ({result['verified']} entries verified, last id {result['last_id']})")
+            failed = failed or not result["ok"]
+    finally:
+        db.close()
+    raise SystemExit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# app/services/audit_rollup.py
+"""
+Hourly audit rollups backing the audit summary endpoint.
+
+In `incremental` mode the audit writer folds every flushed batch into the
+rollup table in the same transaction. In `compactor` mode a periodic job
+rolls up closed hours instead:
+    python -m services.audit_rollup
+"""
+import threading
+import traceback
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import delete, func, select, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from config import settings
+from models_rich import AuditLog, AuditRollupHourly, SystemConfig
+
+WATERMARK_KEY = "audit_rollup_watermark"
+
+def hour_bucket(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+def apply_rollups(db: Session, entries: List[Dict]) -> None:
+    """Add a batch of freshly written audit entries to the hourly rollups"""
+    counts = Counter(
+        (e["tenant_id"], hour_bucket(e["at"]), e["entity"], e["action"], e["actor"])
+        for e in entries
+    )
+    if not counts:
+        return
+    stmt = pg_insert(AuditRollupHourly).values([
+        {"tenant_id": t, "bucket": b, "entity": en, "action": a, "actor": ac, "count": n}
+        for (t, b, en, a, ac), n in counts.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["tenant_id", "bucket", "entity", "action", "actor"],
+        set_={"count": AuditRollupHourly.count + stmt.excluded.count},
+    )
+    db.execute(stmt)
+
+# ---------- Compactor ----------
+
+def get_watermark(db: Session) -> Optional[datetime]:
+    """Hours before the watermark are fully rolled up (compactor mode)"""
+    value = db.query(SystemConfig.config_value).filter(SystemConfig.config_key == WATERMARK_KEY).scalar()
+    return datetime.fromisoformat(value) if value else None
+
+def _set_watermark(db: Session, value: datetime) -> None:
+    config = db.query(SystemConfig).filter(SystemConfig.config_key == WATERMARK_KEY).first()
+    if config is None:
+        config = SystemConfig(
+            config_key=WATERMARK_KEY,
+            config_type="string",
+            description="Audit rows before this hour are covered by audit_rollup_hourly",
+            config_value="",
+        )
+        db.add(config)
+    config.config_value = value.isoformat()
+
+def compact_rollups(
+    db: Session,
+    since: Optional[datetime] = None,
+    late_window: float = settings.AUDIT_ROLLUP_LATE_WINDOW_S,
+) -> Optional[datetime]:
+    """
+    Recompute rollups for closed hours from the watermark (or `since`) up to the
+    current hour. Recomputing whole hours keeps the job idempotent, so each
+    pass also redoes `late_window` seconds before the watermark: an entry's
+    `at` is set when it is queued, and it may be written long after its hour
+    was first rolled up.
+    """
+    until = hour_bucket(datetime.utcnow())
+    start = since
+    if start is None:
+        watermark = get_watermark(db)
+        start = watermark - timedelta(seconds=late_window) if watermark else None
+    if start is None:
+        start = db.query(func.min(AuditLog.at)).scalar()
+        if start is None:
+            return None
+    start = hour_bucket(start)
+    if start >= until:
+        return until
+
+    db.execute(delete(AuditRollupHourly).where(
+        AuditRollupHourly.bucket >= start,
+        AuditRollupHourly.bucket < until,
+    ))
+    bucket = func.date_trunc("hour", AuditLog.at)
+    rollup = (
+        select(AuditLog.tenant_id, bucket, AuditLog.entity, AuditLog.action, AuditLog.actor, func.count())
+        .where(AuditLog.at >= start, AuditLog.at < until)
+        .group_by(AuditLog.tenant_id, bucket, AuditLog.entity, AuditLog.action, AuditLog.actor)
+    )
+    db.execute(insert(AuditRollupHourly).from_select(
+        ["tenant_id", "bucket", "entity", "action", "actor", "count"], rollup
+    ))
+    _set_watermark(db, until)
+    db.commit()
+    return until
+
+class RollupCompactor:
+    """Runs compact_rollups on an interval (compactor mode only)"""
+
+    def __init__(self, session_factory, interval: float = settings.AUDIT_ROLLUP_COMPACT_INTERVAL_S):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if settings.AUDIT_ROLLUP_MODE != "compactor" or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="audit-rollup-compactor", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(5)
+        self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            db = self.session_factory()
+            try:
+                compact_rollups(db)
+            except Exception:
+                db.rollback()
+                traceback.print_exc()
+            finally:
+                db.close()
+            self._stop.wait(self.interval)
+
+# ---------- Summary ----------
+
+def _raw_counts(db: Session, tenant_id: str, start: datetime, end: datetime, inclusive_end: bool) -> List:
+    end_filter = AuditLog.at <= end if inclusive_end else AuditLog.at < end
+    return db.query(
+        AuditLog.entity, AuditLog.action, func.count(AuditLog.id)
+    ).filter(
+        AuditLog.tenant_id == tenant_id,
+        AuditLog.at >= start,
+        end_filter,
+    ).group_by(AuditLog.entity, AuditLog.action).all()
+
+def summarize_audit(db: Session, tenant_id: str, start: datetime, end: datetime) -> List[Dict]:
+    """
+    Counts by (entity, action) between start and end. Whole hours come from the
+    rollup table; only the partial leading hour and, in compactor mode, the hours
+    after the watermark are counted from raw rows.
+    """
+    first_full_hour = hour_bucket(start)
+    if first_full_hour < start:
+        first_full_hour += timedelta(hours=1)
+
+    if settings.AUDIT_ROLLUP_MODE == "compactor":
+        rolled_until = min(get_watermark(db) or first_full_hour, end)
+    else:
+        rolled_until = end
+    rolled_until = max(rolled_until, first_full_hour)
+
+    totals: Counter = Counter()
+    rollups = db.query(
+        AuditRollupHourly.entity, AuditRollupHourly.action, func.sum(AuditRollupHourly.count)
+    ).filter(
+        AuditRollupHourly.tenant_id == tenant_id,
+        AuditRollupHourly.bucket >= first_full_hour,
+        AuditRollupHourly.bucket < (rolled_until if rolled_until < end else end + timedelta(hours=1)),
+    ).group_by(AuditRollupHourly.entity, AuditRollupHourly.action).all()
+    for entity, action, count in rollups:
+        totals[(entity, action)] += int(count)
+
+    # Leading partial hour
+    if first_full_hour > start:
+        for entity, action, count in _raw_counts(db, tenant_id, start, min(first_full_hour, end), inclusive_end=False):
+            totals[(entity, action)] += count
+    # Tail not yet covered by the compactor
+    if rolled_until < end:
+        for entity, action, count in _raw_counts(db, tenant_id, rolled_until, end, inclusive_end=True):
+            totals[(entity, action)] += count
+
+    return [
+        {"entity": entity, "action": action, "count": count}
+        for (entity, action), count in sorted(totals.items())
+    ]
+
+def main():
+    from db import SessionLocal
+    db = SessionLocal()
+    try:
+        watermark = compact_rollups(db)
+        print(f"Audit rollups compacted up to {watermark.isoformat() if watermark else 'nothing to compact'}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+# app/services/audit_state.py
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from models_rich import AuditLog
+from services.audit_archive import archive_boundary, read_archived
+
+STATE_KEY = "audit_states"
+
+# Tables whose ORM state is captured; populated by the audit_log decorator
+_tracked_tables = set()
+
+def track_entity(entity: str) -> None:
+    _tracked_tables.add(entity)
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+def _loaded_columns(state) -> Dict[str, Any]:
+    """Column values already present on the instance; never triggers a load"""
+    values = {}
+    for attr in state.mapper.column_attrs:
+        if attr.key in state.dict:
+            values[attr.key] = _json_value(state.dict[attr.key])
+    return values
+
+def _committed_columns(state) -> Dict[str, Any]:
+    """Column values as they were before the pending changes were flushed"""
+    values = {}
+    for attr in state.mapper.column_attrs:
+        history = state.attrs[attr.key].history
+        if history.deleted:
+            values[attr.key] = _json_value(history.deleted[0])
+        elif history.unchanged:
+            values[attr.key] = _json_value(history.unchanged[0])
+    return values
+
+def _primary_key(state) -> Optional[Any]:
+    if state.key is not None:
+        return state.key[1][0]
+    pk_column = state.mapper.primary_key[0]
+    return state.dict.get(state.mapper.get_property_by_column(pk_column).key)
+
+def _capture_after_flush(session: Session, flush_context) -> None:
+    if not _tracked_tables:
+        return
+    captured = session.info.setdefault(STATE_KEY, {})
+    changes = (
+        [(obj, "new") for obj in session.new]
+        + [(obj, "dirty") for obj in session.dirty]
+        + [(obj, "deleted") for obj in session.deleted]
+    )
+    for obj, kind in changes:
+        state = inspect(obj)
+        table = state.mapper.local_table.name
+        if table not in _tracked_tables:
+            continue
+
+        key = (table, _primary_key(state))
+        before = None if kind == "new" else _committed_columns(state)
+        after = None if kind == "deleted" else _loaded_columns(state)
+
+        if key in captured:
+            # Several flushes in one request: keep the earliest before, latest after
+            before = captured[key][0]
+        captured[key] = (before, after)
+
+def install_state_capture(session_factory) -> None:
+    """Record before/after column values of tracked entities on every flush"""
+    if not event.contains(session_factory, "after_flush", _capture_after_flush):
+        event.listen(session_factory, "after_flush", _capture_after_flush)
+
+def pop_entity_state(db: Session, entity: str, entity_id: Any) -> Tuple[Optional[Dict], Optional[Dict]]:
+    captured = db.info.pop(STATE_KEY, {})
+    return captured.get((entity, entity_id), (None, None))
+
+# ---------- JSON Patch (RFC 6902 subset: add / remove / replace) ----------
+
+def _escape(token: str) -> str:
+    return str(token).replace("~", "~0").replace("/", "~1")
+
+def _unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+def json_diff(before: Any, after: Any, path: str = "") -> List[Dict]:
+    """Structural diff that turns `before` into `after`"""
+    if isinstance(before, dict) and isinstance(after, dict):
+        ops = []
+        for key in before:
+            if key not in after:
+                ops.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+        for key, value in after.items():
+            child = f"{path}/{_escape(key)}"
+            if key not in before:
+                ops.append({"op": "add", "path": child, "value": value})
+            elif before[key] != value:
+                ops.extend(json_diff(before[key], value, child))
+        return ops
+    if before != after:
+        return [{"op": "replace", "path": path, "value": after}]
+    return []
+
+def apply_patch(doc: Any, ops: List[Dict]) -> Any:
+    """Apply a patch produced by json_diff; returns the new document"""
+    doc = json.loads(json.dumps(doc))  # never mutate the caller's document
+    for op in ops:
+        if op["path"] == "":
+            doc = op.get("value")
+            continue
+        tokens = [_unescape(t) for t in op["path"].split("/")[1:]]
+        target = doc
+        for token in tokens[:-1]:
+            target = target[int(token)] if isinstance(target, list) else target[token]
+        last = tokens[-1]
+        if isinstance(target, list):
+            last = int(last)
+        if op["op"] == "remove":
+            del target[last]
+        else:
+            target[last] = op["value"]
+    return doc
+
+# ---------- Reconstruction ----------
+
+def get_entity_versions(
+    db: Session,
+    tenant_id: str,
+    entity: str,
+    entity_id: int,
+    up_to_audit_id: Optional[int] = None,
+) -> List[Dict]:
+    """Rebuild every audited version of an entity by replaying its diffs from the first entry"""
+    query = db.query(AuditLog).filter(
+        AuditLog.tenant_id == tenant_id,
+        AuditLog.entity == entity,
+        AuditLog.entity_id == entity_id,
+    )
+    if up_to_audit_id is not None:
+        query = query.filter(AuditLog.id <= up_to_audit_id)
+
+    entries = [
+        {"id": log.id, "action": log.action, "actor": log.actor, "at": log.at, "diff": log.diff}
+        for log in query.order_by(AuditLog.id.asc()).all()
+    ]
+
+    # Older history may have been archived; only look there when the chain does not start here
+    if not entries or entries[0]["action"] != "create":
+        boundary = archive_boundary()
+        if boundary is not None:
+            archived = read_archived(tenant_id, end=boundary, entity=entity, entity_id=entity_id)
+            archived = [row for row in reversed(archived) if up_to_audit_id is None or row["id"] <= up_to_audit_id]
+            entries = archived + entries
+
+    versions = []
+    state: Any = {}
+    for entry in entries:
+        if entry.get("diff"):
+            state = apply_patch(state, json.loads(entry["diff"]))
+        versions.append({
+            "audit_id": entry["id"],
+            "action": entry["action"],
+            "actor": entry["actor"],
+            "at": entry["at"].isoformat() if entry["at"] else None,
+            "state": state,
+        })
+    return versions
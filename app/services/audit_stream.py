@@ -0,0 +1,135 @@
+# app/services/audit_stream.py
+import asyncio
+import json
+import threading
+import time
+import traceback
+from collections import defaultdict, deque
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from config import settings
+
+NOTIFY_CHANNEL = "audit_log"
+# Postgres caps NOTIFY payloads at 8000 bytes
+NOTIFY_PAYLOAD_LIMIT = 7000
+
+def stream_event(entry: Dict) -> Dict:
+    """The fields pushed to live viewers for one audit entry"""
+    at = entry.get("at")
+    return {
+        "id": entry["id"],
+        "tenant_id": entry["tenant_id"],
+        "actor": entry["actor"],
+        "action": entry["action"],
+        "entity": entry["entity"],
+        "entity_id": entry["entity_id"],
+        "at": at.isoformat() if isinstance(at, datetime) else at,
+    }
+
+def notify_entries(db: Session, entries: List[Dict]) -> None:
+    """Queue NOTIFY messages for written entries; Postgres delivers them on commit"""
+    chunk: List[Dict] = []
+    size = 2
+    for event in (stream_event(e) for e in entries):
+        encoded = len(json.dumps(event)) + 1
+        if chunk and size + encoded > NOTIFY_PAYLOAD_LIMIT:
+            db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": NOTIFY_CHANNEL, "payload": json.dumps(chunk)})
+            chunk, size = [], 2
+        chunk.append(event)
+        size += encoded
+    if chunk:
+        db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": NOTIFY_CHANNEL, "payload": json.dumps(chunk)})
+
+class AuditBroadcaster:
+    """
+    Fans audit events out to every live viewer of a tenant. Events arrive once
+    per process (from the audit writer or a single LISTEN connection) and are
+    copied to subscriber queues, so N viewers never cost N database queries.
+    A short per-tenant history lets reconnecting clients resume from memory.
+    """
+
+    def __init__(self, history_size: int = 500, queue_size: int = 1000):
+        self.history_size = history_size
+        self.queue_size = queue_size
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+        self._history: Dict[str, deque] = defaultdict(lambda: deque(maxlen=self.history_size))
+        self._listener: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+
+    def publish(self, entries: List[Dict]) -> None:
+        """Thread-safe entry point for newly committed audit entries"""
+        if self._loop is None or not entries:
+            return
+        self._loop.call_soon_threadsafe(self._dispatch, [stream_event(e) for e in entries])
+
+    def _dispatch(self, events: List[Dict]) -> None:
+        for event in events:
+            tenant_id = event["tenant_id"]
+            self._history[tenant_id].append(event)
+            for queue in list(self._subscribers.get(tenant_id, ())):
+                try:
+                    queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    # A viewer that cannot keep up is disconnected and resumes via Last-Event-ID
+                    self._subscribers[tenant_id].discard(queue)
+                    queue.get_nowait()
+                    queue.put_nowait(None)
+
+    def subscribe(self, tenant_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers[tenant_id].add(queue)
+        return queue
+
+    def unsubscribe(self, tenant_id: str, queue: asyncio.Queue) -> None:
+        self._subscribers[tenant_id].discard(queue)
+
+    def recent_since(self, tenant_id: str, last_id: int) -> Optional[List[Dict]]:
+        """Events after last_id from memory, or None if the history no longer reaches back that far"""
+        history = self._history.get(tenant_id)
+        if not history or history[0]["id"] > last_id:
+            return None
+        return [event for event in history if event["id"] > last_id]
+
+    def viewer_count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    # ---------- Postgres LISTEN ----------
+
+    def start_listener(self) -> None:
+        """One LISTEN connection per process feeds every viewer (postgres backend)"""
+        if settings.AUDIT_STREAM_BACKEND != "postgres" or self._listener is not None:
+            return
+        self._stop.clear()
+        self._listener = threading.Thread(target=self._listen, name="audit-listen", daemon=True)
+        self._listener.start()
+
+    def stop_listener(self) -> None:
+        if self._listener is None:
+            return
+        self._stop.set()
+        self._listener.join(5)
+        self._listener = None
+
+    def _listen(self) -> None:
+        import psycopg
+
+        conninfo = make_url(settings.DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+        while not self._stop.is_set():
+            try:
+                with psycopg.connect(conninfo, autocommit=True) as conn:
+                    conn.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                    while not self._stop.is_set():
+                        for notify in conn.notifies(timeout=1.0):
+                            self.publish(json.loads(notify.payload))
+            except Exception:
+                traceback.print_exc()
+                time.sleep(2)
+
+audit_broadcaster = AuditBroadcaster()
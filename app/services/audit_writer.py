@@ -0,0 +1,377 @@
+# app/services/audit_writer.py
+import fcntl
+import json
+import os
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from config import settings
+from db import SessionLocal
+from models_rich import AuditLog
+from services.audit_chain import chain_entries
+from services.audit_rollup import apply_rollups
+from services.audit_stream import notify_entries
+
+AUDIT_FIELDS = ("tenant_id", "actor", "action", "entity", "entity_id", "before", "after", "diff", "at")
+
+def write_audit_entries(db: Session, entries: List[Dict]) -> List[Dict]:
+    """
+    Insert audit entries as one multi-row INSERT (batched by the driver).
+    Returns copies of the entries with their assigned ids and chain hashes, in input order.
+    """
+    if not entries:
+        return []
+    written = chain_entries(db, entries)
+    db.execute(insert(AuditLog), written)
+    if settings.AUDIT_ROLLUP_MODE == "incremental":
+        # Same transaction, so rollups never drift from the raw rows
+        apply_rollups(db, written)
+    if settings.AUDIT_STREAM_BACKEND == "postgres":
+        notify_entries(db, written)
+    return written
+
+def _encode_entry(entry: Dict) -> str:
+    data = dict(entry)
+    if isinstance(data.get("at"), datetime):
+        data["at"] = data["at"].isoformat()
+    return json.dumps(data)
+
+def _decode_entry(line: str) -> Dict:
+    data = json.loads(line)
+    if data.get("at"):
+        data["at"] = datetime.fromisoformat(data["at"])
+    return data
+
+class AuditWriter:
+    """
+    Buffers audit entries in-process and flushes them from a background thread.
+
+    mode:
+        buffered - entries are queued and written off the request path.
+        sync     - entries are written immediately on their own session.
+
+    Entries are flushed in a single multi-row INSERT when the buffer reaches
+    `batch_size` or `flush_interval` seconds have passed, whichever is first.
+
+    durability:
+        memory - entries live in memory until flushed; anything that cannot be
+                 written (buffer overflow, failed flush) is spilled to the spool
+                 directory and replayed later.
+        spool  - every entry is appended to a write-ahead spool segment before
+                 enqueue returns; the segment is deleted once its rows commit.
+
+    Every process may share the spool directory. A segment is flock()ed by
+    the process writing it until its rows commit, and replay claims a segment
+    with the same lock, so no two processes replay (or flush) the same rows.
+    Locks go away with a crashed process, whose segments are then replayed.
+    ordering:
+        strict  - a failed batch is retried until it commits, and a full buffer
+                  applies backpressure to callers instead of spilling.
+        relaxed - a failed batch is spilled and replayed later while newer
+                  entries keep flowing.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        mode: str = settings.AUDIT_WRITE_MODE,
+        batch_size: int = settings.AUDIT_FLUSH_BATCH_SIZE,
+        flush_interval: float = settings.AUDIT_FLUSH_INTERVAL_MS / 1000.0,
+        max_queue: int = settings.AUDIT_MAX_QUEUE,
+        durability: str = settings.AUDIT_DURABILITY,
+        ordering: str = settings.AUDIT_ORDERING,
+        spool_dir: str = settings.AUDIT_SPOOL_DIR,
+        spool_fsync: bool = settings.AUDIT_SPOOL_FSYNC,
+    ):
+        if mode not in ("buffered", "sync"):
+            raise ValueError(f"Unsupported audit write mode: {mode}")
+        if durability not in ("memory", "spool"):
+            raise ValueError(f"Unsupported audit durability: {durability}")
+        if ordering not in ("strict", "relaxed"):
+            raise ValueError(f"Unsupported audit ordering: {ordering}")
+
+        self.session_factory = session_factory
+        self.mode = mode
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.durability = durability
+        self.ordering = ordering
+        self.spool_dir = Path(spool_dir)
+        self.spool_fsync = spool_fsync
+
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._buffer: List[Dict] = []
+        self._segment = None
+        self._segment_path: Optional[Path] = None
+        self._held: Dict[Path, object] = {}  # closed segments still locked until their batch commits
+        self._segment_seq = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+        self._listeners = []
+        self._latencies = deque(maxlen=512)
+        self._stats = {
+            "enqueued": 0,
+            "written": 0,
+            "spilled": 0,
+            "replayed": 0,
+            "flushes": 0,
+            "flush_failures": 0,
+            "last_error": None,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running or self.mode == "sync":
+            return
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stop the flusher after draining the buffer"""
+        if not self.running:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def enqueue(self, entry: Dict) -> None:
+        """Queue an audit entry; writes directly in sync mode or when the writer is not running"""
+        entry = {field: entry.get(field) for field in AUDIT_FIELDS}
+        if entry["at"] is None:
+            entry["at"] = datetime.utcnow()
+
+        if self.mode == "sync" or not self.running:
+            self._write_now([entry])
+            return
+
+        with self._cond:
+            if self.ordering == "strict":
+                while len(self._buffer) >= self.max_queue and self.running:
+                    self._cond.wait(self.flush_interval)
+            elif len(self._buffer) >= self.max_queue:
+                self._stats["enqueued"] += 1
+                self._spill([entry])
+                return
+
+            if self.durability == "spool":
+                self._append_segment(entry)
+            self._buffer.append(entry)
+            self._stats["enqueued"] += 1
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify_all()
+
+    def add_listener(self, callback) -> None:
+        """Call `callback(entries)` with each batch once it has committed"""
+        self._listeners.append(callback)
+
+    def flush(self) -> int:
+        """Flush spooled and buffered entries now; returns the number of rows written"""
+        with self._flush_lock:
+            written = self._replay_spool()
+            entries, segment_path = self._take_batch()
+            if entries:
+                written += self._flush_batch(entries, segment_path)
+            return written
+
+    def metrics(self) -> Dict:
+        with self._cond:
+            queue_depth = len(self._buffer)
+        latencies = sorted(self._latencies)
+        spooled_segments = len(self._pending_segments()) if self.spool_dir.exists() else 0
+
+        def pct(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 2)
+
+        return {
+            "running": self.running,
+            "durability": self.durability,
+            "ordering": self.ordering,
+            "queue_depth": queue_depth,
+            "spooled_segments": spooled_segments,
+            **self._stats,
+            "flush_latency_ms": {
+                "last": round(self._latencies[-1], 2) if self._latencies else None,
+                "avg": round(sum(latencies) / len(latencies), 2) if latencies else None,
+                "p95": pct(0.95),
+                "max": round(latencies[-1], 2) if latencies else None,
+            },
+        }
+
+    # ---------- internals ----------
+
+    def _run(self) -> None:
+        while True:
+            deadline = time.monotonic() + self.flush_interval
+            with self._cond:
+                while len(self._buffer) < self.batch_size and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                stopping = self._stopping
+
+            try:
+                self.flush()
+            except Exception:
+                traceback.print_exc()
+
+            if stopping:
+                with self._cond:
+                    if not self._buffer:
+                        self._release(self._close_segment())
+                        return
+
+    def _take_batch(self):
+        with self._cond:
+            entries, self._buffer = self._buffer, []
+            segment_path = self._close_segment()
+            self._cond.notify_all()
+        return entries, segment_path
+
+    def _flush_batch(self, entries: List[Dict], segment_path: Optional[Path]) -> int:
+        attempt = 0
+        while True:
+            try:
+                self._write_now(entries)
+                if segment_path is not None:
+                    segment_path.unlink(missing_ok=True)
+                    self._release(segment_path)
+                return len(entries)
+            except Exception as e:
+                self._stats["flush_failures"] += 1
+                self._stats["last_error"] = str(e)
+                if self.ordering == "relaxed" or self._stopping:
+                    if segment_path is None:
+                        self._spill(entries)
+                    else:
+                        self._release(segment_path)  # left for replay
+                    return 0
+                # Strict ordering: hold the batch and retry with backoff
+                attempt += 1
+                time.sleep(min(5.0, self.flush_interval * (2 ** attempt)))
+
+    def _write_now(self, entries: List[Dict]) -> None:
+        start = time.perf_counter()
+        db = self.session_factory()
+        try:
+            written = write_audit_entries(db, entries)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        self._latencies.append((time.perf_counter() - start) * 1000)
+        self._stats["flushes"] += 1
+        self._stats["written"] += len(entries)
+        for callback in self._listeners:
+            try:
+                callback(written)
+            except Exception:
+                traceback.print_exc()
+
+    # ---------- spool ----------
+
+    def _next_segment_path(self) -> Path:
+        self._segment_seq += 1
+        return self.spool_dir / f"{time.time_ns():020d}-{os.getpid()}-{self._segment_seq:06d}.ndjson"
+
+    def _write_lines(self, f, entries: List[Dict]) -> None:
+        f.write("".join(_encode_entry(e) + "\n" for e in entries))
+        f.flush()
+        if self.spool_fsync:
+            os.fsync(f.fileno())
+
+    def _append_segment(self, entry: Dict) -> None:
+        if self._segment is None:
+            self._segment_path = self._next_segment_path()
+            # Locked under a name replay ignores, then renamed: replay never sees it unlocked
+            tmp_path = self._segment_path.with_suffix(".tmp")
+            self._segment = open(tmp_path, "a", encoding="utf-8")
+            fcntl.flock(self._segment, fcntl.LOCK_EX)
+            os.replace(tmp_path, self._segment_path)
+        self._write_lines(self._segment, [entry])
+
+    def _close_segment(self) -> Optional[Path]:
+        """Stop appending to the active segment; it stays locked until _release"""
+        path = self._segment_path
+        if self._segment is not None:
+            self._held[path] = self._segment
+        self._segment = None
+        self._segment_path = None
+        return path
+
+    def _release(self, path: Optional[Path]) -> None:
+        handle = self._held.pop(path, None)
+        if handle is not None:
+            handle.close()
+
+    def _spill(self, entries: List[Dict]) -> None:
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        path = self._next_segment_path()
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            self._write_lines(f, entries)
+        os.replace(tmp_path, path)  # replay only ever sees complete segments
+        self._stats["spilled"] += len(entries)
+
+    def _pending_segments(self) -> List[Path]:
+        own = {self._segment_path, *self._held}
+        return sorted(p for p in self.spool_dir.glob("*.ndjson") if p not in own)
+
+    def _claim(self, path: Path):
+        """Open and lock a segment for replay, or None if another process holds it or already replayed it"""
+        try:
+            f = open(path, encoding="utf-8")
+        except FileNotFoundError:
+            return None
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            if os.fstat(f.fileno()).st_nlink > 0:
+                return f
+        except BlockingIOError:
+            pass
+        f.close()
+        return None
+
+    def _replay_spool(self) -> int:
+        if not self.spool_dir.exists():
+            return 0
+        written = 0
+        for path in self._pending_segments():
+            f = self._claim(path)
+            if f is None:
+                continue
+            with f:
+                entries = [_decode_entry(line) for line in f if line.strip()]
+                try:
+                    self._write_now(entries)
+                except Exception as e:
+                    self._stats["flush_failures"] += 1
+                    self._stats["last_error"] = str(e)
+                    break  # keep older segments ahead of newer ones
+                path.unlink(missing_ok=True)  # while still locked, so nobody else can claim it
+            self._stats["replayed"] += len(entries)
+            written += len(entries)
+        return written
+
+audit_writer = AuditWriter()
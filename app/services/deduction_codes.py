@@ -0,0 +1,282 @@
+# app/services/deduction_codes.py
+"""
+Deduction code to plan type mapping.
+
+Each tenant maps its payroll deduction codes to a plan type (and optionally
+a plan) in deduction_code_mapping. A run loads the whole mapping into a dict
+once, so classifying a pay item is one exact lookup: MEDFLEX_FSA maps to fsa
+because someone said so, not because it happens to contain "MED". Codes
+with no mapping fall back to the tenant's plan type patterns
+(services.reconcile_rules) and are reported as unmapped.
+
+Mappings for unmapped codes are suggested from the tenant's plans, its
+existing mappings and plan type keywords in the code, with a confidence:
+
+    python -m services.deduction_codes unmapped --tenant demo-tenant-1 [--accept 0.8]
+"""
+import argparse
+import re
+from collections import Counter
+from datetime import date, timedelta
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from models_rich import DeductionCodeMapping, PayItem, Plan
+from services.reconcile_rules import CompiledRules, rules_for_tenant
+
+# Tokens that name a plan type when they make up a whole part of a code (MED_PRETAX, DCFSA-1)
+PLAN_TYPE_KEYWORDS = {
+    "medical": ("MED", "MEDICAL", "HEALTH", "HLTH", "HMO", "PPO", "HDHP"),
+    "dental": ("DENTAL", "DEN", "DNT"),
+    "vision": ("VISION", "VIS"),
+    "life": ("LIFE", "ADD", "GTL"),
+    "disability": ("DISABILITY", "DIS", "STD", "LTD"),
+    "fsa": ("FSA", "DCFSA", "LPFSA", "HCFSA", "DCAP"),
+    "hsa": ("HSA",),
+    "401k": ("401K", "401", "ROTH", "RETIRE"),
+}
+KEYWORD_PLAN_TYPES = {keyword: plan_type for plan_type, keywords in PLAN_TYPE_KEYWORDS.items() for keyword in keywords}
+
+# Confidence of each kind of evidence; the strongest per candidate wins
+CONFIDENCE = {
+    "plan_code": 0.95,        # the code is one of the tenant's plan codes
+    "plan_code_token": 0.85,  # a part of the code is one of the tenant's plan codes
+    "keyword": 0.8,           # a part of the code is a plan type keyword
+    "similar_mapping": 0.75,  # scaled by similarity to an already mapped code
+    "keyword_prefix": 0.5,    # a part of the code starts with a plan type keyword
+    "pattern": 0.4,           # the tenant's plan type patterns match
+}
+MIN_SIMILARITY = 0.6
+SUGGESTIONS = 3
+
+def code_tokens(code: str) -> List[str]:
+    return [token for token in re.split(r"[^A-Z0-9]+", code.upper()) if token]
+
+class CodeMap:
+    """A tenant's mappings for one run, with pattern fallback and a record of unmapped codes"""
+
+    def __init__(self, mappings: Dict[str, Tuple[str, Optional[int]]], rules: CompiledRules):
+        self.mappings = mappings
+        self.rules = rules
+        self.unmapped: Counter = Counter()
+
+    def plan_type(self, code: str) -> Optional[str]:
+        try:
+            return self.mappings[code][0]
+        except KeyError:
+            self.unmapped[code] += 1
+            return self.rules.plan_type(code)
+
+    def plan_id(self, code: str) -> Optional[int]:
+        """The plan a code is mapped to, if the mapping names one; enrollments must then be in that plan"""
+        mapping = self.mappings.get(code)
+        return mapping[1] if mapping else None
+
+def load_code_map(db: Session, tenant_id: str) -> CodeMap:
+    """The tenant's mappings in one query, ready for per-item lookups"""
+    rows = db.execute(
+        select(DeductionCodeMapping.code, DeductionCodeMapping.plan_type, DeductionCodeMapping.plan_id)
+        .where(DeductionCodeMapping.tenant_id == tenant_id)
+    )
+    return CodeMap({code: (plan_type, plan_id) for code, plan_type, plan_id in rows}, rules_for_tenant(db, tenant_id))
+
+def mapping_dict(mapping: DeductionCodeMapping) -> Dict:
+    return {
+        "code": mapping.code,
+        "plan_type": mapping.plan_type,
+        "plan_id": mapping.plan_id,
+        "source": mapping.source,
+        "created_by": mapping.created_by,
+        "updated_at": mapping.updated_at.isoformat() if mapping.updated_at else None,
+    }
+
+def list_mappings(db: Session, tenant_id: str) -> List[Dict]:
+    mappings = db.query(DeductionCodeMapping).filter(
+        DeductionCodeMapping.tenant_id == tenant_id
+    ).order_by(DeductionCodeMapping.code).all()
+    return [mapping_dict(mapping) for mapping in mappings]
+
+def save_mappings(db: Session, tenant_id: str, entries: List[Dict], actor: str = "demo-user", source: str = "manual") -> List[Dict]:
+    """
+    Create or replace mappings from [{"code", "plan_type", "plan_id"}]. With
+    a plan_id the plan type comes from the plan; all entries are validated
+    before any is written.
+    """
+    plan_ids = {entry.get("plan_id") for entry in entries if entry.get("plan_id") is not None}
+    plans = {
+        plan.id: plan for plan in db.query(Plan).filter(Plan.tenant_id == tenant_id, Plan.id.in_(plan_ids))
+    } if plan_ids else {}
+
+    validated = []
+    for entry in entries:
+        code, plan_type, plan_id = (entry.get("code") or "").strip(), entry.get("plan_type"), entry.get("plan_id")
+        if not code:
+            raise ValueError(f"Mapping needs a code: {entry}")
+        if plan_id is not None:
+            if plan_id not in plans:
+                raise ValueError(f"Plan {plan_id} not found for tenant {tenant_id}")
+            if plan_type and plan_type != plans[plan_id].plan_type:
+                raise ValueError(f"Plan {plan_id} is a {plans[plan_id].plan_type} plan, not {plan_type}")
+            plan_type = plans[plan_id].plan_type
+        if not plan_type:
+            raise ValueError(f"Mapping for {code} needs a plan_type or plan_id")
+        validated.append((code, plan_type, plan_id))
+
+    saved = []
+    for code, plan_type, plan_id in validated:
+        mapping = db.get(DeductionCodeMapping, (tenant_id, code))
+        if mapping is None:
+            mapping = DeductionCodeMapping(tenant_id=tenant_id, code=code)
+            db.add(mapping)
+        mapping.plan_type, mapping.plan_id, mapping.source, mapping.created_by = plan_type, plan_id, source, actor
+        saved.append(mapping)
+    db.commit()
+    return [mapping_dict(mapping) for mapping in saved]
+
+def delete_mapping(db: Session, tenant_id: str, code: str) -> bool:
+    deleted = db.query(DeductionCodeMapping).filter(
+        DeductionCodeMapping.tenant_id == tenant_id,
+        DeductionCodeMapping.code == code
+    ).delete()
+    db.commit()
+    return deleted > 0
+
+class CodeSuggester:
+    """Proposes mappings for codes, from what is known about the tenant (loaded once)"""
+
+    def __init__(self, db: Session, tenant_id: str):
+        self.rules = rules_for_tenant(db, tenant_id)
+        self.plans: Dict[str, List[Tuple[int, str]]] = {}
+        for plan_id, plan_code, plan_type in db.execute(
+            select(Plan.id, Plan.plan_code, Plan.plan_type).where(Plan.tenant_id == tenant_id, Plan.is_active == True)
+        ):
+            self.plans.setdefault(plan_code.upper(), []).append((plan_id, plan_type))
+        self.mapped = {
+            code.upper(): (code, plan_type, plan_id) for code, plan_type, plan_id in db.execute(
+                select(DeductionCodeMapping.code, DeductionCodeMapping.plan_type, DeductionCodeMapping.plan_id)
+                .where(DeductionCodeMapping.tenant_id == tenant_id)
+            )
+        }
+
+    def suggest(self, code: str, limit: int = SUGGESTIONS) -> List[Dict]:
+        """Candidate mappings for a code, most confident first"""
+        candidates: Dict[Tuple[str, Optional[int]], Dict] = {}
+
+        def propose(plan_type: str, plan_id: Optional[int], confidence: float, reason: str):
+            candidate = candidates.setdefault((plan_type, plan_id), {
+                "plan_type": plan_type, "plan_id": plan_id, "confidence": 0.0, "reasons": []
+            })
+            candidate["confidence"] = max(candidate["confidence"], round(confidence, 2))
+            candidate["reasons"].append(reason)
+
+        upper = code.upper()
+        tokens = code_tokens(code)
+        for plan_id, plan_type in self.plans.get(upper, []):
+            propose(plan_type, plan_id, CONFIDENCE["plan_code"], f"is plan code {code}")
+        for token in tokens:
+            if token != upper:
+                for plan_id, plan_type in self.plans.get(token, []):
+                    propose(plan_type, plan_id, CONFIDENCE["plan_code_token"], f"contains plan code {token}")
+            if token in KEYWORD_PLAN_TYPES:
+                propose(KEYWORD_PLAN_TYPES[token], None, CONFIDENCE["keyword"], f"contains {token}")
+            else:
+                for keyword, plan_type in KEYWORD_PLAN_TYPES.items():
+                    if len(keyword) >= 3 and token.startswith(keyword):
+                        propose(plan_type, None, CONFIDENCE["keyword_prefix"], f"{token} starts with {keyword}")
+
+        for mapped_upper, (mapped_code, plan_type, plan_id) in self.mapped.items():
+            if mapped_upper == upper:
+                continue
+            similarity = SequenceMatcher(None, upper, mapped_upper).ratio()
+            if similarity >= MIN_SIMILARITY:
+                propose(plan_type, plan_id, CONFIDENCE["similar_mapping"] * similarity, f"similar to mapped code {mapped_code}")
+
+        pattern_plan_type = self.rules.plan_type(code)
+        if pattern_plan_type:
+            propose(pattern_plan_type, None, CONFIDENCE["pattern"], "matches the tenant's plan type patterns")
+
+        # A specific plan is only worth suggesting over its bare plan type when it is as likely
+        for (plan_type, plan_id), candidate in candidates.items():
+            if plan_id is not None and (plan_type, None) in candidates:
+                bare = candidates[(plan_type, None)]
+                candidate["confidence"] = max(candidate["confidence"], bare["confidence"])
+                candidate["reasons"] += bare["reasons"]
+                bare["confidence"] = 0.0
+        ranked = [candidate for candidate in candidates.values() if candidate["confidence"] > 0]
+        ranked.sort(key=lambda candidate: (-candidate["confidence"], candidate["plan_id"] is None, candidate["plan_type"]))
+        return ranked[:limit]
+
+def unmapped_codes(db: Session, tenant_id: str, days: Optional[int] = None, suggestions: int = SUGGESTIONS) -> List[Dict]:
+    """
+    Every deduction code in the tenant's pay items without a mapping, with
+    how often it occurs, how it is classified today and suggested mappings,
+    largest dollar amount first.
+    """
+    query = (
+        select(
+            PayItem.code,
+            func.count().label("items"),
+            func.count(func.distinct(PayItem.employee_ext_id)).label("employees"),
+            func.coalesce(func.sum(func.abs(PayItem.amount)), 0.0).label("amount"),
+            func.min(PayItem.period_end).label("first_seen"),
+            func.max(PayItem.period_end).label("last_seen"),
+        )
+        .outerjoin(DeductionCodeMapping, (DeductionCodeMapping.tenant_id == PayItem.tenant_id) & (DeductionCodeMapping.code == PayItem.code))
+        .where(PayItem.tenant_id == tenant_id, DeductionCodeMapping.code.is_(None))
+        .group_by(PayItem.code)
+        .order_by(func.coalesce(func.sum(func.abs(PayItem.amount)), 0.0).desc(), PayItem.code)
+    )
+    if days:
+        query = query.where(PayItem.period_end >= date.today() - timedelta(days=days))
+
+    suggester = CodeSuggester(db, tenant_id)
+    return [
+        {
+            "code": row.code,
+            "items": row.items,
+            "employees": row.employees,
+            "amount": round(float(row.amount), 2),
+            "first_seen": row.first_seen.isoformat() if row.first_seen else None,
+            "last_seen": row.last_seen.isoformat() if row.last_seen else None,
+            "pattern_plan_type": suggester.rules.plan_type(row.code),
+            "suggestions": suggester.suggest(row.code, suggestions),
+        }
+        for row in db.execute(query)
+    ]
+
+def accept_suggestions(db: Session, tenant_id: str, min_confidence: float, actor: str = "demo-user", days: Optional[int] = None) -> List[Dict]:
+    """Map every unmapped code whose best suggestion is at least min_confidence (and not tied)"""
+    entries = []
+    for code in unmapped_codes(db, tenant_id, days, suggestions=2):
+        best = code["suggestions"][:2]
+        if not best or best[0]["confidence"] < min_confidence:
+            continue
+        if len(best) > 1 and best[1]["confidence"] == best[0]["confidence"]:
+            continue
+        entries.append({"code": code["code"], "plan_type": best[0]["plan_type"], "plan_id": best[0]["plan_id"]})
+    return save_mappings(db, tenant_id, entries, actor=actor, source="suggested") if entries else []
+
+def main():
+    parser = argparse.ArgumentParser(description="Deduction code mappings")
+    parser.add_argument("command", choices=["unmapped"])
+    parser.add_argument("--tenant", required=True)
+    parser.add_argument("--days", type=int, help="Only codes seen in pay periods ending this recently")
+    parser.add_argument("--accept", type=float, metavar="CONFIDENCE", help="Save suggestions at or above this confidence")
+    args = parser.parse_args()
+
+    from db import SessionLocal
+    db = SessionLocal()
+    try:
+        for code in unmapped_codes(db, args.tenant, args.days):
+            best = code["suggestions"][0] if code["suggestions"] else None
+            suggestion = f"{best['plan_type']} ({best['confidence']:.2f}: {'; '.join(best['reasons'])})" if best else "no suggestion"
+            print(f"{code['code']:<24} {code['items']:>7} items  ${code['amount']:>12,.2f}  now: {code['pattern_plan_type'] or '-':<10}  suggested: {suggestion}")
+        if args.accept is not None:
+            saved = accept_suggestions(db, args.tenant, args.accept, actor="cli", days=args.days)
+            print(f"Mapped {len(saved)} code(s)")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
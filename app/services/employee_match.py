@@ -0,0 +1,211 @@
+# app/services/employee_match.py
+"""
+Fuzzy matching of unresolved employee ids.
+
+A pay item whose employee_ext_id matches no employee is often a typo or a
+format change in the payroll export (EMP1001 for E-1001). Each tenant gets
+an in-memory index of its employees, built once and kept until the
+tenant's employees change. An id is looked up, from the strongest match to
+the weakest, by:
+
+- the id without case and punctuation (e1002 for E-1002), then also with
+  look-alike characters folded (E-10O3 for E-1003)
+- the number inside the id, without leading zeros (EMP01001 for E-1001)
+- every id one edit away: a missing, extra, wrong or swapped character
+  (E-1030 for E-1003), from an index of each id with one character deleted
+- trigram similarity (Dice coefficient) of ids and of full names, scored for
+  all employees at once from an inverted index with NumPy
+
+The first three are dictionary lookups; a match shared by several employees
+has its confidence divided between them. Reconciliation adds the suggestions
+to extra_deduction items and, with EMPLOYEE_AUTO_LINK, links pay items whose
+best match is confident and clearly ahead.
+"""
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from config import settings
+from models_rich import Employee
+
+# Confidence of each kind of match; the best per employee wins
+CONFIDENCE = {
+    "normalized_id": 0.98,  # same id apart from case and punctuation
+    "folded_id": 0.95,      # same id apart from look-alike characters (O/0, I/1, ...)
+    "id_number": 0.9,       # same number, different prefix
+    "one_edit": 0.85,       # one character missing, extra, wrong or swapped
+    "id_trigram": 0.9,      # scaled by trigram similarity of the ids
+    "name_trigram": 0.85,   # scaled by trigram similarity of the names
+}
+LOOK_ALIKES = str.maketrans("OQDILZSB", "00011258")
+MIN_SIMILARITY = 0.4  # trigram similarity below this is not a match
+SUGGESTIONS = 3
+AUTO_LINK_MARGIN = 0.1  # the best match must lead the next by this much to be linked
+
+def normalize_id(employee_ext_id: str) -> str:
+    return re.sub(r"[^A-Z0-9]", "", employee_ext_id.upper())
+
+def id_number(employee_ext_id: str) -> Optional[str]:
+    digits = "".join(re.findall(r"\d+", employee_ext_id))
+    return digits.lstrip("0") or ("0" if digits else None)
+
+def deletions(text: str) -> set:
+    return {text[:i] + text[i + 1:] for i in range(len(text))}
+
+def one_edit_apart(a: str, b: str) -> bool:
+    """True if a and b differ by one insertion, deletion, substitution or adjacent swap"""
+    if abs(len(a) - len(b)) > 1 or a == b:
+        return False
+    prefix = 0
+    while prefix < min(len(a), len(b)) and a[prefix] == b[prefix]:
+        prefix += 1
+    if len(a) == len(b):
+        return a[prefix + 1:] == b[prefix + 1:] or (
+            a[prefix:prefix + 2] == b[prefix:prefix + 2][::-1] and a[prefix + 2:] == b[prefix + 2:]
+        )
+    shorter, longer = (a, b) if len(a) < len(b) else (b, a)
+    return shorter[prefix:] == longer[prefix + 1:]
+
+def trigrams(text: str) -> frozenset:
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+class _TrigramIndex:
+    """Inverted trigram index that scores a query against every entry at once"""
+
+    def __init__(self, texts: List[str]):
+        postings: Dict[str, List[int]] = {}
+        sizes = []
+        for i, text in enumerate(texts):
+            grams = trigrams(text)
+            sizes.append(len(grams))
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+        self.sizes = np.array(sizes, dtype=np.float64)
+
+    def similar(self, text: str, min_similarity: float, limit: int) -> List[Tuple[int, float]]:
+        """Entries whose Dice coefficient with text is at least min_similarity, best first"""
+        grams = trigrams(text)
+        hits = [self.postings[gram] for gram in grams if gram in self.postings]
+        if not hits:
+            return []
+        shared = np.bincount(np.concatenate(hits), minlength=len(self.sizes))
+        dice = 2 * shared / (len(grams) + self.sizes)
+        best = np.flatnonzero(dice >= min_similarity)
+        if len(best) > limit:
+            best = best[np.argpartition(-dice[best], limit - 1)[:limit]]
+        return [(int(i), float(dice[i])) for i in best]
+
+class EmployeeMatchIndex:
+    """One tenant's employees, indexed for fuzzy lookups by id or name"""
+
+    def __init__(self, employees: List[Tuple[int, str, str, str, bool]]):
+        self.employees = employees
+        self.normalized = [normalize_id(employee_ext_id) for _, employee_ext_id, _, _, _ in employees]
+        self.by_normalized: Dict[str, List[int]] = {}
+        self.by_folded: Dict[str, List[int]] = {}
+        self.by_number: Dict[str, List[int]] = {}
+        self.by_deletion: Dict[str, List[int]] = {}
+        for i, normalized in enumerate(self.normalized):
+            self.by_normalized.setdefault(normalized, []).append(i)
+            self.by_folded.setdefault(normalized.translate(LOOK_ALIKES), []).append(i)
+            number = id_number(normalized)
+            if number:
+                self.by_number.setdefault(number, []).append(i)
+            for key in deletions(normalized) | {normalized}:
+                self.by_deletion.setdefault(key, []).append(i)
+        self.ids = _TrigramIndex(self.normalized)
+        self.names = _TrigramIndex([f"{first_name} {last_name}".upper() for _, _, first_name, last_name, _ in employees])
+
+    def __len__(self) -> int:
+        return len(self.employees)
+
+    def suggest(self, query: str, limit: int = SUGGESTIONS) -> List[Dict]:
+        """Employees that an unresolved id (or a name) may refer to, most confident first"""
+        scores: Dict[int, Tuple[float, str]] = {}
+
+        def score(matches: List[int], confidence: float, reason: str):
+            for i in matches:
+                if confidence / len(matches) > scores.get(i, (0.0, ""))[0]:
+                    scores[i] = (round(confidence / len(matches), 3), reason)
+
+        normalized = normalize_id(query)
+        if normalized:
+            score(self.by_normalized.get(normalized, []), CONFIDENCE["normalized_id"], "same id apart from case and punctuation")
+            score(self.by_folded.get(normalized.translate(LOOK_ALIKES), []), CONFIDENCE["folded_id"], "same id apart from look-alike characters")
+            number = id_number(normalized)
+            if number:
+                score(self.by_number.get(number, []), CONFIDENCE["id_number"], f"same number {number}")
+            neighbours = {i for key in deletions(normalized) | {normalized} for i in self.by_deletion.get(key, ())}
+            score([i for i in neighbours if one_edit_apart(normalized, self.normalized[i])], CONFIDENCE["one_edit"], "one character apart")
+            for i, similarity in self.ids.similar(normalized, MIN_SIMILARITY, limit):
+                score([i], CONFIDENCE["id_trigram"] * similarity, f"similar id ({similarity:.2f})")
+        for i, similarity in self.names.similar(" ".join(query.upper().split()), MIN_SIMILARITY, limit):
+            score([i], CONFIDENCE["name_trigram"] * similarity, f"similar name ({similarity:.2f})")
+
+        ranked = sorted(scores.items(), key=lambda entry: (-entry[1][0], not self.employees[entry[0]][4], entry[0]))
+        suggestions = []
+        for i, (confidence, reason) in ranked[:limit]:
+            employee_id, employee_ext_id, first_name, last_name, is_active = self.employees[i]
+            suggestions.append({
+                "employee_id": employee_id,
+                "employee_ext_id": employee_ext_id,
+                "name": f"{first_name} {last_name}",
+                "is_active": is_active,
+                "confidence": confidence,
+                "reason": reason,
+            })
+        return suggestions
+
+    def link(self, query: str, threshold: float = settings.EMPLOYEE_AUTO_LINK_THRESHOLD) -> Optional[Dict]:
+        """The match to link an id to: confident, and clearly ahead of the next"""
+        suggestions = self.suggest(query, 2)
+        if not suggestions or suggestions[0]["confidence"] < threshold:
+            return None
+        if len(suggestions) > 1 and suggestions[0]["confidence"] - suggestions[1]["confidence"] < AUTO_LINK_MARGIN:
+            return None
+        return suggestions[0]
+
+class EmployeeIndexCache:
+    """Indexes by tenant, rebuilt when the tenant's employees change"""
+
+    def __init__(self, max_tenants: int = 64):
+        self.max_tenants = max_tenants
+        self._indexes: "OrderedDict[str, Tuple[Tuple, EmployeeMatchIndex]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _signature(db: Session, tenant_id: str) -> Tuple:
+        # Cheap to read on every lookup; inserts, deletes and ORM updates (updated_at) change it
+        return tuple(db.execute(
+            select(func.count(), func.max(Employee.id), func.max(Employee.updated_at))
+            .where(Employee.tenant_id == tenant_id)
+        ).one())
+
+    def index(self, db: Session, tenant_id: str) -> EmployeeMatchIndex:
+        signature = self._signature(db, tenant_id)
+        with self._lock:
+            cached = self._indexes.get(tenant_id)
+            if cached is not None and cached[0] == signature:
+                self._indexes.move_to_end(tenant_id)
+                return cached[1]
+        index = EmployeeMatchIndex(db.execute(
+            select(Employee.id, Employee.employee_ext_id, Employee.first_name, Employee.last_name, Employee.is_active)
+            .where(Employee.tenant_id == tenant_id)
+            .order_by(Employee.id)
+        ).all())
+        with self._lock:
+            self._indexes[tenant_id] = (signature, index)
+            self._indexes.move_to_end(tenant_id)
+            while len(self._indexes) > self.max_tenants:
+                self._indexes.popitem(last=False)
+        return index
+
+employee_index_cache = EmployeeIndexCache()
+
+def employee_index(db: Session, tenant_id: str) -> EmployeeMatchIndex:
+    return employee_index_cache.index(db, tenant_id)
@@ -0,0 +1,75 @@
+# app/services/insight_memo.py
+"""
+Memoized LLM insights, keyed by a fingerprint of the prompt and model.
+
+Runs with the same issue counts, dollar impact and summary get the same
+prompt, so the LLM's answer for one is reused for the next instead of
+calling the model again. Entries expire after INSIGHT_MEMO_TTL_S and the
+least recently used are evicted beyond INSIGHT_MEMO_MAX_ENTRIES.
+"""
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from config import settings
+from models_rich import InsightMemo
+
+def canonical_inputs(stats: Dict, run_summary: str) -> Tuple[Dict, str]:
+    """Stats and run summary in a stable form: causes ordered by count then name, amounts to the cent"""
+    stats = dict(
+        stats,
+        top_causes=dict(sorted(stats["top_causes"].items(), key=lambda kv: (-kv[1], kv[0]))),
+        total_impact=round(float(stats["total_impact"] or 0), 2),
+    )
+    try:
+        run_summary = json.dumps(json.loads(run_summary), sort_keys=True)
+    except (TypeError, ValueError):
+        pass
+    return stats, run_summary
+
+def insight_fingerprint(prompt: str, model: str) -> str:
+    return hashlib.sha256(f"{model}\n{prompt}".encode()).hexdigest()
+
+def lookup_insights(db: Session, fingerprint: str, ttl_s: float = settings.INSIGHT_MEMO_TTL_S) -> Optional[Dict]:
+    """Memoized insights for a fingerprint, unless expired; a hit refreshes its LRU position"""
+    memo = db.get(InsightMemo, fingerprint)
+    if memo is None:
+        return None
+    now = datetime.utcnow()
+    if ttl_s > 0 and memo.created_at < now - timedelta(seconds=ttl_s):
+        db.delete(memo)
+        db.commit()
+        return None
+    memo.hits += 1
+    memo.last_used_at = now
+    db.commit()
+    return memo.insights
+
+def store_insights(
+    db: Session,
+    fingerprint: str,
+    model: str,
+    insights: Dict,
+    max_entries: int = settings.INSIGHT_MEMO_MAX_ENTRIES,
+) -> None:
+    """Remember LLM insights (never fallbacks) and evict the least recently used beyond max_entries"""
+    now = datetime.utcnow()
+    stmt = pg_insert(InsightMemo).values(
+        fingerprint=fingerprint,
+        model=model,
+        insights=insights,
+        hits=0,
+        created_at=now,
+        last_used_at=now,
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["fingerprint"],
+        set_={"insights": stmt.excluded.insights, "created_at": now, "last_used_at": now},
+    ))
+    if max_entries > 0 and db.scalar(select(func.count()).select_from(InsightMemo)) > max_entries:
+        stale = select(InsightMemo.fingerprint).order_by(InsightMemo.last_used_at.desc()).offset(max_entries)
+        db.execute(delete(InsightMemo).where(InsightMemo.fingerprint.in_(stale)))
+    db.commit()
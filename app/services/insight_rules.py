@@ -0,0 +1,189 @@
+# app/services/insight_rules.py
+"""
+Deterministic insights for a reconciliation run.
+
+Issue types are ranked by dollar impact, the deduction codes and employees
+behind most of it are picked out, and the run is compared with the tenant's
+recent runs. A risk level follows from fixed thresholds, so the same run
+always gets the same assessment, in milliseconds and without an LLM. The
+LLM (when enabled) only rewrites the suggestions.
+"""
+from statistics import mean, pstdev
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+from config import settings
+from models_rich import ReconciliationItem, ReconciliationRun
+from services.run_stats import run_stats
+
+TOP_N = 5
+
+# Share of a run's items with issues at or above which the risk level applies
+ISSUE_RATE_THRESHOLDS = (("Critical", 0.25), ("High", 0.10), ("Medium", 0.02))
+# Impact as a multiple of the tenant's baseline impact at or above which the risk level applies
+BASELINE_RATIO_THRESHOLDS = (("Critical", 3.0), ("High", 2.0), ("Medium", 1.25))
+# Below this the dollar impact alone never raises the level above Medium
+MIN_MATERIAL_IMPACT = 500.0
+RISK_ORDER = ("Low", "Medium", "High", "Critical")
+
+FIX_TEMPLATES = {
+    "missing_coverage": "Enroll the {employees} employee(s) with deductions but no active coverage, or stop those deductions ({impact}{codes})",
+    "mismatch_pct": "Correct contribution percentages for {employees} employee(s) whose payroll differs from their election ({impact}{codes})",
+    "extra_deduction": "Map or remove deductions that match no plan or employee for {employees} employee(s) ({impact}{codes})",
+    "amount_anomaly": "Confirm amounts far from their usual deduction for {employees} employee(s) before approving ({impact}{codes})",
+}
+
+def _money(amount: float) -> str:
+    return f"${amount:,.2f}"
+
+def _impact():
+    return func.coalesce(func.sum(func.abs(ReconciliationItem.amount)), 0.0)
+
+def _has_issue():
+    return ReconciliationItem.issue_type != "ok"
+
+def rank_issue_types(db: Session, run_id: int) -> Tuple[int, List[Dict]]:
+    """Total items in the run, and its issue types ordered by dollar impact"""
+    stats = run_stats(db, [run_id])[run_id]
+    ranked = sorted(
+        (
+            {"issue_type": issue_type, "items": counts["items"], "impact": round(counts["impact"], 2), "employees": counts["employees"]}
+            for issue_type, counts in stats["issue_types"].items() if issue_type != "ok"
+        ),
+        key=lambda issue: (-issue["impact"], -issue["items"], issue["issue_type"]),
+    )
+    return stats["items"], ranked
+
+def top_contributors(db: Session, run_id: int, column, limit: int = TOP_N) -> List[Dict]:
+    """Values of `column` (deduction code, employee) behind the most issue dollars"""
+    key = func.coalesce(column, "UNKNOWN")
+    rows = db.execute(
+        select(key.label("key"), func.count().label("items"), _impact().label("impact"))
+        .where(ReconciliationItem.run_id == run_id, _has_issue())
+        .group_by(key)
+        .order_by(_impact().desc(), func.count().desc(), key)
+        .limit(limit)
+    ).all()
+    return [{"key": row.key, "items": row.items, "impact": round(float(row.impact), 2)} for row in rows]
+
+def tenant_baseline(db: Session, run: ReconciliationRun, runs: int = settings.INSIGHTS_BASELINE_RUNS) -> Optional[Dict]:
+    """Issue rate and impact over the tenant's previous runs (None without history)"""
+    previous = (
+        select(ReconciliationRun.id)
+        .where(ReconciliationRun.tenant_id == run.tenant_id, ReconciliationRun.id < run.id)
+        .order_by(ReconciliationRun.id.desc())
+        .limit(runs)
+    )
+    rows = db.execute(
+        select(
+            ReconciliationItem.run_id,
+            func.count().label("items"),
+            func.sum(case((_has_issue(), 1), else_=0)).label("issues"),
+            func.coalesce(func.sum(case((_has_issue(), func.abs(ReconciliationItem.amount)), else_=0.0)), 0.0).label("impact"),
+        )
+        .where(ReconciliationItem.run_id.in_(previous))
+        .group_by(ReconciliationItem.run_id)
+    ).all()
+    if not rows:
+        return None
+    rates = [row.issues / row.items for row in rows if row.items]
+    impacts = [float(row.impact) for row in rows]
+    return {
+        "runs": len(rows),
+        "issue_rate": round(mean(rates), 4) if rates else 0.0,
+        "impact": round(mean(impacts), 2),
+        "impact_stdev": round(pstdev(impacts), 2),
+    }
+
+def assess_risk(issue_rate: float, impact: float, issues: List[Dict], baseline: Optional[Dict]) -> Tuple[str, List[str]]:
+    """Risk level and the reasons for it"""
+    level, reasons = "Low", []
+
+    def raise_to(candidate: str, reason: str) -> None:
+        nonlocal level
+        reasons.append(reason)
+        if RISK_ORDER.index(candidate) > RISK_ORDER.index(level):
+            level = candidate
+
+    for candidate, threshold in ISSUE_RATE_THRESHOLDS:
+        if issue_rate >= threshold:
+            raise_to(candidate, f"{issue_rate:.0%} of items have issues")
+            break
+    if baseline and baseline["impact"] > 0:
+        ratio = impact / baseline["impact"]
+        for candidate, threshold in BASELINE_RATIO_THRESHOLDS:
+            if ratio >= threshold:
+                if impact < MIN_MATERIAL_IMPACT:
+                    candidate = min(candidate, "Medium", key=RISK_ORDER.index)
+                raise_to(candidate, f"impact is {ratio:.1f}x the baseline of {_money(baseline['impact'])}")
+                break
+    if any(issue["issue_type"] == "missing_coverage" for issue in issues) and level == "Low":
+        raise_to("Medium", "employees are paying for coverage they do not have")
+    return level, reasons
+
+def analyze_run(db: Session, run: ReconciliationRun) -> Dict:
+    """The full deterministic analysis of one run"""
+    total, issues = rank_issue_types(db, run.id)
+    issue_items = sum(issue["items"] for issue in issues)
+    impact = round(sum(issue["impact"] for issue in issues), 2)
+    issue_rate = issue_items / total if total else 0.0
+    baseline = tenant_baseline(db, run)
+    risk_level, reasons = assess_risk(issue_rate, impact, issues, baseline)
+    return {
+        "items": total,
+        "issue_items": issue_items,
+        "issue_rate": round(issue_rate, 4),
+        "issue_impact": impact,
+        "issues_by_impact": issues,
+        "top_codes": top_contributors(db, run.id, ReconciliationItem.code),
+        "top_employees": top_contributors(db, run.id, ReconciliationItem.employee_ext_id),
+        "baseline": baseline,
+        "risk_level": risk_level,
+        "risk_reasons": reasons,
+    }
+
+def _codes_for(db: Session, run_id: int, issue_type: str) -> str:
+    codes = db.execute(
+        select(ReconciliationItem.code)
+        .where(ReconciliationItem.run_id == run_id, ReconciliationItem.issue_type == issue_type, ReconciliationItem.code.is_not(None))
+        .group_by(ReconciliationItem.code)
+        .order_by(_impact().desc())
+        .limit(3)
+    ).scalars().all()
+    return f"; codes {', '.join(codes)}" if codes else ""
+
+def rule_insights(db: Session, run: ReconciliationRun, analysis: Dict) -> Dict:
+    """Suggested fixes, priority actions and risk assessment written from the analysis"""
+    fixes = []
+    for issue in analysis["issues_by_impact"]:
+        template = FIX_TEMPLATES.get(issue["issue_type"], "Review the {items} {issue_type} item(s) for {employees} employee(s) ({impact}{codes})")
+        fixes.append(template.format(
+            items=issue["items"],
+            issue_type=issue["issue_type"],
+            employees=issue["employees"],
+            impact=_money(issue["impact"]),
+            codes=_codes_for(db, run.id, issue["issue_type"]),
+        ))
+
+    actions = []
+    if analysis["issues_by_impact"]:
+        top = analysis["issues_by_impact"][0]
+        actions.append(f"Resolve {top['issue_type']} first: {top['items']} item(s), {_money(top['impact'])} of {_money(analysis['issue_impact'])}")
+    if analysis["top_employees"]:
+        employee = analysis["top_employees"][0]
+        actions.append(f"Review employee {employee['key']}: {_money(employee['impact'])} across {employee['items']} issue(s)")
+    if analysis["top_codes"]:
+        code = analysis["top_codes"][0]
+        actions.append(f"Check the plan mapping for deduction code {code['key']}: {_money(code['impact'])} across {code['items']} issue(s)")
+    baseline = analysis["baseline"]
+    if baseline and analysis["risk_level"] in ("High", "Critical"):
+        actions.append(f"Compare with recent runs: baseline issue rate {baseline['issue_rate']:.0%} over {baseline['runs']} run(s)")
+    if not actions:
+        actions.append("No issues found; the run can be approved")
+
+    reasons = "; ".join(analysis["risk_reasons"]) or "no material issues"
+    return {
+        "suggested_fixes": fixes,
+        "priority_actions": actions,
+        "risk_assessment": f"{analysis['risk_level']} - {reasons}",
+    }
@@ -0,0 +1,145 @@
+# app/services/insight_worker.py
+import asyncio
+import threading
+import time
+import traceback
+from typing import Dict, Optional, Tuple
+from sqlalchemy.orm import Session
+from config import settings
+from models_rich import ReconciliationRun
+from services.insight_memo import lookup_insights, store_insights
+from services.insights import apply_llm_enrichment, compute_reconciliation_stats, create_rule_insights, generate_llm_insights, insight_prompt
+from services.llm import llm_client
+
+class InsightWorker:
+    """
+    Enriches reconciliation insights with the LLM off the request path, as
+    tasks on the API's event loop. Jobs are single-flight per run: submitting
+    a run that is already queued or running returns the existing job.
+    Finished jobs are dropped, since the insights row itself marks a run as
+    enriched.
+    """
+
+    def __init__(self, session_factory=None, concurrency: int = settings.INSIGHTS_CONCURRENCY):
+        self.session_factory = session_factory
+        self.concurrency = max(1, concurrency)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._jobs: Dict[Tuple[str, int], Dict] = {}
+        self._tasks = set()
+        self._lock = threading.Lock()
+        self._stats = {"submitted": 0, "deduplicated": 0, "completed": 0, "failed": 0, "memo_hits": 0}
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._slots = asyncio.Semaphore(self.concurrency)
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Give running jobs a moment to finish; queued runs are regenerated on the next request"""
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=timeout)
+        for task in list(self._tasks):
+            task.cancel()
+        self._loop = None
+
+    def submit(self, tenant_id: str, run_id: int) -> Optional[Dict]:
+        """
+        Queue insight generation for a run (thread-safe). Returns the job's
+        status, or None when no event loop is attached (scripts, shells).
+        """
+        if self._loop is None:
+            return None
+        key = (tenant_id, run_id)
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job["status"] in ("queued", "running"):
+                self._stats["deduplicated"] += 1
+                return dict(job)
+            job = {"run_id": run_id, "status": "queued", "queued_at": time.time(), "error": None}
+            self._jobs[key] = job
+            self._stats["submitted"] += 1
+        self._loop.call_soon_threadsafe(self._spawn, key, job)
+        return dict(job)
+
+    def status(self, tenant_id: str, run_id: int) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get((tenant_id, run_id))
+            return dict(job) if job else None
+
+    def clear_failed(self, tenant_id: str, run_id: int) -> None:
+        with self._lock:
+            job = self._jobs.get((tenant_id, run_id))
+            if job is not None and job["status"] == "failed":
+                del self._jobs[(tenant_id, run_id)]
+
+    def _spawn(self, key: Tuple[str, int], job: Dict) -> None:
+        task = asyncio.ensure_future(self._run(key, job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, key: Tuple[str, int], job: Dict) -> None:
+        async with self._slots:
+            job["status"] = "running"
+            job["started_at"] = time.time()
+            try:
+                await self._generate(*key)
+            except Exception as e:
+                traceback.print_exc()
+                with self._lock:
+                    job.update(status="failed", error=str(e))
+                    self._stats["failed"] += 1
+                return
+            with self._lock:
+                self._jobs.pop(key, None)
+                self._stats["completed"] += 1
+
+    async def _generate(self, tenant_id: str, run_id: int) -> None:
+        loaded = await asyncio.to_thread(self._with_session, self._load, tenant_id, run_id)
+        if loaded is None:
+            return  # already enriched
+        stats, run_summary = loaded
+        prompt, fingerprint = insight_prompt(stats, run_summary)
+        llm_insights = await asyncio.to_thread(self._with_session, lookup_insights, fingerprint)
+        if llm_insights is None:
+            llm_insights = await generate_llm_insights(prompt)
+            await asyncio.to_thread(self._with_session, store_insights, fingerprint, llm_client.model, llm_insights)
+        else:
+            self._stats["memo_hits"] += 1
+        await asyncio.to_thread(self._with_session, apply_llm_enrichment, run_id, llm_insights)
+
+    @staticmethod
+    def _load(db: Session, tenant_id: str, run_id: int):
+        run = db.query(ReconciliationRun).filter(
+            ReconciliationRun.id == run_id,
+            ReconciliationRun.tenant_id == tenant_id
+        ).first()
+        if not run:
+            raise ValueError(f"Reconciliation run {run_id} not found")
+        if create_rule_insights(db, run).llm_enriched:
+            return None
+        return compute_reconciliation_stats(db, run_id, tenant_id), run.summary or "{}"
+
+    def _with_session(self, fn, *args):
+        if self.session_factory is None:
+            from db import SessionLocal
+            self.session_factory = SessionLocal
+        db = self.session_factory()
+        try:
+            return fn(db, *args)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            states = [job["status"] for job in self._jobs.values()]
+        return {
+            "concurrency": self.concurrency,
+            "queued": states.count("queued"),
+            "running": states.count("running"),
+            **self._stats,
+        }
+
+insight_worker = InsightWorker()
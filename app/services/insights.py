@@ -1,56 +1,32 @@
 # app/services/insights.py
 import json
-from collections import defaultdict
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import func, distinct
-from models_rich import ReconciliationItem, ReconciliationInsights, ReconciliationRun
-from openai import OpenAI
-import os
+from sqlalchemy import text
+from models_rich import ReconciliationInsights, ReconciliationRun
+from services.insight_rules import analyze_run, rule_insights
+from services.run_stats import run_stats
+from services.insight_memo import canonical_inputs, insight_fingerprint, lookup_insights
+from services.llm import llm_client
 
 def compute_reconciliation_stats(db: Session, run_id: int, tenant_id: str) -> Dict:
     """Compute statistics for a reconciliation run"""
+    stats = run_stats(db, [run_id])[run_id]
     
-    # Get all items for this run
-    items = db.query(ReconciliationItem).filter(
-        ReconciliationItem.run_id == run_id
-    ).all()
-    
-    if not items:
-        return {
-            "top_causes": {},
-            "total_impact": 0.0,
-            "affected_employees": 0
-        }
-    
-    # Count by issue type
-    issue_counts = defaultdict(int)
-    total_impact = 0.0
-    affected_employees = set()
-    
-    for item in items:
-        issue_counts[item.issue_type] += 1
-        if item.amount:
-            total_impact += abs(item.amount)
-        affected_employees.add(item.employee_ext_id)
-    
-    # Convert to sorted list for LLM
-    top_causes = dict(sorted(issue_counts.items(), key=lambda x: x[1], reverse=True))
+    # Sorted by count for the LLM
+    top_causes = dict(sorted(
+        ((issue_type, counts["items"]) for issue_type, counts in stats["issue_types"].items()),
+        key=lambda x: x[1], reverse=True
+    ))
     
     return {
         "top_causes": top_causes,
-        "total_impact": total_impact,
-        "affected_employees": len(affected_employees)
+        "total_impact": stats["impact"],
+        "affected_employees": stats["employees"]
     }
 
-def generate_llm_insights(stats: Dict, run_summary: str) -> Dict:
-    """Generate insights using LLM analysis"""
-    
-    client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-    model = os.environ.get("LLM_MODEL", "gpt-4o-mini")
-    
-    # Create prompt for LLM analysis
-    prompt = f"""
+def build_insights_prompt(stats: Dict, run_summary: str) -> str:
+    return f"""
     Analyze this reconciliation run and provide actionable insights:
     
     STATISTICS:
@@ -80,84 +56,79 @@ def generate_llm_insights(stats: Dict, run_summary: str) -> Dict:
     
     Be concise but specific. Focus on business impact and actionable steps.
     """
-    
+
+def parse_llm_insights(content: str) -> Dict:
+    """Pull the JSON object out of an LLM reply, or wrap the text if there is none"""
+    fallback = {
+        "suggested_fixes": [content],
+        "priority_actions": ["Review the reconciliation results manually"],
+        "risk_assessment": "Medium - Requires manual review"
+    }
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.3
-        )
-        
-        # Parse LLM response
-        content = response.choices[0].message.content.strip()
-        
-        # Try to extract JSON from response
-        try:
-            # Look for JSON in the response
-            start_idx = content.find('{')
-            end_idx = content.rfind('}') + 1
-            if start_idx != -1 and end_idx != 0:
-                json_str = content[start_idx:end_idx]
-                insights = json.loads(json_str)
-            else:
-                # Fallback: parse as text
-                insights = {
-                    "suggested_fixes": [content],
-                    "priority_actions": ["Review the reconciliation results manually"],
-                    "risk_assessment": "Medium - Requires manual review"
-                }
-        except json.JSONDecodeError:
-            # Fallback: parse as text
-            insights = {
-                "suggested_fixes": [content],
-                "priority_actions": ["Review the reconciliation results manually"],
-                "risk_assessment": "Medium - Requires manual review"
-            }
-        
-        return insights
-        
-    except Exception as e:
-        # Fallback if LLM fails
-        return {
-            "suggested_fixes": [
-                "Review missing coverage issues",
-                "Check percentage mismatches",
-                "Verify employee enrollments"
-            ],
-            "priority_actions": [
-                "Address missing coverage issues first",
-                "Review high-dollar discrepancies",
-                "Validate employee data"
-            ],
-            "risk_assessment": f"Medium - LLM analysis failed: {str(e)}"
-        }
+        # Look for JSON in the response
+        start_idx = content.find('{')
+        end_idx = content.rfind('}') + 1
+        if start_idx != -1 and end_idx != 0:
+            return json.loads(content[start_idx:end_idx])
+        return fallback
+    except json.JSONDecodeError:
+        return fallback
 
-def create_reconciliation_insights(db: Session, run_id: int, tenant_id: str) -> ReconciliationInsights:
-    """Create insights for a reconciliation run"""
-    
-    # Get the run
-    run = db.query(ReconciliationRun).filter(
-        ReconciliationRun.id == run_id,
-        ReconciliationRun.tenant_id == tenant_id
+def insight_prompt(stats: Dict, run_summary: str) -> Tuple[str, str]:
+    """The LLM prompt for a run's stats, and its memo fingerprint"""
+    stats, run_summary = canonical_inputs(stats, run_summary)
+    prompt = build_insights_prompt(stats, run_summary)
+    return prompt, insight_fingerprint(prompt, llm_client.model)
+
+async def generate_llm_insights(prompt: str) -> Dict:
+    """Generate insights using LLM analysis; errors propagate, the rules-based insights stand in"""
+    content = await llm_client.complete(prompt, temperature=0.3)
+    return parse_llm_insights(content)
+
+def create_rule_insights(db: Session, run: ReconciliationRun) -> ReconciliationInsights:
+    """Create a run's rules-based insights (no LLM), unless it already has insights"""
+    existing_insights = db.query(ReconciliationInsights).filter(
+        ReconciliationInsights.run_id == run.id
     ).first()
+    if existing_insights:
+        return existing_insights
     
-    if not run:
-        raise ValueError(f"Reconciliation run {run_id} not found")
+    stats = compute_reconciliation_stats(db, run.id, run.tenant_id)
+    analysis = analyze_run(db, run)
+    return save_reconciliation_insights(db, run.id, run.tenant_id, stats, rule_insights(db, run, analysis), analysis)
+
+def enrich_from_memo(db: Session, run: ReconciliationRun) -> bool:
+    """Enrich a run's insights right away if the same prompt was answered before"""
+    stats = compute_reconciliation_stats(db, run.id, run.tenant_id)
+    _, fingerprint = insight_prompt(stats, run.summary or "{}")
+    memo = lookup_insights(db, fingerprint)
+    if memo is None:
+        return False
+    apply_llm_enrichment(db, run.id, memo)
+    return True
+
+def save_reconciliation_insights(
+    db: Session,
+    run_id: int,
+    tenant_id: str,
+    stats: Dict,
+    insights_text: Dict,
+    details: Optional[Dict] = None,
+) -> ReconciliationInsights:
+    """Store insights for a run, unless another process stored them first"""
+    
+    if db.bind.dialect.name == "postgresql":
+        # Serializes writers for this run across API processes until commit
+        db.execute(text("SELECT pg_advisory_xact_lock(hashtext('reconciliation_insights'), :run_id)"), {"run_id": run_id})
     
-    # Check if insights already exist
     existing_insights = db.query(ReconciliationInsights).filter(
         ReconciliationInsights.run_id == run_id
     ).first()
     
     if existing_insights:
+        db.commit()
         return existing_insights
     
-    # Compute statistics
-    stats = compute_reconciliation_stats(db, run_id, tenant_id)
-    
-    # Generate LLM insights
-    llm_insights = generate_llm_insights(stats, run.summary or "{}")
-    
     # Create insights record
     insights = ReconciliationInsights(
         run_id=run_id,
@@ -165,9 +136,11 @@ def create_reconciliation_insights(db: Session, run_id: int, tenant_id: str) ->
         top_causes=json.dumps(stats['top_causes']),
         total_impact=stats['total_impact'],
         affected_employees=stats['affected_employees'],
-        suggested_fixes=json.dumps(llm_insights.get('suggested_fixes', [])),
-        priority_actions=json.dumps(llm_insights.get('priority_actions', [])),
-        risk_assessment=llm_insights.get('risk_assessment', 'Medium')
+        suggested_fixes=json.dumps(insights_text.get('suggested_fixes', [])),
+        priority_actions=json.dumps(insights_text.get('priority_actions', [])),
+        risk_assessment=insights_text.get('risk_assessment', 'Medium'),
+        details=details,
+        llm_enriched=False
     )
     
     db.add(insights)
@@ -176,6 +149,27 @@ def create_reconciliation_insights(db: Session, run_id: int, tenant_id: str) ->
     
     return insights
 
+def apply_llm_enrichment(db: Session, run_id: int, llm_insights: Dict) -> Optional[ReconciliationInsights]:
+    """
+    Replace a run's rules-based suggestions with the LLM's. The risk
+    assessment stays rules-based; the LLM's is kept alongside in details.
+    """
+    insights = db.query(ReconciliationInsights).filter(
+        ReconciliationInsights.run_id == run_id
+    ).with_for_update().first()
+    
+    if not insights or insights.llm_enriched:
+        db.commit()
+        return insights
+    
+    insights.suggested_fixes = json.dumps(llm_insights.get('suggested_fixes', []))
+    insights.priority_actions = json.dumps(llm_insights.get('priority_actions', []))
+    insights.details = dict(insights.details or {}, llm_risk_assessment=llm_insights.get('risk_assessment'))
+    insights.llm_enriched = True
+    db.commit()
+    
+    return insights
+
 def get_reconciliation_insights(db: Session, run_id: int, tenant_id: str) -> Optional[Dict]:
     """Get insights for a reconciliation run"""
     
@@ -196,5 +190,8 @@ def get_reconciliation_insights(db: Session, run_id: int, tenant_id: str) -> Opt
         "suggested_fixes": json.loads(insights.suggested_fixes) if insights.suggested_fixes else [],
         "priority_actions": json.loads(insights.priority_actions) if insights.priority_actions else [],
         "risk_assessment": insights.risk_assessment,
+        "risk_level": (insights.details or {}).get("risk_level"),
+        "details": insights.details or {},
+        "llm_enriched": insights.llm_enriched,
         "created_at": insights.created_at.isoformat() if insights.created_at else None
     }
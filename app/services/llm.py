@@ -0,0 +1,324 @@
+# app/services/llm.py
+"""
+Async LLM client shared by the API process.
+
+Completions come from a provider (LLM_PROVIDER): OpenAI, or a local
+deterministic stand-in for development and load tests. The client wraps the
+provider with a process-wide cap on concurrent requests, an asyncio timeout
+per call and latency metrics, so LLM calls never block the event loop or tie
+up threads while waiting.
+"""
+import asyncio
+import json
+import re
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from string import Template
+from typing import Any, AsyncIterator, Dict, List, Optional
+import httpx
+from config import settings
+
+class LLMError(Exception):
+    """The LLM could not be reached, failed or did not answer in time"""
+
+class LLMProvider(ABC):
+    """Source of completions for one user prompt"""
+
+    name = "provider"
+
+    def __init__(self, model: str):
+        self.model = model
+
+    @abstractmethod
+    async def complete(self, prompt: str, **kwargs: Any) -> str:
+        """The whole completion"""
+
+    @abstractmethod
+    def stream(self, prompt: str, **kwargs: Any) -> AsyncIterator[str]:
+        """The completion piece by piece; implemented as an async generator"""
+
+    async def aclose(self) -> None:
+        pass
+
+class OpenAIProvider(LLMProvider):
+    """AsyncOpenAI on a pooled HTTP connection pool"""
+
+    name = "openai"
+
+    def __init__(
+        self,
+        model: str = settings.LLM_MODEL,
+        timeout: float = settings.LLM_TIMEOUT_S,
+        max_connections: int = settings.LLM_MAX_CONNECTIONS,
+    ):
+        super().__init__(model)
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._client = None
+
+    def _get_client(self):
+        # Created on first use so importing the API does not need an API key
+        if self._client is None:
+            from openai import AsyncOpenAI
+
+            if not settings.OPENAI_API_KEY:
+                raise LLMError("OpenAI API key not configured. Please set OPENAI_API_KEY in your .env file.")
+            self._client = AsyncOpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_connections,
+                    ),
+                    timeout=self.timeout,
+                ),
+            )
+        return self._client
+
+    async def complete(self, prompt: str, **kwargs: Any) -> str:
+        response = await self._get_client().chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            **kwargs,
+        )
+        return (response.choices[0].message.content or "").strip()
+
+    async def stream(self, prompt: str, **kwargs: Any) -> AsyncIterator[str]:
+        chunks = await self._get_client().chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            stream=True,
+            **kwargs,
+        )
+        try:
+            async for chunk in chunks:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await chunks.close()
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+# Tried in order after any LLM_LOCAL_RESPONSES rules. `match` is a regex searched
+# in the prompt; its named groups fill $placeholders in `response`.
+DEFAULT_LOCAL_RESPONSES = [
+    {
+        "match": r"Original query: (?P<sql>.+)",
+        "response": "$sql",
+    },
+    {
+        "match": r"tenant_id = '(?P<tenant_id>[^']*)'[\s\S]*SQL Query:",
+        "response": (
+            "SELECT r.id, r.status, r.created_at, COUNT(i.id) AS issues\n"
+            "FROM reconciliation_run r LEFT JOIN reconciliation_item i ON i.run_id = r.id\n"
+            "WHERE r.tenant_id = '$tenant_id'\n"
+            "GROUP BY r.id, r.status, r.created_at ORDER BY r.created_at DESC LIMIT 10"
+        ),
+    },
+    {
+        "match": r'"row_count": (?P<row_count>\d+)',
+        "response": (
+            "The query returned $row_count rows. The figures are in line with recent runs "
+            "and no single employee or deduction code dominates the result."
+        ),
+    },
+    {
+        "match": r"Total dollar impact: \$(?P<impact>[\d,.]+)",
+        "response": json.dumps({
+            "suggested_fixes": [
+                "Re-sync enrollments for employees with missing coverage",
+                "Correct contribution percentages that differ from the elected plan",
+            ],
+            "priority_actions": [
+                "Review the highest-dollar discrepancies (total impact $$$impact)",
+                "Confirm plan mappings for unrecognised deduction codes",
+            ],
+            "risk_assessment": "Medium - deterministic response from the local LLM provider",
+        }),
+    },
+    {"match": r"", "response": "OK"},
+]
+
+class LocalProvider(LLMProvider):
+    """
+    Deterministic stand-in: canned or templated replies chosen by regex,
+    delivered after a fixed latency at a fixed token rate. Needs no API key
+    or network, so latency tests measure this service rather than the vendor.
+    """
+
+    name = "local"
+
+    def __init__(
+        self,
+        latency_ms: float = settings.LLM_LOCAL_LATENCY_MS,
+        tokens_per_s: float = settings.LLM_LOCAL_TOKENS_PER_S,
+        responses_path: str = settings.LLM_LOCAL_RESPONSES,
+    ):
+        super().__init__("local")
+        self.latency = latency_ms / 1000
+        self.tokens_per_s = tokens_per_s
+        rules = DEFAULT_LOCAL_RESPONSES
+        if responses_path:
+            with open(responses_path) as f:
+                rules = json.load(f) + rules
+        self.rules = [(re.compile(rule["match"]), Template(rule["response"])) for rule in rules]
+
+    def reply(self, prompt: str) -> str:
+        for pattern, response in self.rules:
+            match = pattern.search(prompt)
+            if match:
+                return response.safe_substitute(match.groupdict()).strip()
+        return ""
+
+    @staticmethod
+    def tokens(text: str) -> List[str]:
+        return re.findall(r"\s*\S+", text)
+
+    async def complete(self, prompt: str, **kwargs: Any) -> str:
+        text = self.reply(prompt)
+        delay = self.latency
+        if self.tokens_per_s > 0:
+            delay += len(self.tokens(text)) / self.tokens_per_s
+        await asyncio.sleep(delay)
+        return text
+
+    async def stream(self, prompt: str, **kwargs: Any) -> AsyncIterator[str]:
+        await asyncio.sleep(self.latency)
+        for token in self.tokens(self.reply(prompt)):
+            if self.tokens_per_s > 0:
+                await asyncio.sleep(1 / self.tokens_per_s)
+            yield token
+
+PROVIDERS = {"openai": OpenAIProvider, "local": LocalProvider}
+
+def create_provider(name: str = settings.LLM_PROVIDER) -> LLMProvider:
+    try:
+        return PROVIDERS[name.lower()]()
+    except KeyError:
+        raise ValueError(f"Unsupported LLM provider: {name}")
+
+class LLMClient:
+    def __init__(
+        self,
+        provider: Optional[LLMProvider] = None,
+        timeout: float = settings.LLM_TIMEOUT_S,
+        max_concurrency: int = settings.LLM_MAX_CONCURRENCY,
+    ):
+        self.provider = provider or create_provider()
+        self.timeout = timeout
+        self.max_concurrency = max(1, max_concurrency)
+        self._limiter: Optional[asyncio.Semaphore] = None
+        self._waiting = 0
+        self._in_flight = 0
+        self._latencies: deque = deque(maxlen=1000)
+        self._stats = {"calls": 0, "failures": 0, "timeouts": 0}
+
+    @property
+    def model(self) -> str:
+        return self.provider.model
+
+    def _get_limiter(self) -> asyncio.Semaphore:
+        if self._limiter is None:
+            self._limiter = asyncio.Semaphore(self.max_concurrency)
+        return self._limiter
+
+    async def complete(self, prompt: str, timeout: Optional[float] = None, **kwargs: Any) -> str:
+        """
+        Send one user prompt and return the reply text. The timeout covers
+        waiting for a concurrency slot as well as the request itself.
+        """
+        timeout = timeout or self.timeout
+        self._stats["calls"] += 1
+        start = time.perf_counter()
+        try:
+            return await asyncio.wait_for(self._complete(prompt, **kwargs), timeout)
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            raise LLMError(f"LLM request timed out after {timeout:g} seconds")
+        except LLMError:
+            self._stats["failures"] += 1
+            raise
+        except Exception as e:
+            self._stats["failures"] += 1
+            raise LLMError(f"LLM request failed: {e}")
+        finally:
+            self._latencies.append((time.perf_counter() - start) * 1000)
+
+    async def _complete(self, prompt: str, **kwargs: Any) -> str:
+        self._waiting += 1
+        try:
+            await self._get_limiter().acquire()
+        finally:
+            self._waiting -= 1
+        self._in_flight += 1
+        try:
+            return await self.provider.complete(prompt, **kwargs)
+        finally:
+            self._in_flight -= 1
+            self._limiter.release()
+
+    async def stream(self, prompt: str, timeout: Optional[float] = None, **kwargs: Any) -> AsyncIterator[str]:
+        """
+        Yield the reply text as it is generated. The timeout bounds waiting for
+        a concurrency slot, for the response to start and for each next chunk.
+        """
+        timeout = timeout or self.timeout
+        limiter = self._get_limiter()
+        self._stats["calls"] += 1
+        start = time.perf_counter()
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(limiter.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            raise LLMError(f"LLM request timed out after {timeout:g} seconds")
+        finally:
+            self._waiting -= 1
+        self._in_flight += 1
+        chunks = self.provider.stream(prompt, **kwargs)
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout)
+                except StopAsyncIteration:
+                    break
+                yield chunk
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            raise LLMError(f"LLM stream stalled for {timeout:g} seconds")
+        except LLMError:
+            self._stats["failures"] += 1
+            raise
+        except Exception as e:
+            self._stats["failures"] += 1
+            raise LLMError(f"LLM request failed: {e}")
+        finally:
+            await chunks.aclose()
+            self._in_flight -= 1
+            limiter.release()
+            self._latencies.append((time.perf_counter() - start) * 1000)
+
+    async def aclose(self) -> None:
+        await self.provider.aclose()
+
+    def metrics(self) -> Dict[str, Any]:
+        latencies = sorted(self._latencies)
+        return {
+            "provider": self.provider.name,
+            "model": self.model,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            **self._stats,
+            "call_latency_ms": {
+                "avg": round(sum(latencies) / len(latencies), 2) if latencies else None,
+                "p95": round(latencies[int(len(latencies) * 0.95) - 1], 2) if latencies else None,
+                "max": round(latencies[-1], 2) if latencies else None,
+            },
+        }
+
+llm_client = LLMClient()
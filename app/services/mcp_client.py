@@ -0,0 +1,22 @@
+# app/services/mcp_client.py
+from config import settings
+from services.mcp_pool import MCPPool, SocketWorker
+
+def create_mcp_client(transport: str = settings.MCP_TRANSPORT):
+    """
+    `pool`: long-lived MCP server child processes
+    `socket`: connections to a shared MCP server listening on MCP_SOCKET
+    `inprocess`: tools called directly on the API's connection pool
+    """
+    if transport == "pool":
+        return MCPPool()
+    if transport == "socket":
+        if not settings.MCP_SOCKET:
+            raise ValueError("MCP_TRANSPORT=socket requires MCP_SOCKET")
+        return MCPPool(worker_factory=lambda index: SocketWorker(index, settings.MCP_SOCKET), transport="socket")
+    if transport == "inprocess":
+        from services.mcp_inprocess import InProcessMCP
+        return InProcessMCP()
+    raise ValueError(f"Unsupported MCP transport: {transport}")
+
+mcp_client = create_mcp_client()
@@ -0,0 +1,112 @@
+# app/services/mcp_inprocess.py
+import importlib.util
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional
+from config import settings
+from db import engine
+from services.mcp_pool import MCP_SERVER_PATH, MCPError
+
+class InProcessMCP:
+    """
+    Calls the MCP server's tool functions directly, bound to the API's engine
+    and connection pool. Requests and responses are the same JSON-RPC dicts the
+    process transport exchanges, without the process hop or JSON encoding.
+    """
+
+    def __init__(
+        self,
+        server_path: str = MCP_SERVER_PATH,
+        shared_engine=engine,
+        call_timeout: float = settings.MCP_CALL_TIMEOUT_S,
+    ):
+        self.server_path = server_path
+        self.engine = shared_engine
+        self.call_timeout = call_timeout
+        self._server = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._latencies: deque = deque(maxlen=1000)
+        self._stats = {"calls": 0, "failures": 0, "timeouts": 0}
+
+    def _load(self):
+        if self._server is None:
+            with self._lock:
+                if self._server is None:
+                    spec = importlib.util.spec_from_file_location("mcp_server_tools", self.server_path)
+                    server = importlib.util.module_from_spec(spec)
+                    spec.loader.exec_module(server)
+                    server.configure(self.engine)
+                    # Tool calls run here so a caller can stop waiting on one; sized like the server's own pool
+                    self._executor = ThreadPoolExecutor(max_workers=server.MAX_WORKERS, thread_name_prefix="mcp-inprocess")
+                    self._server = server
+        return self._server
+
+    def start(self) -> None:
+        self._load()
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            self._server, self._executor = None, None
+
+    def call(
+        self,
+        request: Dict[str, Any],
+        timeout: Optional[float] = None,
+        on_notify: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Dispatch one JSON-RPC request. After `timeout` the caller gets an
+        MCPError and later notifications are dropped; the tool itself keeps its
+        thread until it returns (execute_sql is also bounded by its statement timeout).
+        """
+        timeout = timeout or self.call_timeout
+        start = time.perf_counter()
+        self._stats["calls"] += 1
+        server = self._load()
+        abandoned = threading.Event()
+
+        def notify(message):
+            if not abandoned.is_set():
+                on_notify(message)
+
+        future = self._executor.submit(server.dispatch, request, notify if on_notify else None)
+        try:
+            response = future.result(timeout)
+        except FutureTimeoutError:
+            abandoned.set()
+            self._stats["timeouts"] += 1
+            raise MCPError(f"MCP request timed out after {timeout} seconds")
+        if "error" in response:
+            self._stats["failures"] += 1
+        self._latencies.append((time.perf_counter() - start) * 1000)
+        return response
+
+    def health_check(self, timeout: float = 5.0) -> List[Dict[str, Any]]:
+        start = time.perf_counter()
+        try:
+            response = self.call({"jsonrpc": "2.0", "id": 0, "method": "ping", "params": {}}, timeout)
+        except MCPError as e:
+            response = {"error": str(e)}
+        return [{
+            "worker": "inprocess",
+            "healthy": "result" in response,
+            "latency_ms": round((time.perf_counter() - start) * 1000, 2),
+            "last_error": str(response["error"]) if "error" in response else None,
+        }]
+
+    def metrics(self) -> Dict[str, Any]:
+        latencies = sorted(self._latencies)
+        return {
+            "transport": "inprocess",
+            **self._stats,
+            "call_latency_ms": {
+                "avg": round(sum(latencies) / len(latencies), 2) if latencies else None,
+                "p95": round(latencies[int(len(latencies) * 0.95) - 1], 2) if latencies else None,
+                "max": round(latencies[-1], 2) if latencies else None,
+            },
+        }
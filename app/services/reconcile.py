@@ -2,9 +2,15 @@
 import json
 from collections import defaultdict
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import and_, desc
+from sqlalchemy import and_, desc, func, select
+from config import settings
+from services.anomalies import detect_amount_anomalies
+from services.deduction_codes import load_code_map
+from services.employee_match import employee_index
+from services.reconcile_rules import rules_for_tenant
+from services.run_metrics import RunMetricsBuilder
 from models_rich import (
     PayrollBatch, PayItem, Enrollment, ReconciliationRun, ReconciliationItem,
     Employee, EventLog, Plan, AuditLog
@@ -110,6 +116,88 @@ def get_employee_context(db: Session, tenant_id: str, employee_ext_id: str, empl
     
     return context
 
+NO_EMPLOYEE_CONTEXT = json.dumps({
+    "employee_info": None,
+    "recent_events_count": 0,
+    "recent_pay_items_count": 0,
+    "enrollment_count": 0
+}, indent=2)
+
+def employee_contexts(
+    db: Session, tenant_id: str, payroll_batch_id: int, enrollment_counts: Dict[int, int]
+) -> Tuple[Dict[int, str], Dict[str, str]]:
+    """
+    Context summary JSON for every employee in a batch, by employee id and by employee_ext_id.
+    Same counts as get_employee_context, from one query each instead of several per pay item.
+    """
+    batch_items = select(PayItem.employee_id).where(
+        PayItem.tenant_id == tenant_id,
+        PayItem.payroll_batch_id == payroll_batch_id,
+        PayItem.employee_id.isnot(None)
+    )
+    unlinked_ids = select(PayItem.employee_ext_id).where(
+        PayItem.tenant_id == tenant_id,
+        PayItem.payroll_batch_id == payroll_batch_id,
+        PayItem.employee_id.is_(None)
+    )
+    conn = db.connection()
+    
+    # Recent audit events (last 30 days) and pay items (last 3 months), capped like the detail view
+    thirty_days_ago = datetime.now() - timedelta(days=30)
+    recent_events = dict(conn.execute(
+        select(AuditLog.entity_id, func.count()).where(
+            AuditLog.tenant_id == tenant_id,
+            AuditLog.entity == "employee",
+            AuditLog.entity_id.in_(batch_items),
+            AuditLog.at >= thirty_days_ago
+        ).group_by(AuditLog.entity_id)
+    ).all())
+    three_months_ago = datetime.now() - timedelta(days=90)
+    recent_pay_items = dict(conn.execute(
+        select(PayItem.employee_id, func.count()).where(
+            PayItem.tenant_id == tenant_id,
+            PayItem.employee_id.in_(batch_items),
+            PayItem.created_at >= three_months_ago
+        ).group_by(PayItem.employee_id)
+    ).all())
+    
+    by_id, by_ext_id = {}, {}
+    employees = conn.execute(
+        select(
+            Employee.id, Employee.employee_ext_id, Employee.first_name, Employee.last_name,
+            Employee.email, Employee.hire_date, Employee.is_active
+        ).where(
+            Employee.tenant_id == tenant_id,
+            Employee.id.in_(batch_items) | Employee.employee_ext_id.in_(unlinked_ids)
+        ).order_by(Employee.id)
+    )
+    for employee in employees:
+        context = {
+            "employee_info": {
+                "id": employee.id,
+                "employee_ext_id": employee.employee_ext_id,
+                "first_name": employee.first_name,
+                "last_name": employee.last_name,
+                "email": employee.email,
+                "hire_date": employee.hire_date.isoformat() if employee.hire_date else None,
+                "is_active": employee.is_active
+            },
+            "recent_events_count": min(recent_events.get(employee.id, 0), 5),
+            "recent_pay_items_count": min(recent_pay_items.get(employee.id, 0), 10),
+            "enrollment_count": enrollment_counts.get(employee.id, 0)
+        }
+        # Rendered once per employee, not per pay item
+        context = json.dumps(context, indent=2)
+        by_id[employee.id] = context
+        by_ext_id.setdefault(employee.employee_ext_id, context)
+    return by_id, by_ext_id
+
+def anomaly_note(pay_item: PayItem, anomaly: Dict) -> str:
+    return (
+        f"Amount {pay_item.amount:.2f} is unusual for {pay_item.code}: median {anomaly['median']:.2f} "
+        f"over the last {anomaly['history']} pay items, robust z-score {anomaly['z']}"
+    )
+
 def run_reconciliation(db: Session, tenant_id: str, payroll_batch_id: int, actor: str = "demo-user") -> Dict:
     """
     Run reconciliation comparing payroll items against employee enrollments.
@@ -141,17 +229,23 @@ def run_reconciliation(db: Session, tenant_id: str, payroll_batch_id: int, actor
         Enrollment.is_active == True
     ).all()
     
-    # Index enrollments by employee_id and plan_type
+    # Their plans, loaded once rather than per enrollment
+    plans = {
+        plan.id: plan for plan in db.query(Plan).filter(Plan.id.in_({enrollment.plan_id for enrollment in enrollments}))
+    }
+    
+    # Index enrollments by employee_id and plan_type, and by employee_id and plan
+    # for codes mapped to a specific plan
     enrollment_index = defaultdict(dict)
+    plan_enrollments = {}
+    enrollment_counts = defaultdict(int)
     for enrollment in enrollments:
+        plan_enrollments[(enrollment.employee_id, enrollment.plan_id)] = enrollment
         employee_id = enrollment.employee_id
-        # Get plan type from plan_id
-        plan = db.query(Plan).filter(Plan.id == enrollment.plan_id).first()
+        plan = plans.get(enrollment.plan_id)
         if plan:
-            plan_type = plan.plan_type
-            if employee_id not in enrollment_index:
-                enrollment_index[employee_id] = {}
-            enrollment_index[employee_id][plan_type] = enrollment
+            enrollment_index[employee_id][plan.plan_type] = enrollment
+            enrollment_counts[employee_id] += 1
     
     # Get all pay items for the batch
     pay_items = db.query(PayItem).filter(
@@ -159,33 +253,55 @@ def run_reconciliation(db: Session, tenant_id: str, payroll_batch_id: int, actor
         PayItem.payroll_batch_id == payroll_batch_id
     ).all()
     
+    # Ids that matched no employee at upload: suggest likely employees, and
+    # link the confident ones when auto-link is on
+    match_notes = {}
+    unresolved = [pay_item for pay_item in pay_items if pay_item.employee_ext_id and not pay_item.employee_id]
+    if unresolved:
+        index = employee_index(db, tenant_id)
+        for pay_item in unresolved:
+            match = index.link(pay_item.employee_ext_id) if settings.EMPLOYEE_AUTO_LINK else None
+            if match:
+                pay_item.employee_id = match["employee_id"]
+                match_notes[pay_item.id] = (
+                    f"Linked to employee {match['employee_ext_id']} ({match['name']}): {match['reason']}, "
+                    f"confidence {match['confidence']:.2f}"
+                )
+                continue
+            suggestions = index.suggest(pay_item.employee_ext_id)
+            if suggestions:
+                match_notes[pay_item.id] = "Possible matches: " + ", ".join(
+                    f"{s['employee_ext_id']} ({s['name']}, {s['confidence']:.2f})" for s in suggestions
+                )
+        # Write the links so the context queries below see them
+        db.flush()
+    
+    # Employee context for the whole batch
+    contexts_by_id, contexts_by_ext_id = employee_contexts(db, tenant_id, payroll_batch_id, enrollment_counts)
+    
+    # Amounts far off each employee's own history for the code
+    anomalies = detect_amount_anomalies(db, tenant_id, batch, pay_items) if settings.ANOMALY_DETECTION else {}
+    
+    # The tenant's rules: tolerance, code patterns and custom checks (compiled once per version)
+    rules = rules_for_tenant(db, tenant_id)
+    # Deduction code mappings, loaded once; unmapped codes fall back to the patterns
+    code_map = load_code_map(db, tenant_id)
+    
     summary = defaultdict(int)
     reconciliation_items = []
+    metrics = RunMetricsBuilder()
     
     for pay_item in pay_items:
         # Determine the plan type from the pay item code
-        plan_type = None
-        if "MED" in pay_item.code:
-            plan_type = "medical"
-        elif "DENTAL" in pay_item.code:
-            plan_type = "dental"
-        elif "VISION" in pay_item.code:
-            plan_type = "vision"
-        elif "LIFE" in pay_item.code:
-            plan_type = "life"
-        elif "DISABILITY" in pay_item.code:
-            plan_type = "disability"
-        elif "FSA" in pay_item.code:
-            plan_type = "fsa"
-        elif "HSA" in pay_item.code:
-            plan_type = "hsa"
-        elif "401K" in pay_item.code:
-            plan_type = "401k"
-        
-        # Get employee context
-        context = get_employee_context(
-            db, tenant_id, pay_item.employee_ext_id, pay_item.employee_id
-        )
+        plan_type = code_map.plan_type(pay_item.code)
+        # A code mapped to a plan must match an enrollment in that plan, not just any of its type
+        plan_id = code_map.plan_id(pay_item.code)
+        if plan_id is not None:
+            enrollment = plan_enrollments.get((pay_item.employee_id, plan_id))
+            coverage = f"plan {plan_id} ({plan_type})"
+        else:
+            enrollment = enrollment_index.get(pay_item.employee_id, {}).get(plan_type)
+            coverage = f"{plan_type} plan"
         
         # Determine issue type and create reconciliation item
         if not pay_item.employee_ext_id or not pay_item.employee_id:
@@ -200,7 +316,6 @@ def run_reconciliation(db: Session, tenant_id: str, payroll_batch_id: int, actor
                 details=f"Pay item has no valid employee identification. Code: {pay_item.code}, Amount: {pay_item.amount}",
                 created_at=datetime.utcnow()
             )
-            summary["extra_deduction"] += 1
             
         elif not plan_type:
             # Unknown plan type
@@ -214,9 +329,8 @@ def run_reconciliation(db: Session, tenant_id: str, payroll_batch_id: int, actor
                 details=f"Unknown plan type for code: {pay_item.code}",
                 created_at=datetime.utcnow()
             )
-            summary["extra_deduction"] += 1
             
-        elif pay_item.employee_id not in enrollment_index or plan_type not in enrollment_index[pay_item.employee_id]:
+        elif enrollment is None:
             # Missing coverage
             item = ReconciliationItem(
                 run_id=run.id,
@@ -225,19 +339,29 @@ def run_reconciliation(db: Session, tenant_id: str, payroll_batch_id: int, actor
                 expected_pct=None,
                 actual_pct=pay_item.contribution_pct,
                 amount=pay_item.amount,
-                details=f"Employee has no active enrollment for {plan_type} plan. Code: {pay_item.code}",
+                details=f"Employee has no active enrollment for {coverage}. Code: {pay_item.code}",
                 created_at=datetime.utcnow()
             )
-            summary["missing_coverage"] += 1
             
         else:
             # Compare with enrollment
-            enrollment = enrollment_index[pay_item.employee_id][plan_type]
             expected_pct = float(enrollment.contribution_pct or 0)
             actual_pct = float(pay_item.contribution_pct or 0)
             
             # Check if percentages match (with small tolerance)
-            if abs(expected_pct - actual_pct) < 0.001:
+            if rules.pct_matches(expected_pct, actual_pct) and pay_item.id in anomalies:
+                # Matches the election, but not what the employee usually pays
+                item = ReconciliationItem(
+                    run_id=run.id,
+                    employee_ext_id=pay_item.employee_ext_id,
+                    issue_type="amount_anomaly",
+                    expected_pct=expected_pct,
+                    actual_pct=actual_pct,
+                    amount=pay_item.amount,
+                    details=anomaly_note(pay_item, anomalies[pay_item.id]),
+                    created_at=datetime.utcnow()
+                )
+            elif rules.pct_matches(expected_pct, actual_pct):
                 item = ReconciliationItem(
                     run_id=run.id,
                     employee_ext_id=pay_item.employee_ext_id,
@@ -248,7 +372,6 @@ def run_reconciliation(db: Session, tenant_id: str, payroll_batch_id: int, actor
                     details=f"Pay item matches enrollment for {plan_type} plan",
                     created_at=datetime.utcnow()
                 )
-                summary["ok"] += 1
             else:
                 item = ReconciliationItem(
                     run_id=run.id,
@@ -260,42 +383,70 @@ def run_reconciliation(db: Session, tenant_id: str, payroll_batch_id: int, actor
                     details=f"Contribution percentage mismatch for {plan_type} plan. Expected: {expected_pct:.4f}, Actual: {actual_pct:.4f}",
                     created_at=datetime.utcnow()
                 )
-                summary["mismatch_pct"] += 1
+        
+        if pay_item.id in match_notes:
+            item.details = f"{item.details}. {match_notes[pay_item.id]}"
+        if item.issue_type not in ("ok", "amount_anomaly") and pay_item.id in anomalies:
+            item.details = f"{item.details}. {anomaly_note(pay_item, anomalies[pay_item.id])}"
+        
+        # Tenant-defined checks
+        failed = rules.check(item.issue_type, {
+            "amount": pay_item.amount,
+            "actual_pct": item.actual_pct,
+            "expected_pct": item.expected_pct,
+            "pct_diff": abs(item.actual_pct - item.expected_pct) if item.expected_pct is not None and item.actual_pct is not None else None,
+            "code": pay_item.code,
+            "plan_type": plan_type,
+            "employee_ext_id": item.employee_ext_id,
+        })
+        if failed:
+            issue_type, details = failed
+            item.details = f"{details or f'Failed tenant check {issue_type}'}. Code: {pay_item.code}, Amount: {pay_item.amount}. {item.details}"
+            item.issue_type = issue_type
+        summary[item.issue_type] += 1
+        
+        item.code = pay_item.code
+        metrics.add(item.issue_type, plan_type, item.employee_ext_id, item.amount)
         
         # Add context information to the details field
-        context_summary = {
-            "employee_info": context["employee_info"],
-            "recent_events_count": len(context["recent_events"]),
-            "recent_pay_items_count": len(context["recent_pay_items"]),
-            "enrollment_count": len(context["enrollment_info"])
-        }
+        if pay_item.employee_id:
+            context_json = contexts_by_id.get(pay_item.employee_id, NO_EMPLOYEE_CONTEXT)
+        else:
+            context_json = contexts_by_ext_id.get(pay_item.employee_ext_id, NO_EMPLOYEE_CONTEXT)
         
         # Add context to details
         current_details = item.details or ""
-        context_json = json.dumps(context_summary, indent=2)
         item.details = f"{current_details}\n\nContext:\n{context_json}"
         
         reconciliation_items.append(item)
         db.add(item)
     
-    # Update run summary
+    # Update run summary and the rollups trends are read from
     run.summary = json.dumps(dict(summary))
+    metrics.write(db, run, batch.period_end)
     
     db.commit()
     
-    # Generate insights asynchronously (don't block the reconciliation)
+    # Rules-based insights are cheap, so they are ready with the run; LLM
+    # enrichment reuses an identical run's answer or runs in the background
+    from services.insights import create_rule_insights, enrich_from_memo
+    from services.insight_worker import insight_worker
     try:
-        from services.insights import create_reconciliation_insights
-        create_reconciliation_insights(db, run.id, tenant_id)
+        create_rule_insights(db, run)
+        enriched = not settings.INSIGHTS_LLM_ENRICHMENT or enrich_from_memo(db, run)
     except Exception as e:
-        # Log error but don't fail the reconciliation
-        print(f"Failed to generate insights for run {run.id}: {e}")
-        # Could add to event log here
+        db.rollback()
+        print(f"Insight generation failed for run {run.id}: {e}")
+        enriched = not settings.INSIGHTS_LLM_ENRICHMENT
+    if not enriched:
+        insight_worker.submit(tenant_id, run.id)
     
     return {
         "run_id": run.id,
         "summary": dict(summary),
         "total_items": len(reconciliation_items),
+        "rules_version": rules.version,
+        "unmapped_codes": dict(code_map.unmapped.most_common()),
         "batch_info": {
             "id": batch.id,
             "period_start": batch.period_start.isoformat(),
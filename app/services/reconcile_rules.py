@@ -0,0 +1,205 @@
+# app/services/reconcile_rules.py
+"""
+Per-tenant reconciliation rules, compiled once per rule-set version.
+
+A tenant's rules live in Tenant.settings["reconciliation_rules"]; any key
+left out falls back to DEFAULT_RULES, the built-in behaviour:
+
+    {
+      "pct_tolerance": 0.001,
+      "plan_types": [{"contains": "DENTAL", "plan_type": "dental"}, ...],
+      "checks": [
+        {
+          "issue_type": "amount_over_limit",
+          "when": [{"field": "amount", "op": ">", "value": 1500}],
+          "plan_types": ["medical"],
+          "applies_to": ["ok"],
+          "details": "Deduction above the medical limit"
+        }
+      ]
+    }
+
+plan_types are tried in order (`exact`, `prefix`, `contains` or `regex` on
+the deduction code) and the first match wins. checks run in order on items
+whose built-in issue type is in `applies_to` (default: ok); the first whose
+conditions all hold sets the item's issue type. Condition fields are
+amount, actual_pct, expected_pct, pct_diff, code, plan_type and
+employee_ext_id.
+
+Rule sets are compiled into closures and cached by version (a hash of the
+rules), so a run reads the tenant's settings once and evaluates plain Python
+predicates per item; plan types are memoized per code.
+"""
+import hashlib
+import json
+import operator
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from models_rich import Tenant
+
+SETTINGS_KEY = "reconciliation_rules"
+
+DEFAULT_RULES = {
+    "pct_tolerance": 0.001,
+    "plan_types": [
+        {"contains": "MED", "plan_type": "medical"},
+        {"contains": "DENTAL", "plan_type": "dental"},
+        {"contains": "VISION", "plan_type": "vision"},
+        {"contains": "LIFE", "plan_type": "life"},
+        {"contains": "DISABILITY", "plan_type": "disability"},
+        {"contains": "FSA", "plan_type": "fsa"},
+        {"contains": "HSA", "plan_type": "hsa"},
+        {"contains": "401K", "plan_type": "401k"},
+    ],
+    "checks": [],
+}
+
+NUMERIC_FIELDS = ("amount", "actual_pct", "expected_pct", "pct_diff")
+FIELDS = NUMERIC_FIELDS + ("code", "plan_type", "employee_ext_id")
+
+OPERATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "in": lambda value, allowed: value in allowed,
+    "not_in": lambda value, allowed: value not in allowed,
+}
+
+CODE_MATCHERS = {
+    "exact": lambda pattern: lambda code: code == pattern,
+    "prefix": lambda pattern: lambda code: code.startswith(pattern),
+    "contains": lambda pattern: lambda code: pattern in code,
+    "regex": lambda pattern: re.compile(pattern).search,
+}
+
+def rules_version(rules: Dict) -> str:
+    return hashlib.sha256(json.dumps(rules, sort_keys=True).encode()).hexdigest()[:16]
+
+def effective_rules(custom: Optional[Dict]) -> Dict:
+    """The tenant's rules with the defaults filled in"""
+    return {**DEFAULT_RULES, **(custom or {})}
+
+def _compile_condition(condition: Dict) -> Callable[[Dict], bool]:
+    field, op, value = condition.get("field"), condition.get("op"), condition.get("value")
+    if field not in FIELDS:
+        raise ValueError(f"Unknown field {field!r}; expected one of {', '.join(FIELDS)}")
+    if op == "matches":
+        search = re.compile(str(value)).search
+        return lambda item: item[field] is not None and search(str(item[field])) is not None
+    if op not in OPERATORS:
+        raise ValueError(f"Unknown operator {op!r}; expected one of {', '.join(OPERATORS)}, matches")
+    compare = OPERATORS[op]
+    if op in (">", ">=", "<", "<=") and (field not in NUMERIC_FIELDS or isinstance(value, bool) or not isinstance(value, (int, float))):
+        raise ValueError(f"Operator {op!r} needs a numeric field and value, got {field} {op} {value!r}")
+    if op in ("in", "not_in"):
+        if not isinstance(value, list):
+            raise ValueError(f"Operator {op!r} needs a list value")
+        value = frozenset(value)
+    if op in ("==", "!="):
+        return lambda item: compare(item[field], value)
+    return lambda item: item[field] is not None and compare(item[field], value)
+
+class CompiledRules:
+    """One tenant rule set, ready to evaluate per item"""
+
+    def __init__(self, rules: Dict):
+        self.rules = rules
+        self.version = rules_version(rules)
+        try:
+            self.pct_tolerance = float(rules["pct_tolerance"])
+            self._plan_matchers = [self._compile_plan_type(entry) for entry in rules["plan_types"]]
+            self._checks = [self._compile_check(check) for check in rules["checks"]]
+        except (AttributeError, KeyError, TypeError, re.error) as e:
+            raise ValueError(f"Invalid reconciliation rules: {e}") from e
+        self._plan_types: Dict[str, Optional[str]] = {}
+
+    @staticmethod
+    def _compile_plan_type(entry: Dict) -> Tuple[Callable[[str], Any], str]:
+        kinds = [kind for kind in CODE_MATCHERS if kind in entry]
+        if len(kinds) != 1 or "plan_type" not in entry:
+            raise ValueError(f"Plan type rule needs plan_type and one of {', '.join(CODE_MATCHERS)}: {entry}")
+        return CODE_MATCHERS[kinds[0]](entry[kinds[0]]), entry["plan_type"]
+
+    @staticmethod
+    def _compile_check(check: Dict) -> Tuple[frozenset, Optional[frozenset], List[Callable[[Dict], bool]], str, Optional[str]]:
+        if not check.get("issue_type") or not check.get("when"):
+            raise ValueError(f"Check needs issue_type and when: {check}")
+        plan_types = frozenset(check["plan_types"]) if check.get("plan_types") else None
+        conditions = [_compile_condition(condition) for condition in check["when"]]
+        return frozenset(check.get("applies_to", ["ok"])), plan_types, conditions, check["issue_type"], check.get("details")
+
+    def plan_type(self, code: str) -> Optional[str]:
+        """Plan type for a deduction code (memoized; codes repeat on every row)"""
+        try:
+            return self._plan_types[code]
+        except KeyError:
+            plan_type = next((plan_type for matches, plan_type in self._plan_matchers if matches(code)), None)
+            self._plan_types[code] = plan_type
+            return plan_type
+
+    def pct_matches(self, expected_pct: float, actual_pct: float) -> bool:
+        return abs(expected_pct - actual_pct) < self.pct_tolerance
+
+    def check(self, issue_type: str, item: Dict) -> Optional[Tuple[str, Optional[str]]]:
+        """The first custom check an item fails, as (issue_type, details), or None"""
+        for applies_to, plan_types, conditions, new_issue_type, details in self._checks:
+            if issue_type not in applies_to:
+                continue
+            if plan_types is not None and item["plan_type"] not in plan_types:
+                continue
+            if all(condition(item) for condition in conditions):
+                return new_issue_type, details
+        return None
+
+class RuleCache:
+    """Compiled rule sets by version; tenants with the same rules share one"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._compiled: "OrderedDict[str, CompiledRules]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def compiled(self, custom: Optional[Dict]) -> CompiledRules:
+        rules = effective_rules(custom)
+        version = rules_version(rules)
+        with self._lock:
+            compiled = self._compiled.get(version)
+            if compiled is not None:
+                self._compiled.move_to_end(version)
+                return compiled
+        compiled = CompiledRules(rules)
+        with self._lock:
+            self._compiled[version] = compiled
+            while len(self._compiled) > self.max_entries:
+                self._compiled.popitem(last=False)
+        return compiled
+
+rule_cache = RuleCache()
+
+def tenant_rules(db: Session, tenant_id: str) -> Optional[Dict]:
+    """The tenant's custom rules as stored (None if it has none)"""
+    tenant = db.get(Tenant, tenant_id)
+    return (tenant.settings or {}).get(SETTINGS_KEY) if tenant else None
+
+def rules_for_tenant(db: Session, tenant_id: str) -> CompiledRules:
+    return rule_cache.compiled(tenant_rules(db, tenant_id))
+
+def save_tenant_rules(db: Session, tenant_id: str, custom: Dict) -> CompiledRules:
+    """Validate (by compiling) and store a tenant's rules"""
+    unknown = set(custom) - set(DEFAULT_RULES)
+    if unknown:
+        raise ValueError(f"Unknown rule keys: {', '.join(sorted(unknown))}")
+    compiled = rule_cache.compiled(custom)
+    tenant = db.get(Tenant, tenant_id)
+    if tenant is None:
+        tenant = Tenant(id=tenant_id, name=tenant_id, settings={})
+        db.add(tenant)
+    tenant.settings = {**(tenant.settings or {}), SETTINGS_KEY: custom}
+    db.commit()
+    return compiled
@@ -0,0 +1,215 @@
+# app/services/run_metrics.py
+"""
+Per-run metric rollups and the cross-run trends read from them.
+
+When a run completes, its items are rolled up in the same transaction into
+one reconciliation_run_metrics row and one reconciliation_run_breakdown row
+per issue type and plan type. Trends over the last N payrolls then read N
+rollup rows instead of re-aggregating every historical reconciliation_item.
+Runs reconciled before the rollups existed are filled in with:
+
+    python -m services.run_metrics backfill [--tenant demo-tenant-1]
+"""
+import argparse
+from collections import defaultdict
+from datetime import date
+from typing import Dict, List, Optional
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from models_rich import (
+    PayrollBatch, ReconciliationItem, ReconciliationRun, ReconciliationRunBreakdown, ReconciliationRunMetrics
+)
+from services.deduction_codes import load_code_map
+
+UNKNOWN_PLAN_TYPE = "unknown"
+
+# Issue types with their own count, rate and dollar series
+TREND_ISSUE_TYPES = ("mismatch_pct", "missing_coverage", "extra_deduction", "amount_anomaly")
+TREND_METRICS = ("items", "issue_items", "issue_rate", "impact", "affected_employees") + tuple(
+    f"{issue_type}_{measure}" for issue_type in TREND_ISSUE_TYPES for measure in ("items", "rate", "amount")
+)
+
+class RunMetricsBuilder:
+    """Accumulates a run's items as they are reconciled"""
+
+    def __init__(self):
+        self.cells = defaultdict(lambda: {"items": 0, "amount": 0.0, "impact": 0.0, "employees": set()})
+        self.employees = set()
+        self.affected_employees = set()
+
+    def add(self, issue_type: str, plan_type: Optional[str], employee_ext_id: str, amount: Optional[float]) -> None:
+        amount = float(amount or 0)
+        cell = self.cells[(issue_type, plan_type or UNKNOWN_PLAN_TYPE)]
+        cell["items"] += 1
+        cell["amount"] += amount
+        cell["impact"] += abs(amount)
+        cell["employees"].add(employee_ext_id)
+        self.employees.add(employee_ext_id)
+        if issue_type != "ok":
+            self.affected_employees.add(employee_ext_id)
+
+    def write(self, db: Session, run: ReconciliationRun, period_end: date) -> ReconciliationRunMetrics:
+        """Add the rollup rows to the session; the caller commits them with the run"""
+        issues = [cell for (issue_type, _), cell in self.cells.items() if issue_type != "ok"]
+        metrics = ReconciliationRunMetrics(
+            run_id=run.id,
+            tenant_id=run.tenant_id,
+            payroll_batch_id=run.payroll_batch_id,
+            period_end=period_end,
+            items=sum(cell["items"] for cell in self.cells.values()),
+            issue_items=sum(cell["items"] for cell in issues),
+            amount=round(sum(cell["amount"] for cell in self.cells.values()), 2),
+            impact=round(sum(cell["impact"] for cell in issues), 2),
+            employees=len(self.employees),
+            affected_employees=len(self.affected_employees),
+        )
+        db.add(metrics)
+        for (issue_type, plan_type), cell in self.cells.items():
+            db.add(ReconciliationRunBreakdown(
+                run_id=run.id,
+                issue_type=issue_type,
+                plan_type=plan_type,
+                tenant_id=run.tenant_id,
+                items=cell["items"],
+                amount=round(cell["amount"], 2),
+                impact=round(cell["impact"], 2),
+                employees=len(cell["employees"]),
+            ))
+        return metrics
+
+def backfill_run_metrics(db: Session, tenant_id: Optional[str] = None) -> int:
+    """Write rollups for runs that have none; returns the number of runs filled in"""
+    query = (
+        db.query(ReconciliationRun, PayrollBatch.period_end)
+        .join(PayrollBatch, PayrollBatch.id == ReconciliationRun.payroll_batch_id)
+        .outerjoin(ReconciliationRunMetrics, ReconciliationRunMetrics.run_id == ReconciliationRun.id)
+        .filter(ReconciliationRunMetrics.run_id.is_(None))
+    )
+    if tenant_id:
+        query = query.filter(ReconciliationRun.tenant_id == tenant_id)
+
+    filled = 0
+    for run, period_end in query.order_by(ReconciliationRun.id).all():
+        builder = RunMetricsBuilder()
+        plan_type = load_code_map(db, run.tenant_id).plan_type
+        # Only the columns the rollup needs; details is never loaded
+        items = db.execute(
+            select(ReconciliationItem.issue_type, ReconciliationItem.code, ReconciliationItem.employee_ext_id, ReconciliationItem.amount)
+            .where(ReconciliationItem.run_id == run.id)
+        )
+        for issue_type, code, employee_ext_id, amount in items:
+            builder.add(issue_type, plan_type(code) if code else None, employee_ext_id, amount)
+        builder.write(db, run, period_end)
+        db.commit()
+        filled += 1
+    return filled
+
+def _moving_average(values: List[Optional[float]], window: int) -> List[Optional[float]]:
+    averages = []
+    for i in range(len(values)):
+        recent = [v for v in values[max(0, i - window + 1):i + 1] if v is not None]
+        averages.append(round(sum(recent) / len(recent), 4) if recent else None)
+    return averages
+
+def _deltas(values: List[Optional[float]]):
+    deltas, pcts = [None] * min(1, len(values)), [None] * min(1, len(values))
+    for previous, value in zip(values, values[1:]):
+        if previous is None or value is None:
+            deltas.append(None)
+            pcts.append(None)
+            continue
+        deltas.append(round(value - previous, 4))
+        pcts.append(round((value - previous) / previous, 4) if previous else None)
+    return deltas, pcts
+
+def tenant_trends(db: Session, tenant_id: str, runs: int = 52, window: int = 4, plan_type: Optional[str] = None) -> Dict:
+    """
+    Metrics for the tenant's last `runs` payrolls (the latest run of each
+    batch), oldest first, each with a trailing moving average over `window`
+    payrolls and the change from the previous payroll. With plan_type, the
+    counts and amounts cover that plan type only.
+    """
+    latest_per_batch = (
+        select(func.max(ReconciliationRunMetrics.run_id))
+        .where(ReconciliationRunMetrics.tenant_id == tenant_id)
+        .group_by(ReconciliationRunMetrics.payroll_batch_id)
+    )
+    rows = db.execute(
+        select(ReconciliationRunMetrics)
+        .where(ReconciliationRunMetrics.run_id.in_(latest_per_batch))
+        .order_by(ReconciliationRunMetrics.period_end.desc(), ReconciliationRunMetrics.run_id.desc())
+        .limit(runs)
+    ).scalars().all()[::-1]
+
+    breakdown_query = (
+        select(
+            ReconciliationRunBreakdown.run_id,
+            ReconciliationRunBreakdown.issue_type,
+            func.sum(ReconciliationRunBreakdown.items).label("items"),
+            func.sum(ReconciliationRunBreakdown.impact).label("impact"),
+        )
+        .where(ReconciliationRunBreakdown.run_id.in_([row.run_id for row in rows]))
+        .group_by(ReconciliationRunBreakdown.run_id, ReconciliationRunBreakdown.issue_type)
+    )
+    if plan_type:
+        breakdown_query = breakdown_query.where(ReconciliationRunBreakdown.plan_type == plan_type)
+    breakdown = defaultdict(dict)
+    for run_id, issue_type, items, impact in db.execute(breakdown_query):
+        breakdown[run_id][issue_type] = (int(items), float(impact))
+
+    series = {name: [] for name in TREND_METRICS}
+    for row in rows:
+        by_type = breakdown[row.run_id]
+        if plan_type:
+            items = sum(n for n, _ in by_type.values())
+            issue_items = sum(n for issue_type, (n, _) in by_type.items() if issue_type != "ok")
+            impact = sum(dollars for issue_type, (_, dollars) in by_type.items() if issue_type != "ok")
+            affected = None  # employees are counted per run, not per plan type
+        else:
+            items, issue_items, impact, affected = row.items, row.issue_items, row.impact, row.affected_employees
+        series["items"].append(items)
+        series["issue_items"].append(issue_items)
+        series["issue_rate"].append(round(issue_items / items, 4) if items else None)
+        series["impact"].append(round(impact, 2))
+        series["affected_employees"].append(affected)
+        for issue_type in TREND_ISSUE_TYPES:
+            n, dollars = by_type.get(issue_type, (0, 0.0))
+            series[f"{issue_type}_items"].append(n)
+            series[f"{issue_type}_rate"].append(round(n / items, 4) if items else None)
+            series[f"{issue_type}_amount"].append(round(dollars, 2))
+
+    metrics = {}
+    for name, values in series.items():
+        delta, delta_pct = _deltas(values)
+        metrics[name] = {
+            "values": values,
+            "moving_average": _moving_average(values, window),
+            "delta": delta,
+            "delta_pct": delta_pct,
+        }
+    return {
+        "tenant_id": tenant_id,
+        "plan_type": plan_type,
+        "window": window,
+        "points": [
+            {"run_id": row.run_id, "payroll_batch_id": row.payroll_batch_id, "period_end": row.period_end.isoformat()}
+            for row in rows
+        ],
+        "metrics": metrics,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconciliation run metric rollups")
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--tenant", help="Only this tenant (default: all tenants)")
+    args = parser.parse_args()
+
+    from db import SessionLocal
+    db = SessionLocal()
+    try:
+        print(f"Backfilled metrics for {backfill_run_metrics(db, args.tenant)} run(s)")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# app/services/run_stats.py
+"""
+Reconciliation run statistics from a single aggregate query.
+
+Item counts, amounts, dollar impact (sum of absolute amounts) and distinct
+employees are computed in the database, per issue type and per run, for any
+number of runs at once. No items are loaded, so the cost depends on neither
+the run's size nor the width of its rows (details carries employee context).
+"""
+from typing import Dict, Iterable
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from models_rich import ReconciliationItem
+
+def empty_stats() -> Dict:
+    return {"items": 0, "amount": 0.0, "impact": 0.0, "employees": 0, "issue_types": {}}
+
+def run_stats(db: Session, run_ids: Iterable[int]) -> Dict[int, Dict]:
+    """
+    Stats for each run: {"items", "amount", "impact", "employees",
+    "issue_types": {issue_type: {"items", "amount", "impact", "employees"}}}
+    """
+    run_ids = list(run_ids)
+    stats = {run_id: empty_stats() for run_id in run_ids}
+    if not run_ids:
+        return stats
+
+    item = ReconciliationItem
+    by_type = (
+        select(
+            item.run_id,
+            item.issue_type,
+            func.count().label("items"),
+            func.coalesce(func.sum(item.amount), 0.0).label("amount"),
+            func.coalesce(func.sum(func.abs(item.amount)), 0.0).label("impact"),
+            func.count(func.distinct(item.employee_ext_id)).label("employees"),
+        )
+        .where(item.run_id.in_(run_ids))
+        .group_by(item.run_id, item.issue_type)
+        .subquery()
+    )
+    # Distinct employees per run can't be summed from the per-type counts
+    by_run = (
+        select(item.run_id, func.count(func.distinct(item.employee_ext_id)).label("employees"))
+        .where(item.run_id.in_(run_ids))
+        .group_by(item.run_id)
+        .subquery()
+    )
+    rows = db.execute(
+        select(by_type, by_run.c.employees.label("run_employees"))
+        .join_from(by_type, by_run, by_type.c.run_id == by_run.c.run_id)
+    ).all()
+
+    for row in rows:
+        run = stats[row.run_id]
+        run["issue_types"][row.issue_type] = {
+            "items": row.items,
+            "amount": float(row.amount),
+            "impact": float(row.impact),
+            "employees": row.employees,
+        }
+        run["items"] += row.items
+        run["amount"] += float(row.amount)
+        run["impact"] += float(row.impact)
+        run["employees"] = row.run_employees
+    return stats
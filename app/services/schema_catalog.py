@@ -0,0 +1,216 @@
+# app/services/schema_catalog.py
+"""
+Schema catalog for the NL→SQL prompt, introspected from the database.
+
+The catalog lists the queryable tables with their columns and foreign keys
+and carries a version hash of all of it; the hash keys the NL→SQL cache, so
+cached SQL written against an older schema is never reused. It is rebuilt
+when the Alembic revision changes (checked at most every
+SCHEMA_CATALOG_CHECK_S seconds). Prompts include only the tables a question
+is about, plus the tables needed to join them.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from config import settings
+
+# Tables the LLM may query; everything else (audit, caches, settings) stays out of the prompt
+EXPOSED_TABLES = (
+    "reconciliation_run",
+    "reconciliation_item",
+    "payroll_batch",
+    "pay_item",
+    "employee",
+    "plan",
+    "enrollment",
+    "dependent",
+)
+
+# Words in a question that point at a table, beyond its own table and column names
+TABLE_KEYWORDS = {
+    "reconciliation_run": {"run", "reconciliation", "latest", "recent", "last", "approved", "status"},
+    "reconciliation_item": {"issue", "mismatch", "discrepancy", "missing", "coverage", "impact", "error", "problem", "reconciliation"},
+    "payroll_batch": {"batch", "upload", "uploaded", "period", "payroll", "file"},
+    "pay_item": {"pay", "paid", "payroll", "deduction", "code", "contribution", "paycheck", "withheld"},
+    "employee": {"employee", "staff", "worker", "who", "name", "hired", "terminated"},
+    "plan": {"plan", "carrier", "benefit", "medical", "dental", "vision", "fsa", "hsa", "401k"},
+    "enrollment": {"enrollment", "enrolled", "elected", "election", "coverage"},
+    "dependent": {"dependent", "spouse", "child", "children", "family"},
+}
+
+# Joins on business keys rather than foreign keys; used like foreign keys when joining tables up
+LOGICAL_JOINS = [
+    ("reconciliation_item", "employee_ext_id", "employee", "employee_ext_id"),
+    ("pay_item", "employee_ext_id", "reconciliation_item", "employee_ext_id"),
+]
+
+# Conventions the columns do not express
+TABLE_NOTES = {
+    "reconciliation_item": [
+        "The reconciliation_item table uses 'run_id' (not 'reconciliation_run_id')",
+        "reconciliation_item.issue_type is one of ok, mismatch_pct, missing_coverage, extra_deduction, amount_anomaly",
+        "For mismatches, look at reconciliation_item.amount or (actual_pct - expected_pct)",
+    ],
+    "pay_item": ["pay_item.code is the deduction code, e.g. MED_PRETAX, DENTAL_PRETAX"],
+    "enrollment": ["Enrollments link employees to plans via employee_id and plan_id"],
+}
+
+REQUIREMENTS = """
+        Requirements:
+        - Return ONLY the SQL query, no explanations
+        - Use proper PostgreSQL syntax
+        - Use the exact table names and column names listed above
+        - Make the query efficient and readable
+        - You can use CTEs (WITH clauses) for complex queries
+        - For "most recent" queries, use CTEs to find the latest records first
+"""
+
+def _words(question: str) -> Set[str]:
+    words = set()
+    for word in re.findall(r"[a-z0-9]+", question.lower()):
+        words.add(word)
+        if len(word) > 3 and word.endswith("ies"):
+            words.add(word[:-3] + "y")
+        elif len(word) > 3 and word.endswith("es"):
+            words.update((word[:-1], word[:-2]))
+        elif len(word) > 3 and word.endswith("s"):
+            words.add(word[:-1])
+    return words
+
+class SchemaCatalog:
+    """One introspected snapshot of the exposed tables"""
+
+    def __init__(self, tables: Dict[str, List[str]], foreign_keys: List[Tuple[str, str, str, str]], revision: Optional[str]):
+        self.tables = tables
+        self.foreign_keys = foreign_keys
+        self.revision = revision
+        self.built_at = time.time()
+        payload = json.dumps(
+            {"tables": tables, "foreign_keys": foreign_keys, "joins": LOGICAL_JOINS, "notes": TABLE_NOTES, "requirements": REQUIREMENTS},
+            sort_keys=True,
+        )
+        self.version = hashlib.sha256(payload.encode()).hexdigest()
+        self.joins = foreign_keys + [join for join in LOGICAL_JOINS if join[0] in tables and join[2] in tables]
+        self._neighbors: Dict[str, Set[str]] = {table: set() for table in tables}
+        for table, _, ref_table, _ in self.joins:
+            self._neighbors[table].add(ref_table)
+            self._neighbors[ref_table].add(table)
+
+    @classmethod
+    def introspect(cls, engine: Engine) -> "SchemaCatalog":
+        inspector = inspect(engine)
+        present = set(inspector.get_table_names())
+        tables, foreign_keys = {}, []
+        for table in EXPOSED_TABLES:
+            if table not in present:
+                continue
+            tables[table] = [column["name"] for column in inspector.get_columns(table)]
+            for fk in inspector.get_foreign_keys(table):
+                if fk["referred_table"] in EXPOSED_TABLES:
+                    for column, ref_column in zip(fk["constrained_columns"], fk["referred_columns"]):
+                        foreign_keys.append((table, column, fk["referred_table"], ref_column))
+        foreign_keys = [fk for fk in sorted(foreign_keys) if fk[2] in tables]
+        return cls(tables, foreign_keys, current_revision(engine))
+
+    def relevant_tables(self, question: str) -> List[str]:
+        """Tables the question mentions (by name, column or keyword), joined up along the shortest join paths"""
+        words = _words(question)
+        selected = set()
+        for table, columns in self.tables.items():
+            names = {table, *table.split("_"), *TABLE_KEYWORDS.get(table, ())}
+            names.update(column for column in columns if column not in ("id", "tenant_id", "created_at", "updated_at"))
+            if words & names:
+                selected.add(table)
+        if not selected:
+            return list(self.tables)
+        for table in sorted(selected):
+            for other in sorted(selected):
+                selected.update(self._join_path(table, other))
+        return [table for table in self.tables if table in selected]
+
+    def _join_path(self, start: str, goal: str) -> List[str]:
+        """Tables on the shortest join path between two tables"""
+        previous = {start: None}
+        queue = deque([start])
+        while queue:
+            table = queue.popleft()
+            if table == goal:
+                path = []
+                while table is not None:
+                    path.append(table)
+                    table = previous[table]
+                return path
+            for neighbor in sorted(self._neighbors[table]):
+                if neighbor not in previous:
+                    previous[neighbor] = table
+                    queue.append(neighbor)
+        return []
+
+    def prompt(self, question: str, tenant_id: str) -> str:
+        """Schema section of the SQL generation prompt for one question"""
+        tables = self.relevant_tables(question)
+        lines = ["", "        Available tables and their columns:"]
+        lines += [f"        - {table} ({', '.join(self.tables[table])})" for table in tables]
+        joins = [
+            f"        - {table}.{column} {'→' if (table, column, ref_table, ref_column) in self.foreign_keys else '='} {ref_table}.{ref_column}"
+            for table, column, ref_table, ref_column in self.joins
+            if table in tables and ref_table in tables
+        ]
+        if joins:
+            lines += ["", "        Key relationships:"] + joins
+        lines += ["", "        Important notes:", f"        - Always filter by tenant_id = '{tenant_id}' for tenant-specific data"]
+        for table in tables:
+            if "tenant_id" not in self.tables[table]:
+                lines.append(f"        - {table} has no tenant_id; filter it through the tables it references")
+            lines += [f"        - {note}" for note in TABLE_NOTES.get(table, ())]
+        return "\n".join(lines) + "\n" + REQUIREMENTS
+
+def current_revision(engine: Engine) -> Optional[str]:
+    """The Alembic revision the database is at (None if it is not managed by Alembic)"""
+    try:
+        with engine.connect() as c:
+            return c.execute(text("SELECT version_num FROM alembic_version")).scalar()
+    except Exception:
+        return None
+
+class CatalogCache:
+    """The current catalog, rebuilt when a migration moves the Alembic revision"""
+
+    def __init__(self, engine: Optional[Engine] = None, check_interval: float = settings.SCHEMA_CATALOG_CHECK_S):
+        self.engine = engine
+        self.check_interval = check_interval
+        self._catalog: Optional[SchemaCatalog] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def current(self) -> SchemaCatalog:
+        with self._lock:
+            now = time.time()
+            if self._catalog is None:
+                self._catalog = SchemaCatalog.introspect(self._engine())
+                self._checked_at = now
+            elif now - self._checked_at >= self.check_interval:
+                self._checked_at = now
+                if current_revision(self._engine()) != self._catalog.revision:
+                    self._catalog = SchemaCatalog.introspect(self._engine())
+            return self._catalog
+
+    def refresh(self) -> SchemaCatalog:
+        with self._lock:
+            self._catalog = SchemaCatalog.introspect(self._engine())
+            self._checked_at = time.time()
+            return self._catalog
+
+    def _engine(self) -> Engine:
+        if self.engine is None:
+            from db import engine
+            self.engine = engine
+        return self.engine
+
+schema_catalog = CatalogCache()
@@ -0,0 +1,95 @@
+# app/services/sql_cache.py
+import re
+from datetime import datetime
+from typing import Optional, Set
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from config import settings
+from models_rich import NlSqlCache
+
+# How many of a tenant's most recently used questions the similarity lookup compares against
+SIMILARITY_CANDIDATES = 500
+
+def normalize_question(question: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    question = re.sub(r"[^\w\s'-]", " ", question.lower())
+    return " ".join(question.split())
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _literals(text: str) -> Set[str]:
+    """Numbers and quoted values; near-duplicates must agree on these ("top 5" is not "top 10")"""
+    return set(re.findall(r"\d+(?:\.\d+)?|'[^']*'", text))
+
+def similarity(a: str, b: str) -> float:
+    """Trigram Jaccard similarity of two normalized questions"""
+    ta, tb = _trigrams(a), _trigrams(b)
+    return len(ta & tb) / len(ta | tb) if ta and tb else 0.0
+
+def lookup_sql(
+    db: Session,
+    tenant_id: str,
+    question: str,
+    prompt_hash: str,
+    threshold: float = settings.NL_SQL_SIMILARITY_THRESHOLD,
+) -> Optional[NlSqlCache]:
+    """
+    Cached SQL for a question: an exact match on the normalized text, or with
+    threshold > 0 the most similar recently used question above it.
+    """
+    normalized = normalize_question(question)
+    entry = db.get(NlSqlCache, (tenant_id, prompt_hash, normalized))
+    if entry is None and threshold > 0:
+        candidates = db.execute(
+            select(NlSqlCache.question)
+            .where(NlSqlCache.tenant_id == tenant_id, NlSqlCache.schema_hash == prompt_hash)
+            .order_by(NlSqlCache.last_used_at.desc())
+            .limit(SIMILARITY_CANDIDATES)
+        ).scalars().all()
+        literals = _literals(normalized)
+        best, best_score = None, threshold
+        for candidate in candidates:
+            if _literals(candidate) != literals:
+                continue
+            score = similarity(normalized, candidate)
+            if score >= best_score:
+                best, best_score = candidate, score
+        if best is not None:
+            entry = db.get(NlSqlCache, (tenant_id, prompt_hash, best))
+
+    if entry is not None:
+        entry.hits += 1
+        entry.last_used_at = datetime.utcnow()
+        db.commit()
+        db.refresh(entry)  # loaded here so callers can read it outside the threadpool
+    return entry
+
+def store_sql(db: Session, tenant_id: str, question: str, prompt_hash: str, sql: str) -> None:
+    """Remember SQL that executed successfully for a question"""
+    now = datetime.utcnow()
+    stmt = pg_insert(NlSqlCache).values(
+        tenant_id=tenant_id,
+        schema_hash=prompt_hash,
+        question=normalize_question(question),
+        sql=sql,
+        hits=0,
+        created_at=now,
+        last_used_at=now,
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["tenant_id", "schema_hash", "question"],
+        set_={"sql": stmt.excluded.sql, "last_used_at": now},
+    ))
+    db.commit()
+
+def invalidate_sql(db: Session, tenant_id: str, prompt_hash: str, question: str) -> None:
+    """Drop the entry for a normalized question whose SQL failed to execute"""
+    db.execute(delete(NlSqlCache).where(
+        NlSqlCache.tenant_id == tenant_id,
+        NlSqlCache.schema_hash == prompt_hash,
+        NlSqlCache.question == question,
+    ))
+    db.commit()
@@ -0,0 +1,24 @@
+# app/tests/conftest.py
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Modules import each other as top-level packages (services, models_rich), as in the API
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models_rich import Base  # noqa: E402
+
+@pytest.fixture
+def db():
+    """A session on an empty in-memory SQLite database with every table"""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine, autoflush=False)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
@@ -0,0 +1,65 @@
+# app/tests/test_anomalies.py
+import numpy as np
+
+from services.anomalies import MIN_SCALE_ABS, group_medians, robust_z_scores
+
+def arrays(groups, values):
+    return np.array(groups, dtype=np.int64), np.array(values, dtype=np.float64)
+
+def test_group_medians_odd_and_even_groups():
+    groups, values = arrays([0, 0, 0, 1, 1, 1, 1], [3, 1, 2, 10, 40, 20, 30])
+    medians, counts = group_medians(groups, values, 2)
+    assert medians.tolist() == [2.0, 25.0]
+    assert counts.tolist() == [3, 4]
+
+def test_group_medians_ignore_input_order():
+    groups, values = arrays([1, 0, 1, 0, 1], [5, 9, 1, 7, 3])
+    medians, _ = group_medians(groups, values, 2)
+    assert medians.tolist() == [8.0, 3.0]
+
+def test_group_medians_empty_groups_are_nan():
+    groups, values = arrays([2, 2], [4, 6])
+    medians, counts = group_medians(groups, values, 4)
+    assert np.isnan(medians[[0, 1, 3]]).all()
+    assert medians[2] == 5.0
+    assert counts.tolist() == [0, 0, 2, 0]
+
+def test_group_medians_with_no_values():
+    groups, values = arrays([], [])
+    medians, counts = group_medians(groups, values, 3)
+    assert np.isnan(medians).all()
+    assert counts.tolist() == [0, 0, 0]
+
+def test_robust_z_scores_without_history_are_nan():
+    history_groups, history_amounts = arrays([], [])
+    groups, amounts = arrays([0, 1], [100, 250])
+    z, medians, mads, counts = robust_z_scores(history_groups, history_amounts, groups, amounts, 2)
+    assert np.isnan(z).all() and np.isnan(medians).all() and np.isnan(mads).all()
+    assert counts.tolist() == [0, 0]
+
+def test_robust_z_scores_equal_history_uses_the_scale_floor():
+    # Every past amount identical: the MAD is 0, so the floor keeps z finite
+    history_groups, history_amounts = arrays([0] * 6, [100.0] * 6)
+    groups, amounts = arrays([0, 0, 0], [100, 104, 200])
+    z, medians, mads, counts = robust_z_scores(history_groups, history_amounts, groups, amounts, 1, min_scale_pct=0.05)
+    assert medians.tolist() == [100.0] * 3 and mads.tolist() == [0.0] * 3 and counts.tolist() == [6] * 3
+    assert np.isfinite(z).all()
+    assert z[0] == 0
+    assert abs(z[1]) < 3.5  # a small change is not an outlier
+    assert z[2] > 3.5
+    np.testing.assert_allclose(z[2], 100 / 5)  # (amount - median) / (5% of the median)
+
+def test_robust_z_scores_floor_for_near_zero_medians():
+    history_groups, history_amounts = arrays([0] * 4, [0.0] * 4)
+    groups, amounts = arrays([0], [0.5])
+    z, *_ = robust_z_scores(history_groups, history_amounts, groups, amounts, 1)
+    np.testing.assert_allclose(z[0], 0.5 / MIN_SCALE_ABS)
+
+def test_robust_z_scores_per_group():
+    history_groups, history_amounts = arrays([0, 0, 0, 0, 0, 1, 1, 1], [90, 95, 100, 105, 110, 10, 10, 10])
+    groups, amounts = arrays([0, 1, 0], [100, 10, 160])
+    z, medians, mads, counts = robust_z_scores(history_groups, history_amounts, groups, amounts, 2, min_scale_pct=0.0)
+    assert medians.tolist() == [100.0, 10.0, 100.0]
+    assert mads.tolist() == [5.0, 0.0, 5.0]
+    assert counts.tolist() == [5, 3, 5]
+    np.testing.assert_allclose(z, [0.0, 0.0, 0.6745 * 60 / 5])
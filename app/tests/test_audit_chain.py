@@ -0,0 +1,144 @@
+# app/tests/test_audit_chain.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from config import settings
+from models_rich import AuditChainHead, AuditCheckpoint, AuditLog
+from services import audit_chain
+from services.audit_chain import GENESIS_HASH, HASHED_FIELDS, create_checkpoint, entry_hash, verify_chain
+
+TENANT = "tenant-a"
+
+def write_chain(db, count, tenant_id=TENANT, start_id=1):
+    """Chained audit entries, as the audit writer stores them"""
+    prev_hash = GENESIS_HASH
+    start = datetime(2026, 1, 1)
+    for i in range(count):
+        entry = {
+            "id": start_id + i,
+            "tenant_id": tenant_id,
+            "actor": "demo-user",
+            "action": "update",
+            "entity": "employee",
+            "entity_id": 100 + i,
+            "before": None,
+            "after": None,
+            "diff": f'[{{"op": "replace", "path": "/pct", "value": {i}}}]',
+            "at": start + timedelta(minutes=i),
+        }
+        entry["prev_hash"] = prev_hash
+        entry["hash"] = prev_hash = entry_hash(prev_hash, entry)
+        db.add(AuditLog(**entry))
+    db.merge(AuditChainHead(tenant_id=tenant_id, audit_id=start_id + count - 1, hash=prev_hash))
+    db.commit()
+
+@pytest.fixture(autouse=True)
+def no_archive(monkeypatch):
+    monkeypatch.setattr(audit_chain, "archive_boundary", lambda: None)
+
+@pytest.fixture
+def checkpoint_key(monkeypatch):
+    monkeypatch.setattr(settings, "AUDIT_CHECKPOINT_KEY", "test-checkpoint-key")
+
+def test_entry_hash_covers_every_hashed_field():
+    entry = {field: None for field in HASHED_FIELDS}
+    entry.update(id=1, tenant_id=TENANT, at=datetime(2026, 1, 1))
+    digest = entry_hash(GENESIS_HASH, entry)
+    assert entry_hash(GENESIS_HASH, dict(entry)) == digest
+    assert entry_hash("1" * 64, entry) != digest
+    for field in HASHED_FIELDS:
+        changed = dict(entry, **{field: "changed"})
+        assert entry_hash(GENESIS_HASH, changed) != digest, field
+
+def test_intact_chain_verifies(db):
+    write_chain(db, 5)
+    result = verify_chain(db, TENANT)
+    assert result["ok"], result["error"]
+    assert result["verified"] == 5
+    assert result["last_id"] == 5
+    assert result["anchored"] and result["unverified_prefix"] is None
+
+def test_tenant_without_chain_verifies_empty(db):
+    result = verify_chain(db, "nobody")
+    assert result["ok"] and result["verified"] == 0
+
+def test_edited_entry_is_detected(db):
+    write_chain(db, 5)
+    db.get(AuditLog, 3).actor = "someone-else"
+    db.commit()
+    result = verify_chain(db, TENANT)
+    assert not result["ok"]
+    assert result["error"] == "Entry 3 does not match its hash"
+    assert result["last_id"] == 2
+
+def test_rehashed_entry_breaks_the_next_link(db):
+    write_chain(db, 5)
+    row = db.get(AuditLog, 3)
+    row.actor = "someone-else"
+    row.hash = entry_hash(row.prev_hash, {field: getattr(row, field) for field in HASHED_FIELDS})
+    db.commit()
+    result = verify_chain(db, TENANT)
+    assert not result["ok"]
+    assert result["error"] == "Entry 4 does not link to the previous entry"
+
+def test_deleted_entry_is_detected(db):
+    write_chain(db, 5)
+    db.delete(db.get(AuditLog, 3))
+    db.commit()
+    result = verify_chain(db, TENANT)
+    assert not result["ok"]
+    assert result["error"] == "Entry 4 does not link to the previous entry"
+
+def test_truncated_chain_is_detected(db):
+    write_chain(db, 5)
+    db.delete(db.get(AuditLog, 5))
+    db.commit()
+    result = verify_chain(db, TENANT)
+    assert not result["ok"]
+    assert "entries were removed" in result["error"]
+
+def test_tenants_are_chained_separately(db):
+    write_chain(db, 3)
+    write_chain(db, 3, tenant_id="tenant-b", start_id=4)
+    db.get(AuditLog, 5).action = "delete"
+    db.commit()
+    assert verify_chain(db, TENANT)["ok"]
+    assert not verify_chain(db, "tenant-b")["ok"]
+
+def test_archived_start_is_reported_unanchored(db, monkeypatch):
+    write_chain(db, 5)
+    for entry_id in (1, 2):
+        db.delete(db.get(AuditLog, entry_id))
+    db.commit()
+    monkeypatch.setattr(audit_chain, "archive_boundary", lambda: datetime(2026, 1, 1, 0, 2))
+    result = verify_chain(db, TENANT)
+    assert result["ok"], result["error"]
+    assert result["verified"] == 3
+    assert not result["anchored"]
+    assert result["unverified_prefix"] == 3
+
+def test_checkpoint_limits_verification_to_new_entries(db, checkpoint_key):
+    write_chain(db, 3)
+    created = create_checkpoint(db, TENANT)
+    assert created["ok"] and created["checkpoint_id"] is not None
+    result = verify_chain(db, TENANT)
+    assert result["ok"] and result["verified"] == 0
+    assert result["anchored"]
+
+def test_checkpoint_with_bad_signature_is_rejected(db, checkpoint_key):
+    write_chain(db, 3)
+    create_checkpoint(db, TENANT)
+    checkpoint = db.query(AuditCheckpoint).one()
+    checkpoint.signature = "0" * 64
+    db.commit()
+    result = verify_chain(db, TENANT)
+    assert not result["ok"]
+    assert "invalid signature" in result["error"]
+
+def test_checkpoints_are_ignored_without_a_key(db, checkpoint_key, monkeypatch):
+    write_chain(db, 3)
+    create_checkpoint(db, TENANT)
+    monkeypatch.setattr(settings, "AUDIT_CHECKPOINT_KEY", "")
+    result = verify_chain(db, TENANT)
+    assert result["ok"] and result["checkpoint_id"] is None and result["verified"] == 3
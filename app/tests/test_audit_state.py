@@ -0,0 +1,47 @@
+# app/tests/test_audit_state.py
+import pytest
+
+from services.audit_state import apply_patch, json_diff
+
+@pytest.mark.parametrize("before, after", [
+    ({}, {}),
+    ({}, {"name": "Ada", "pct": 5.0}),
+    ({"name": "Ada", "pct": 5.0}, {}),
+    ({"name": "Ada", "pct": 5.0}, {"name": "Ada", "pct": 6.5}),
+    ({"name": "Ada", "email": None}, {"name": "Ada", "email": "ada@example.com"}),
+    ({"settings": {"rules": {"pct_tolerance": 0.001}}}, {"settings": {"rules": {"pct_tolerance": 0.01, "checks": []}}}),
+    ({"tags": ["a", "b"]}, {"tags": ["a", "b", "c"]}),
+    ({"a/b": 1, "c~d": 2}, {"a/b": 3, "e~/f": 4}),
+    ({"value": {"nested": 1}}, {"value": [1, 2]}),
+    ({"value": 1}, None),
+])
+def test_apply_patch_replays_json_diff(before, after):
+    assert apply_patch(before, json_diff(before, after)) == after
+
+def test_json_diff_is_empty_for_equal_documents():
+    doc = {"id": 7, "settings": {"checks": [{"issue_type": "x"}]}}
+    assert json_diff(doc, dict(doc)) == []
+
+def test_json_diff_touches_only_changed_keys():
+    ops = json_diff({"a": 1, "b": {"c": 2, "d": 3}, "e": 4}, {"a": 1, "b": {"c": 2, "d": 5}, "f": 6})
+    assert sorted(ops, key=lambda op: op["path"]) == [
+        {"op": "replace", "path": "/b/d", "value": 5},
+        {"op": "remove", "path": "/e"},
+        {"op": "add", "path": "/f", "value": 6},
+    ]
+
+def test_json_diff_escapes_pointer_tokens():
+    assert json_diff({}, {"a/b~c": 1}) == [{"op": "add", "path": "/a~1b~0c", "value": 1}]
+
+def test_apply_patch_does_not_mutate_the_document():
+    before = {"a": {"b": 1}}
+    apply_patch(before, json_diff(before, {"a": {"b": 2}}))
+    assert before == {"a": {"b": 1}}
+
+def test_versions_rebuild_from_successive_diffs():
+    versions = [{}, {"pct": 5.0}, {"pct": 5.0, "plan": "MED"}, {"plan": "DEN"}]
+    diffs = [json_diff(a, b) for a, b in zip(versions, versions[1:])]
+    doc = versions[0]
+    for diff, expected in zip(diffs, versions[1:]):
+        doc = apply_patch(doc, diff)
+        assert doc == expected
@@ -0,0 +1,45 @@
+# app/tests/test_employee_match.py
+import pytest
+
+from services.employee_match import id_number, normalize_id, one_edit_apart
+
+@pytest.mark.parametrize("a, b", [
+    ("E1234", "E1235"),   # substitution
+    ("E1234", "E124"),    # deletion
+    ("E124", "E1234"),    # insertion
+    ("E1234", "E1243"),   # adjacent swap at the end
+    ("E1234", "1E234"),   # adjacent swap at the start
+    ("E1234", "E1234X"),  # insertion at the end
+    ("A", ""),
+])
+def test_one_edit_apart(a, b):
+    assert one_edit_apart(a, b)
+    assert one_edit_apart(b, a)
+
+@pytest.mark.parametrize("a, b", [
+    ("E1234", "E1234"),   # identical
+    ("E1234", "E1256"),   # two substitutions
+    ("E1234", "E12"),     # two deletions
+    ("E1234", "E4231"),   # a swap that is not adjacent
+    ("E1234", "E2143"),   # two swaps
+    ("E1234", "X1234Y"),  # two insertions
+    ("", ""),
+])
+def test_not_one_edit_apart(a, b):
+    assert not one_edit_apart(a, b)
+    assert not one_edit_apart(b, a)
+
+@pytest.mark.parametrize("employee_ext_id, expected", [
+    ("E001234", "1234"),
+    ("emp-1234", "1234"),
+    ("12-34", "1234"),
+    ("E000", "0"),
+    ("E0", "0"),
+    ("EMP", None),
+    ("", None),
+])
+def test_id_number(employee_ext_id, expected):
+    assert id_number(employee_ext_id) == expected
+
+def test_normalize_id_drops_case_and_punctuation():
+    assert normalize_id(" emp-00_12 ") == "EMP0012"
@@ -0,0 +1,63 @@
+# app/tests/test_mcp_cache_keys.py
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+# Loaded from its file like the in-process MCP client does; mcp_server is not a package
+SERVER_PATH = Path(__file__).resolve().parents[2] / "mcp_server" / "server.py"
+spec = importlib.util.spec_from_file_location("mcp_server_tools", SERVER_PATH)
+server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(server)
+
+TENANT = "tenant-a"
+
+@pytest.mark.parametrize("a, b", [
+    ("SELECT * FROM employee", "select *\n  from   employee;"),
+    ("SELECT id FROM employee -- newest first\nORDER BY id", "select id from employee order by id"),
+    ("SELECT /* ids */ id FROM employee", "select id from employee"),
+    ("SELECT id FROM employee;  ", "SELECT id FROM employee"),
+])
+def test_normalize_sql_ignores_case_comments_and_whitespace(a, b):
+    assert server.normalize_sql(a) == server.normalize_sql(b)
+
+@pytest.mark.parametrize("a, b", [
+    ("SELECT * FROM employee WHERE last_name = 'Smith'", "SELECT * FROM employee WHERE last_name = 'SMITH'"),
+    ("SELECT * FROM employee WHERE last_name = 'a  b'", "SELECT * FROM employee WHERE last_name = 'a b'"),
+    ('SELECT "Id" FROM employee', 'SELECT "id" FROM employee'),
+    ("SELECT '--x' FROM employee", "SELECT '' FROM employee"),
+])
+def test_normalize_sql_keeps_literals_and_quoted_identifiers(a, b):
+    assert server.normalize_sql(a) != server.normalize_sql(b)
+
+@pytest.mark.parametrize("sql", [
+    f"SELECT * FROM employee WHERE tenant_id = '{TENANT}'",
+    f"select count(*) from pay_item where tenant_id='{TENANT}' and code = 'MED_PRETAX'",
+    f"SELECT e.id FROM employee e JOIN enrollment n ON n.employee_id = e.id AND n.tenant_id = e.tenant_id WHERE e.tenant_id = '{TENANT}'",
+    f"WITH recent AS (SELECT * FROM reconciliation_run WHERE tenant_id = '{TENANT}') SELECT * FROM recent",
+    "SELECT * FROM employee",  # the guard adds the tenant filter
+])
+def test_tenant_filtered_queries_on_versioned_tables_are_cacheable(sql):
+    assert server._cacheable_sql(sql, TENANT)
+
+@pytest.mark.parametrize("sql, reason", [
+    ("SELECT * FROM employee WHERE tenant_id = 'tenant-b'", "another tenant"),
+    (f"SELECT * FROM employee WHERE tenant_id = '{TENANT}' OR tenant_id = 'tenant-b'", "a second tenant"),
+    (f"SELECT * FROM employee WHERE tenant_id IN ('{TENANT}', 'tenant-b')", "tenant_id outside an equality"),
+    (f"SELECT * FROM audit_log WHERE tenant_id = '{TENANT}'", "unversioned table"),
+    (f"SELECT * FROM employee e JOIN audit_log a ON a.entity_id = e.id WHERE e.tenant_id = '{TENANT}'", "joins an unversioned table"),
+    (f"SELECT * FROM employee, pay_item WHERE employee.tenant_id = '{TENANT}'", "comma join"),
+    (f"SELECT * FROM public.employee WHERE tenant_id = '{TENANT}'", "schema-qualified"),
+    (f"SELECT * FROM unknown_table WHERE tenant_id = '{TENANT}'", "unknown table"),
+    (f"SELECT * FROM generate_series(1, 3) WHERE tenant_id = '{TENANT}'", "function call"),
+    (f"SELECT * FROM (SELECT * FROM employee) s WHERE tenant_id = '{TENANT}'", "subquery"),
+    (f"DELETE FROM employee WHERE tenant_id = '{TENANT}'", "not a SELECT"),
+])
+def test_other_queries_are_not_cacheable(sql, reason):
+    assert not server._cacheable_sql(sql, TENANT), reason
+
+def test_no_tenant_is_never_cacheable():
+    assert not server._cacheable_sql("SELECT * FROM employee WHERE tenant_id = ''", "")
+
+def test_versioned_and_unversioned_tables_do_not_overlap():
+    assert not server.VERSIONED_TABLES & server.UNVERSIONED_TABLES
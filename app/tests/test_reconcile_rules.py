@@ -0,0 +1,121 @@
+# app/tests/test_reconcile_rules.py
+import pytest
+
+from services.reconcile_rules import CompiledRules, RuleCache, effective_rules
+
+def compiled(**custom):
+    return CompiledRules(effective_rules(custom))
+
+def item(**fields):
+    base = {
+        "amount": 100.0,
+        "actual_pct": 5.0,
+        "expected_pct": 5.0,
+        "pct_diff": 0.0,
+        "code": "MED_PRETAX",
+        "plan_type": "medical",
+        "employee_ext_id": "E001",
+    }
+    return dict(base, **fields)
+
+@pytest.mark.parametrize("custom, message", [
+    ({"checks": [{"issue_type": "x", "when": [{"field": "salary", "op": ">", "value": 1}]}]}, "Unknown field 'salary'"),
+    ({"checks": [{"issue_type": "x", "when": [{"field": "amount", "op": "~", "value": 1}]}]}, "Unknown operator '~'"),
+    ({"checks": [{"issue_type": "x", "when": [{"field": "code", "op": ">", "value": 1}]}]}, "needs a numeric field and value"),
+    ({"checks": [{"issue_type": "x", "when": [{"field": "amount", "op": ">", "value": "1"}]}]}, "needs a numeric field and value"),
+    ({"checks": [{"issue_type": "x", "when": [{"field": "amount", "op": ">", "value": True}]}]}, "needs a numeric field and value"),
+    ({"checks": [{"issue_type": "x", "when": [{"field": "code", "op": "in", "value": "MED"}]}]}, "needs a list value"),
+    ({"checks": [{"issue_type": "x", "when": [{"field": "code", "op": "matches", "value": "("}]}]}, "Invalid reconciliation rules"),
+    ({"checks": [{"issue_type": "x", "when": []}]}, "Check needs issue_type and when"),
+    ({"checks": [{"when": [{"field": "amount", "op": ">", "value": 1}]}]}, "Check needs issue_type and when"),
+    ({"plan_types": [{"plan_type": "medical"}]}, "Plan type rule needs plan_type"),
+    ({"plan_types": [{"prefix": "MED", "contains": "MED", "plan_type": "medical"}]}, "Plan type rule needs plan_type"),
+    ({"plan_types": [{"regex": "[", "plan_type": "medical"}]}, "Invalid reconciliation rules"),
+    ({"pct_tolerance": "tight"}, "could not convert"),
+    ({"checks": "amount > 1"}, "Invalid reconciliation rules"),
+])
+def test_invalid_rules_fail_to_compile(custom, message):
+    with pytest.raises(ValueError, match=message):
+        compiled(**custom)
+
+def test_default_plan_types_match_in_order():
+    rules = compiled()
+    assert rules.plan_type("MED_PRETAX") == "medical"
+    assert rules.plan_type("DENTAL_PRETAX") == "dental"
+    # MEDFLEX_FSA contains both MED and FSA; the first listed pattern wins
+    assert rules.plan_type("MEDFLEX_FSA") == "medical"
+    assert rules.plan_type("PARKING") is None
+
+def test_custom_plan_types_replace_the_defaults():
+    rules = compiled(plan_types=[
+        {"exact": "MEDFLEX_FSA", "plan_type": "fsa"},
+        {"prefix": "MED", "plan_type": "medical"},
+        {"regex": r"^DEN(TAL)?_", "plan_type": "dental"},
+    ])
+    assert rules.plan_type("MEDFLEX_FSA") == "fsa"
+    assert rules.plan_type("MED_PRETAX") == "medical"
+    assert rules.plan_type("DEN_POSTTAX") == "dental"
+    assert rules.plan_type("VISION") is None
+
+def test_pct_tolerance():
+    rules = compiled(pct_tolerance=0.5)
+    assert rules.pct_matches(5.0, 5.4)
+    assert not rules.pct_matches(5.0, 5.5)
+
+def test_first_failing_check_wins():
+    rules = compiled(checks=[
+        {"issue_type": "over_limit", "when": [{"field": "amount", "op": ">", "value": 1000}], "details": "Over 1000"},
+        {"issue_type": "large", "when": [{"field": "amount", "op": ">", "value": 500}]},
+    ])
+    assert rules.check("ok", item(amount=2000)) == ("over_limit", "Over 1000")
+    assert rules.check("ok", item(amount=700)) == ("large", None)
+    assert rules.check("ok", item(amount=100)) is None
+
+def test_checks_apply_to_ok_items_by_default():
+    rules = compiled(checks=[{"issue_type": "large", "when": [{"field": "amount", "op": ">", "value": 500}]}])
+    assert rules.check("ok", item(amount=700)) == ("large", None)
+    assert rules.check("mismatch_pct", item(amount=700)) is None
+
+def test_checks_filter_by_issue_and_plan_type():
+    rules = compiled(checks=[
+        {
+            "issue_type": "dental_mismatch",
+            "when": [{"field": "pct_diff", "op": ">=", "value": 1}],
+            "applies_to": ["mismatch_pct"],
+            "plan_types": ["dental"],
+        },
+        {"issue_type": "any_mismatch", "when": [{"field": "pct_diff", "op": ">=", "value": 1}], "applies_to": ["mismatch_pct"]},
+    ])
+    assert rules.check("mismatch_pct", item(plan_type="dental", pct_diff=2.0)) == ("dental_mismatch", None)
+    assert rules.check("mismatch_pct", item(plan_type="medical", pct_diff=2.0)) == ("any_mismatch", None)
+    assert rules.check("ok", item(plan_type="dental", pct_diff=2.0)) is None
+
+def test_all_conditions_must_hold():
+    rules = compiled(checks=[{
+        "issue_type": "suspicious",
+        "when": [
+            {"field": "code", "op": "in", "value": ["MED_PRETAX", "MED_POSTTAX"]},
+            {"field": "employee_ext_id", "op": "matches", "value": "^TEMP"},
+            {"field": "amount", "op": "<=", "value": 10},
+        ],
+    }])
+    assert rules.check("ok", item(employee_ext_id="TEMP-1", amount=5)) == ("suspicious", None)
+    assert rules.check("ok", item(employee_ext_id="E001", amount=5)) is None
+    assert rules.check("ok", item(employee_ext_id="TEMP-1", amount=50)) is None
+
+def test_missing_values_never_satisfy_comparisons():
+    rules = compiled(checks=[
+        {"issue_type": "low_expected", "when": [{"field": "expected_pct", "op": "<", "value": 1}], "applies_to": ["missing_coverage"]},
+        {"issue_type": "no_expected", "when": [{"field": "expected_pct", "op": "==", "value": None}], "applies_to": ["missing_coverage"]},
+    ])
+    assert rules.check("missing_coverage", item(expected_pct=None, pct_diff=None)) == ("no_expected", None)
+
+def test_rule_sets_are_compiled_once_per_version():
+    cache = RuleCache(max_entries=2)
+    custom = {"pct_tolerance": 0.01}
+    first = cache.compiled(custom)
+    assert cache.compiled(dict(custom)) is first
+    assert cache.compiled(None) is not first
+    assert cache.compiled(None).version == compiled().version
+    cache.compiled({"pct_tolerance": 0.02})
+    assert cache.compiled(custom) is not first  # evicted as least recently used
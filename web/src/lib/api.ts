@@ -33,6 +33,7 @@ export interface ReconciliationRun {
     mismatch_pct?: number;
     missing_coverage?: number;
     extra_deduction?: number;
+    amount_anomaly?: number;
   };
 }
 
@@ -63,6 +64,10 @@ export interface ReconciliationInsights {
   suggested_fixes: string[];
   priority_actions: string[];
   risk_assessment: string;
+  risk_level: string | null;
+  details: Record<string, unknown>;
+  llm_enriched: boolean;
+  enrichment: { status: string; error?: string | null };
   created_at: string;
 }
 
@@ -81,6 +86,7 @@ export interface AuditLog {
   entity_id: number;
   before: string | null;
   after: string | null;
+  diff?: string | null;
   at: string;
 }
 
@@ -173,6 +179,7 @@ export const apiClient = {
   },
 
   getReconciliationInsights: async (runId: number): Promise<ReconciliationInsights> => {
+    // Rules-based insights come back right away; enrichment reports the LLM rewrite
     const response = await api.get(`/api/tenants/demo-tenant-1/reconcile/${runId}/insights`);
     return response.data;
   },
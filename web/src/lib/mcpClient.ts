@@ -23,6 +23,7 @@ export interface MCPReconciliationSummary {
     mismatch_pct?: number;
     missing_coverage?: number;
     extra_deduction?: number;
+    amount_anomaly?: number;
   };
 }
 
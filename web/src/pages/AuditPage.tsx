@@ -356,6 +356,15 @@ export default function AuditPage({ isDemoMode = false }: AuditPageProps) {
                     </pre>
                   </div>
                 )}
+                
+                {selectedLog.diff && (
+                  <div>
+                    <h4 className="font-medium text-gray-900 mb-2">Changes:</h4>
+                    <pre className="bg-gray-50 p-3 rounded text-sm overflow-x-auto">
+                      {JSON.stringify(JSON.parse(selectedLog.diff), null, 2)}
+                    </pre>
+                  </div>
+                )}
               </div>
             </div>
           </div>
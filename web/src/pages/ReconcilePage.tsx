@@ -254,6 +254,7 @@ export default function ReconcilePage({ isDemoMode = false }: ReconcilePageProps
                 <option value="mismatch_pct">Mismatch %</option>
                 <option value="missing_coverage">Missing Coverage</option>
                 <option value="extra_deduction">Extra Deduction</option>
+                <option value="amount_anomaly">Amount Anomaly</option>
               </select>
             </div>
             <div className="flex-1">